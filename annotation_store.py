@@ -0,0 +1,279 @@
+import json
+import os
+import shutil
+
+import numpy as np
+
+from coco_annotations import CocoAnnotations
+
+STORE_VERSION = 1
+
+
+def store_path_of(json_path):
+    """
+    :returns the path of the annotation store written next to a COCO JSON file, e.g. train/train.store for
+    train/train.json
+    """
+
+    return (json_path[:-5] if json_path.endswith('.json') else json_path) + '.store'
+
+
+class AnnotationStore:
+    """
+    Binary companion of a COCO JSON file, which is opened with memory mapping instead of being parsed
+
+    The store is a folder holding a .npy file per numeric field of the images and annotations, and a byte blob plus an
+    offsets array per string field, e.g. 'file_name'. The annotations are stored grouped by image, with an offsets
+    index giving the rows of each image's annotations, so looking up the boxes of an image reads only those rows.
+    meta.json holds the info, licenses and categories, and the fields in their original order, so the store converts
+    back to the same COCO JSON file.
+
+    Opening a store reads only meta.json and the .npy headers. The arrays are read by the OS as they are accessed.
+
+    Usage:
+        AnnotationStore.write(CocoAnnotations.load('train.json'), 'train.store')
+        store = AnnotationStore('train.store')
+        boxes = store.boxes(image_id)
+    """
+
+    def __init__(self, folder):
+        """
+        :parameter folder: the folder of the store, as written by write
+        :raises Exception if the folder is not an annotation store of a supported version
+        """
+
+        self.folder = folder
+
+        meta_path = os.path.join(folder, 'meta.json')
+        if not os.path.isfile(meta_path):
+            raise Exception('No annotation store in ' + folder)
+
+        with open(meta_path) as meta_file:
+            meta = json.load(meta_file)
+
+        if meta['version'] != STORE_VERSION:
+            raise Exception('Unsupported annotation store version ' + str(meta['version']) + ' in ' + folder)
+
+        self.info = meta['info']
+        self.licenses = meta['licenses']
+        self.categories = meta['categories']
+
+        self.images = {field_name: self.__open_column('images', field_name, field_type)
+                       for (field_name, field_type) in meta['image_fields']}
+        self.annotations = {field_name: self.__open_column('annotations', field_name, field_type)
+                            for (field_name, field_type) in meta['annotation_fields']}
+
+        # image_annotation_offsets[i]:image_annotation_offsets[i + 1] are the annotation rows of image row i
+        self.__image_annotation_offsets = self.__load_array('image_annotation_offsets')
+        # rows of the images sorted by id, for binary search of image ids
+        self.__image_id_order = self.__load_array('image_id_order')
+        # position of each annotation row in the original annotation list
+        self.__annotation_order = self.__load_array('annotation_order')
+
+    @property
+    def image_count(self):
+        return len(self.images['id'])
+
+    @property
+    def annotation_count(self):
+        return len(self.annotations['id'])
+
+    @staticmethod
+    def write(coco_annotations, folder):
+        """
+        Writes a dataset as an annotation store, replacing the folder atomically
+
+        :parameter coco_annotations: the CocoAnnotations to store
+        :parameter folder: the folder of the store
+        :raises Exception if a field is neither numeric nor a string field
+        """
+
+        temporary_folder = folder + '.tmp'
+        if os.path.isdir(temporary_folder):
+            shutil.rmtree(temporary_folder)
+        os.makedirs(temporary_folder)
+
+        images = coco_annotations.images
+        annotations = coco_annotations.annotations
+
+        # group the annotations by the row of their image, keeping their order within an image
+        image_id_order = np.argsort(images['id'], kind='stable')
+        annotation_image_rows = image_id_order[np.searchsorted(images['id'], annotations['image_id'],
+                                                               sorter=image_id_order)]
+        annotation_order = np.argsort(annotation_image_rows, kind='stable')
+        annotation_counts = np.bincount(annotation_image_rows, minlength=len(images['id']))
+        image_annotation_offsets = np.concatenate(([0], np.cumsum(annotation_counts))).astype(np.int64)
+
+        meta = {
+            'version': STORE_VERSION,
+            'info': coco_annotations.info,
+            'licenses': coco_annotations.licenses,
+            'categories': coco_annotations.categories,
+            'image_fields': [[field_name, _write_column(temporary_folder, 'images', field_name, column)]
+                             for (field_name, column) in images.items()],
+            'annotation_fields': [[field_name, _write_column(temporary_folder, 'annotations', field_name,
+                                                             column[annotation_order])]
+                                  for (field_name, column) in annotations.items()],
+        }
+
+        np.save(os.path.join(temporary_folder, 'image_annotation_offsets.npy'), image_annotation_offsets)
+        np.save(os.path.join(temporary_folder, 'image_id_order.npy'), image_id_order.astype(np.int64))
+        np.save(os.path.join(temporary_folder, 'annotation_order.npy'), annotation_order.astype(np.int64))
+
+        with open(os.path.join(temporary_folder, 'meta.json'), 'w') as meta_file:
+            json.dump(meta, meta_file)
+
+        if os.path.isdir(folder):
+            shutil.rmtree(folder)
+        os.replace(temporary_folder, folder)
+
+    def image_row(self, image_id):
+        """
+        :returns the row of an image id, or None if there is no image with the id
+        """
+
+        image_ids = self.images['id']
+        position = np.searchsorted(image_ids, image_id, sorter=self.__image_id_order)
+        if position == len(image_ids):
+            return None
+
+        row = int(self.__image_id_order[position])
+        return row if image_ids[row] == image_id else None
+
+    def image(self, image_id):
+        """
+        :returns the COCO image dict of an image id
+        :raises KeyError if there is no image with the id
+        """
+
+        return self.__record(self.images, self.__existing_image_row(image_id))
+
+    def annotations_of_image(self, image_id):
+        """
+        :returns list of the COCO annotation dicts of an image id
+        :raises KeyError if there is no image with the id
+        """
+
+        row = self.__existing_image_row(image_id)
+        return [self.__record(self.annotations, annotation_row)
+                for annotation_row in range(self.__image_annotation_offsets[row],
+                                            self.__image_annotation_offsets[row + 1])]
+
+    def boxes(self, image_id):
+        """
+        :returns (n, 4) array of the [x, y, width, height] boxes of an image id, which is a view of the mapped file
+        :raises KeyError if there is no image with the id
+        """
+
+        row = self.__existing_image_row(image_id)
+        return self.annotations['bbox'][self.__image_annotation_offsets[row]:self.__image_annotation_offsets[row + 1]]
+
+    def to_coco_annotations(self):
+        """
+        Reads the whole store into memory, with the annotations in their original order
+
+        :returns CocoAnnotations
+        """
+
+        original_rows = np.argsort(self.__annotation_order, kind='stable')
+
+        images = {field_name: np.array(column[:]) for (field_name, column) in self.images.items()}
+        annotations = {field_name: np.array(column[original_rows]) for (field_name, column) in self.annotations.items()}
+
+        return CocoAnnotations(self.info, self.licenses, self.categories, images, annotations)
+
+    def write_coco(self, json_path):
+        """
+        Converts the store back to a COCO JSON file
+        """
+
+        self.to_coco_annotations().write(json_path)
+
+    def __existing_image_row(self, image_id):
+        row = self.image_row(image_id)
+        if row is None:
+            raise KeyError(image_id)
+
+        return row
+
+    def __record(self, columns, row):
+        return {field_name: _python_value(column[row]) for (field_name, column) in columns.items()}
+
+    def __load_array(self, name):
+        return np.load(os.path.join(self.folder, name + '.npy'), mmap_mode='r')
+
+    def __open_column(self, table, field_name, field_type):
+        if field_type == 'string':
+            return StringColumn(os.path.join(self.folder, table + '.' + field_name))
+
+        return self.__load_array(table + '.' + field_name)
+
+
+class StringColumn:
+    """
+    Read only column of strings, stored as a blob of UTF-8 bytes and an array of the offsets of the strings in it
+    """
+
+    def __init__(self, path):
+        """
+        :parameter path: the path of the column, without the .bin and .offsets.npy extensions
+        """
+
+        self.__offsets = np.load(path + '.offsets.npy', mmap_mode='r')
+        # np.memmap cannot map empty files
+        if self.__offsets[-1] > 0:
+            self.__blob = np.memmap(path + '.bin', dtype=np.uint8, mode='r')
+        else:
+            self.__blob = np.zeros(0, dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.__offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            return self.__blob[self.__offsets[index]:self.__offsets[index + 1]].tobytes().decode('utf-8')
+
+        rows = np.arange(len(self))[index]
+        strings = np.empty(len(rows), dtype=object)
+        for (position, row) in enumerate(rows):
+            strings[position] = self[int(row)]
+
+        return strings
+
+
+def _write_column(folder, table, field_name, column):
+    """
+    Writes a column to the store folder
+
+    :returns the type of the column, 'string' or 'array'
+    :raises Exception if the column holds values other than numbers or strings
+    """
+
+    path = os.path.join(folder, table + '.' + field_name)
+
+    if column.dtype != object:
+        np.save(path + '.npy', column)
+        return 'array'
+
+    if not all(isinstance(value, str) for value in column):
+        raise Exception('Field ' + field_name + ' of the ' + table + ' cannot be stored, as it is neither numeric nor '
+                        'a string field')
+
+    encoded_values = [value.encode('utf-8') for value in column]
+    offsets = np.zeros(len(encoded_values) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(encoded_value) for encoded_value in encoded_values])
+
+    with open(path + '.bin', 'wb') as blob_file:
+        blob_file.write(b''.join(encoded_values))
+    np.save(path + '.offsets.npy', offsets)
+
+    return 'string'
+
+
+def _python_value(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+
+    return value
@@ -1,9 +1,20 @@
-import json
 import os
-import sqlite3
 import shutil
+import sqlite3
 from sqlite3 import Error
 
+import numpy as np
+
+from annotation_store import AnnotationStore, store_path_of
+from build_manifest import BuildManifest
+from coco_annotations import CocoAnnotations, box_areas, corner_points_to_boxes
+from frame_deduplicator import FrameDeduplicator
+from image_materializer import ImageMaterializer
+from image_metadata import ImageMetadataProbe
+from image_resizer import ImageResizer
+from pipeline_metrics import PipelineMetrics
+from shard_packager import ShardPackager
+
 
 class AtriumDatasetConverter:
     def create_connection(self, db_file):
@@ -23,7 +34,169 @@ class AtriumDatasetConverter:
         rows = cursor.fetchall()
         return rows
 
-    def convert_dataset(self, frame_jump):
+    def ensure_frame_number_index(self, connection, persist_index=False):
+        """
+        Makes sure bounding boxes can be looked up by frame number without a full table scan
+
+        If no index with frame_number as its leading column exists, one is created when persist_index is True.
+        Otherwise nothing is written to the database, and the bulk query scans the table once and sorts the kept rows
+        in a temporary B-tree instead.
+
+        :parameter connection: connection to the Atrium ground truth database
+        :parameter persist_index: whether a missing index should be stored in the database file
+        :returns True if a persistent frame_number index exists after the call
+        """
+
+        cursor = connection.cursor()
+        for index in cursor.execute("PRAGMA index_list('bounding_boxes')").fetchall():
+            index_name = index[1]
+            columns = cursor.execute("PRAGMA index_info('" + index_name + "')").fetchall()
+            # the index is only usable for frame lookups if frame_number is its first column
+            if columns and columns[0][2] == 'frame_number':
+                return True
+
+        if not persist_index:
+            return False
+
+        cursor.execute('CREATE INDEX IF NOT EXISTS bounding_boxes_frame_number ON bounding_boxes (frame_number)')
+        connection.commit()
+        return True
+
+    def select_bounding_boxes_grouped_by_frame(self, connection, frame_numbers):
+        """
+        Reads the bounding boxes of all the given frames in a single query, ordered by frame number, and within a frame
+        by rowid, which is the order select_bounding_boxes_by_frame_number returns them in
+
+        The frame numbers to keep are joined against the bounding_boxes table inside the query,
+        so rows of frames removed by the frame sampling never leave SQLite.
+
+        :parameter connection: connection to the Atrium ground truth database
+        :parameter frame_numbers: the frame numbers to read bounding boxes for
+        :returns generator of (frame_number, rows) tuples, in ascending frame number order,
+        only for frames that have at least one bounding box
+        """
+
+        cursor = connection.cursor()
+        cursor.execute('CREATE TEMP TABLE IF NOT EXISTS kept_frames (frame_number INTEGER PRIMARY KEY)')
+        cursor.execute('DELETE FROM kept_frames')
+        cursor.executemany('INSERT OR IGNORE INTO kept_frames (frame_number) VALUES (?)',
+                           ((frame_number,) for frame_number in frame_numbers))
+
+        cursor.execute('SELECT bounding_boxes.* FROM kept_frames '
+                       'JOIN bounding_boxes ON bounding_boxes.frame_number = kept_frames.frame_number '
+                       'ORDER BY bounding_boxes.frame_number, bounding_boxes.rowid')
+
+        current_frame_number = None
+        current_rows = []
+        for row in cursor:
+            if row[1] != current_frame_number:
+                if current_rows:
+                    yield current_frame_number, current_rows
+                current_frame_number = row[1]
+                current_rows = []
+
+            current_rows.append(row)
+
+        if current_rows:
+            yield current_frame_number, current_rows
+
+    def select_frames_to_keep(self, frames, frame_jump):
+        """
+        Sorts the frames by frame number, and keeps every (frame_jump + 1)th frame, starting after the first frame_jump frames
+
+        :parameter frames: list of frame file names, e.g. '00042.jpg'
+        :parameter frame_jump: the number of frames to skip between two kept frames
+        :returns list of (frame_number, frame) tuples
+        """
+
+        numbered_frames = sorted((int(frame[:-4]), frame) for frame in frames)
+
+        return numbered_frames[frame_jump::frame_jump + 1]
+
+    def convert_dataset(self, frame_jump, persist_index=False, materialization='copy', use_build_cache=True,
+                        metrics_path=None, profile_stage=None, annotation_store=False, shard_size=None,
+                        shard_seed=None, resize_scale=None, image_format=None, image_quality=90,
+                        duplicate_hash_distance=None, duplicate_box_iou=0.8):
+        """
+        Converts the Atrium dataset into COCO JSON format, placing the kept frames and the annotations in the val folder
+
+        :parameter frame_jump: the number of frames to skip between two kept frames
+        :parameter persist_index: whether a frame_number index should be added to the database if it is missing
+        :parameter materialization: how frames are placed in the val folder,
+        one of 'copy', 'hardlink', 'symlink' and 'reflink', see ImageMaterializer
+        :parameter use_build_cache: whether to skip the conversion when neither the frames, the database nor the
+        parameters have changed since it was last run, see BuildManifest
+        :parameter metrics_path: JSON file to write timings, counters and trace events of the run to, see PipelineMetrics
+        :parameter profile_stage: name of a stage to profile with cProfile, one of 'probe', 'convert', 'deduplicate',
+        'materialize', 'resize', 'serialize' and 'package'
+        :parameter annotation_store: whether to also write the annotations as a memory mapped AnnotationStore,
+        in val/annotation_coco.store
+        :parameter shard_size: if given, the val folder is also packaged as tar shards of at most this many bytes,
+        in val_shards, see ShardPackager
+        :parameter shard_seed: seed of the shuffle of the samples before they are packaged, or None to not shuffle them
+        :parameter resize_scale: if given, the frames in the val folder are downscaled by this factor, and their
+        annotations are scaled to match, see ImageResizer
+        :parameter image_format: if given, the frames in the val folder are transcoded to this format,
+        one of 'jpg', 'png' and 'webp'
+        :parameter image_quality: the quality of resized or transcoded JPEG and WebP frames, from 0 to 100
+        :parameter duplicate_hash_distance: if given, frames kept by the frame_jump are also dropped if their
+        perceptual hash differs in at most this many of 64 bits from the last kept frame, and their boxes match its
+        boxes, see FrameDeduplicator
+        :parameter duplicate_box_iou: the IoU every box of a dropped frame must have with a box of the last kept frame
+        """
+
+        image_resizer = None
+        if resize_scale is not None or image_format is not None:
+            image_resizer = ImageResizer(resize_scale, image_format, image_quality)
+
+        frame_deduplicator = None
+        if duplicate_hash_distance is not None:
+            frame_deduplicator = FrameDeduplicator(duplicate_hash_distance, duplicate_box_iou,
+                                                   'atrium_frame_hashes.json')
+
+        metrics = PipelineMetrics('atrium', metrics_path, profile_stage=profile_stage)
+        try:
+            self.__convert_dataset(frame_jump, persist_index, materialization, use_build_cache, annotation_store,
+                                   shard_size, shard_seed, image_resizer, frame_deduplicator, metrics)
+        finally:
+            metrics.print_summary()
+            metrics.write()
+
+    def __convert_dataset(self, frame_jump, persist_index, materialization, use_build_cache, annotation_store,
+                          shard_size, shard_seed, image_resizer, frame_deduplicator, metrics):
+        database_path = 'atrium_annotations/atrium_gt.sqlite'
+        atrium_frames_path = 'atrium_frames'
+        json_path = 'val/annotation_coco.json'
+        store_path = store_path_of(json_path)
+        shards_folder = 'val_shards'
+
+        connection = self.create_connection(database_path)
+        self.ensure_frame_number_index(connection, persist_index)
+
+        build_manifest = BuildManifest('atrium_build_manifest.json') if use_build_cache else None
+        if build_manifest is not None:
+            parameters = {'frame_jump': frame_jump, 'materialization': materialization}
+            output_paths = [json_path]
+            if annotation_store:
+                parameters['annotation_store'] = True
+                output_paths.append(store_path + '/meta.json')
+            if shard_size is not None:
+                parameters['shard_size'] = shard_size
+                parameters['shard_seed'] = shard_seed
+                output_paths.append(shards_folder + '/index.json')
+            if image_resizer is not None:
+                parameters['resize'] = image_resizer.parameters()
+            if frame_deduplicator is not None:
+                parameters['deduplication'] = frame_deduplicator.parameters()
+
+            fingerprint = build_manifest.fingerprint([database_path, atrium_frames_path], parameters)
+            if build_manifest.is_up_to_date('convert', 'atrium', fingerprint, output_paths):
+                print('Dataset atrium is up to date')
+                connection.close()
+                return
+
+            build_manifest.invalidate('convert', 'atrium')
+
         info = {
             'description': "Atrium Dataset",
             'url': "http://www.jpjodoin.com/urbantracker/",
@@ -35,8 +208,6 @@ class AtriumDatasetConverter:
 
         licenses = []
         categories = []
-        images = []
-        annotations = []
 
         licenses.append({
             'url': "http://creativecommons.org/licenses/by-nc-sa/2.0/",
@@ -49,92 +220,117 @@ class AtriumDatasetConverter:
             'name': 'person'
         })
 
-        # DO MAGIC HERE
-        image_id = 0
-        remaining_jumps = frame_jump
+        atrium_frames = [f for f in os.listdir(atrium_frames_path) if os.path.isfile(os.path.join(atrium_frames_path, f))]
+        kept_frames = self.select_frames_to_keep(atrium_frames, frame_jump)
 
-        connection = self.create_connection('atrium_annotations/atrium_gt.sqlite')
+        # Read the dimensions of the kept frames from their headers
+        with metrics.stage('probe'):
+            image_metadata_probe = ImageMetadataProbe('atrium_image_metadata.json')
+            image_sizes = image_metadata_probe.probe_files(
+                [os.path.join(atrium_frames_path, frame) for (frame_number, frame) in kept_frames])
+            image_metadata_probe.save()
 
-        atrium_frames_path = 'atrium_frames'
-        atrium_frames = [f for f in os.listdir(atrium_frames_path) if os.path.isfile(os.path.join(atrium_frames_path, f))]
-        for frame in atrium_frames:
-            frame_number = int(frame[:-4])
-
-            if remaining_jumps > 0:
-                remaining_jumps = remaining_jumps - 1
-                continue
-            else:
-                print('Processing frame: ' + frame)
-
-                # Increment image_id
-                image_id = image_id + 1
-
-                # Reset remaining_jumps (as we are here, we know that we should skip the next frame_jump frames)
-                remaining_jumps = frame_jump
-
-                # Copy file to val folder
-                shutil.copy(os.path.join(atrium_frames_path, frame), 'val')
-
-                # Find bounding boxes
-                bbox_rows = self.select_bounding_boxes_by_frame_number(connection, frame_number)
-
-                width = 800
-                height = 600
-
-                image = {
-                    'id': image_id,
-                    'file_name': frame,
-                    'width': width,
-                    'height': height,
-                    'licence': 1,
-                }
-
-                images.append(image)
-
-                for bbox_row in bbox_rows:
-                    x_top_left = bbox_row[2]
-                    y_top_left = bbox_row[3]
-                    x_bottom_right = bbox_row[4]
-                    y_bottom_right = bbox_row[5]
-
-                    bbox_width = x_bottom_right - x_top_left
-                    bbox_height = y_bottom_right - y_top_left
-
-                    # center_x = (x_top_left + x_bottom_right) / 2
-                    # center_y = (y_top_left + y_bottom_right) / 2
-
-                    bbox = [
-                        x_top_left,
-                        y_top_left,
-                        bbox_width,
-                        bbox_height
-                    ]
-
-                    annotation = {
-                        'id': len(annotations) + 1,
-                        'image_id': image_id,
-                        'category_id': 0,
-                        'bbox': bbox,
-                        'width': width,
-                        'height': height,
-                        'area': bbox_width * bbox_height,
-                        'iscrowd': 0  # we set this to 0 as this means that no persons are close to each other
-                    }
-
-                    annotations.append(annotation)
-
-
-        json_dict = {
-            'info': info,
-            'licenses': licenses,
-            'categories': categories,
-            'images': images,
-            'annotations': annotations
-        }
+        with metrics.stage('convert'):
+            coco_annotations = self.__convert_frames(connection, kept_frames, image_sizes, atrium_frames_path, info,
+                                                     licenses, categories, metrics)
+        connection.close()
+
+        # near duplicate frames are dropped before the frames are placed in the val folder
+        if frame_deduplicator is not None:
+            with metrics.stage('deduplicate'):
+                keep = frame_deduplicator.select_images(coco_annotations, atrium_frames_path)
+                frame_deduplicator.save()
+                kept_frames = [kept_frame for (kept_frame, keep_frame) in zip(kept_frames, keep) if keep_frame]
+                coco_annotations = coco_annotations.select_images(keep)
+            metrics.count('duplicate_frames', int(np.count_nonzero(~keep)))
+
+        # Copy or link the kept files to val folder. As for the CAVIAR splits, the folder is emptied first, so frames of
+        # an earlier run that are not kept any more, e.g. after frame_jump changed, or in another format, are removed
+        with metrics.stage('materialize'):
+            if os.path.exists('val'):
+                shutil.rmtree('val')
+            os.mkdir('val')
+
+            ImageMaterializer(materialization).materialize_files(
+                [os.path.join(atrium_frames_path, frame) for (frame_number, frame) in kept_frames], 'val')
+
+        if image_resizer is not None:
+            with metrics.stage('resize'):
+                coco_annotations = image_resizer.resize_images(coco_annotations, 'val')
+            metrics.count('images_resized', coco_annotations.image_count)
 
-        json_data = json.dumps(json_dict)
+        with metrics.stage('serialize'):
+            coco_annotations.write(json_path)
 
-        with open('val/annotation_coco.json', "w") as json_file:
-            json_file.write(json_data)
+            # a store left by an earlier run is removed if no store is written, so it never disagrees with the JSON file
+            if annotation_store:
+                AnnotationStore.write(coco_annotations, store_path)
+            elif os.path.isdir(store_path):
+                shutil.rmtree(store_path)
+
+        if shard_size is not None:
+            with metrics.stage('package'):
+                index = ShardPackager(shard_size, shard_seed).package(json_path, 'val', shards_folder, 'val')
+            metrics.count('shards', len(index['shards']))
+        metrics.count('bytes_written', os.path.getsize(json_path))
+
+        if build_manifest is not None:
+            build_manifest.record('convert', 'atrium', fingerprint)
+
+    def __convert_frames(self, connection, kept_frames, image_sizes, atrium_frames_path, info, licenses, categories,
+                         metrics):
+        """
+        Creates an image per kept frame, and an annotation per bounding box of the frame in the database
+
+        :returns CocoAnnotations
+        """
+
+        # Read bounding boxes of all kept frames in one ordered pass, and merge them with the (also ordered) kept frames
+        grouped_bbox_rows = metrics.time_iterator('query', self.select_bounding_boxes_grouped_by_frame(
+            connection, [frame_number for (frame_number, frame) in kept_frames]))
+        next_group = next(grouped_bbox_rows, None)
+
+        # the corners of the boxes and the image ids they belong to are collected as flat lists
+        corner_points = []
+        box_image_ids = []
+
+        for (image_index, (frame_number, frame)) in enumerate(kept_frames):
+            # Find bounding boxes
+            if next_group is not None and next_group[0] == frame_number:
+                corner_points.extend(bbox_row[2:6] for bbox_row in next_group[1])
+                box_image_ids.extend([image_index + 1] * len(next_group[1]))
+                next_group = next(grouped_bbox_rows, None)
+
+            metrics.progress('convert', image_index + 1, len(kept_frames))
+
+        metrics.count('frames', len(kept_frames))
+        metrics.count('boxes', len(corner_points))
+
+        # Atrium frames are 800x600, which is used if the frame could not be probed
+        frame_sizes = np.array([image_sizes.get(os.path.join(atrium_frames_path, frame), (800, 600))
+                                for (frame_number, frame) in kept_frames], dtype=np.int64).reshape(-1, 2)
+
+        images = {
+            'id': np.arange(1, len(kept_frames) + 1, dtype=np.int64),
+            'file_name': np.array([frame for (frame_number, frame) in kept_frames], dtype=object),
+            'width': frame_sizes[:, 0],
+            'height': frame_sizes[:, 1],
+            'licence': np.ones(len(kept_frames), dtype=np.int64),
+        }
+
+        bboxes = corner_points_to_boxes(corner_points)
+        box_image_ids = np.array(box_image_ids, dtype=np.int64)
+        annotations = {
+            'id': np.arange(1, len(bboxes) + 1, dtype=np.int64),
+            'image_id': box_image_ids,
+            'category_id': np.zeros(len(bboxes), dtype=np.int64),
+            'bbox': bboxes,
+            # image ids start at 1, so the image of a box is at image id - 1
+            'width': images['width'][box_image_ids - 1],
+            'height': images['height'][box_image_ids - 1],
+            'area': box_areas(bboxes),
+            # we set this to 0 as this means that no persons are close to each other
+            'iscrowd': np.zeros(len(bboxes), dtype=np.int64)
+        }
 
-        json_file.close()
\ No newline at end of file
+        return CocoAnnotations(info, licenses, categories, images, annotations)
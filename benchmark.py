@@ -0,0 +1,322 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import synthetic_data
+
+# dataset_count: number of CAVIAR datasets, frame_count: frames per CAVIAR dataset and Atrium frames
+SCALES = {
+    'small': {'dataset_count': 2, 'frame_count': 200, 'detections_per_image': 10},
+    'medium': {'dataset_count': 4, 'frame_count': 1000, 'detections_per_image': 20},
+    'large': {'dataset_count': 8, 'frame_count': 5000, 'detections_per_image': 50},
+}
+
+STAGES = ('extract', 'convert', 'concatenate', 'render', 'rotate', 'atrium_convert')
+
+
+def run_benchmarks(work_folder, scale='small', frame_jump=0, workers=None, stages=STAGES):
+    """
+    Generates synthetic datasets in work folder, and runs and measures each pipeline stage on them
+
+    Every stage runs in a fresh process, so its peak memory is not affected by the other stages.
+    Stages that use worker processes report the peak memory of their largest worker separately.
+
+    :parameter scale: one of the keys of SCALES
+    :parameter frame_jump: the frame_jump used by extraction and conversion, 0 keeps all frames
+    :parameter workers: the number of worker processes of the render and rotate stages, defaults to the CPU count
+    :parameter stages: the stages to measure, a subset of STAGES. A stage needs the outputs of the stages before it
+    :returns dict of stage name -> measurements dict
+    """
+
+    work_folder = os.path.abspath(work_folder)
+    if os.path.isdir(work_folder):
+        shutil.rmtree(work_folder)
+    os.makedirs(work_folder)
+
+    parameters = SCALES[scale]
+    caviar_folder = os.path.join(work_folder, 'caviar')
+    atrium_folder = os.path.join(work_folder, 'atrium')
+
+    print('Generating ' + scale + ' synthetic datasets in ' + work_folder)
+    dataset_names = synthetic_data.write_caviar_datasets(caviar_folder, parameters['dataset_count'],
+                                                         parameters['frame_count'])
+    synthetic_data.write_atrium_database(os.path.join(atrium_folder, 'atrium_annotations', 'atrium_gt.sqlite'),
+                                         parameters['frame_count'])
+    synthetic_data.write_atrium_frames(os.path.join(atrium_folder, 'atrium_frames'), parameters['frame_count'])
+    os.makedirs(os.path.join(atrium_folder, 'val'))
+
+    train_folder = os.path.join(caviar_folder, 'train')
+    train_json_path = os.path.join(train_folder, 'train.json')
+    results_path = os.path.join(work_folder, 'results.json')
+
+    stage_arguments = {
+        'extract': (caviar_folder, dataset_names, frame_jump),
+        'convert': (caviar_folder, dataset_names, frame_jump),
+        'concatenate': (caviar_folder, dataset_names),
+        'render': (train_json_path, results_path, train_folder, os.path.join(work_folder, 'rendered'), workers),
+        'rotate': (train_json_path, train_folder, os.path.join(work_folder, 'rotated'), workers),
+        'atrium_convert': (atrium_folder, frame_jump),
+    }
+
+    results = {}
+    for stage in stages:
+        if stage == 'render':
+            synthetic_data.write_coco_results(train_json_path, results_path, parameters['detections_per_image'])
+
+        print('Running stage ' + stage)
+        results[stage] = _run_in_fresh_process(stage, stage_arguments[stage])
+        print_measurements(stage, results[stage])
+
+    return results
+
+
+def print_measurements(stage, measurements):
+    print('{:<16}{:>10.3f} s{:>12.1f} items/s{:>10.1f} MB/s{:>10.1f} MB peak{:>10.1f} MB worker peak'.format(
+        stage, measurements['seconds'], measurements['items_per_second'], measurements['megabytes_per_second'],
+        measurements['peak_memory_mb'], measurements['peak_worker_memory_mb']))
+
+
+def compare_to_baseline(results, baseline, tolerance=0.2):
+    """
+    Finds stages that are slower, or use more memory, than in a baseline by more than the tolerance
+
+    :parameter results: measurements returned by run_benchmarks
+    :parameter baseline: measurements of an earlier run, e.g. loaded from a file written by save_baseline
+    :parameter tolerance: allowed relative increase, e.g. 0.2 for 20%
+    :returns list of human readable regression descriptions, empty if there are none
+    """
+
+    regressions = []
+    for (stage, measurements) in results.items():
+        if stage not in baseline:
+            continue
+
+        for metric in ('seconds', 'peak_memory_mb', 'peak_worker_memory_mb'):
+            baseline_value = baseline[stage][metric]
+            if baseline_value > 0 and measurements[metric] > baseline_value * (1 + tolerance):
+                regressions.append(stage + ': ' + metric + ' ' + '{:.3f}'.format(measurements[metric]) +
+                                   ' vs. baseline ' + '{:.3f}'.format(baseline_value))
+
+    return regressions
+
+
+def save_baseline(results, scale, baseline_path):
+    with open(baseline_path, 'w') as baseline_file:
+        json.dump({'scale': scale, 'stages': results}, baseline_file, indent=2)
+
+
+def load_baseline(baseline_path, scale):
+    """
+    :returns the stage measurements of a baseline file
+    :raises Exception if the baseline was measured at another scale
+    """
+
+    with open(baseline_path) as baseline_file:
+        baseline = json.load(baseline_file)
+
+    if baseline['scale'] != scale:
+        raise Exception('Baseline was measured at scale ' + baseline['scale'] + ', not ' + scale)
+
+    return baseline['stages']
+
+
+def _run_in_fresh_process(stage, arguments):
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+        return executor.submit(_measure_stage, stage, arguments).result()
+
+
+def _measure_stage(stage, arguments):
+    stage_function = globals()['_' + stage + '_stage']
+
+    tracemalloc.start()
+    start_time = time.perf_counter()
+
+    # the stages print a line per file, which is not part of what is measured
+    with open(os.devnull, 'w') as devnull:
+        stdout = sys.stdout
+        sys.stdout = devnull
+        try:
+            (items, bytes_processed) = stage_function(*arguments)
+        finally:
+            sys.stdout = stdout
+
+    seconds = time.perf_counter() - start_time
+    (_, python_peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    (peak_memory_mb, peak_worker_memory_mb) = _peak_memory_mb()
+
+    return {
+        'seconds': seconds,
+        'items': items,
+        'bytes': bytes_processed,
+        'items_per_second': items / seconds if seconds > 0 else 0.0,
+        'megabytes_per_second': bytes_processed / (1024 * 1024) / seconds if seconds > 0 else 0.0,
+        'peak_memory_mb': peak_memory_mb,
+        'peak_worker_memory_mb': peak_worker_memory_mb,
+        'peak_python_memory_mb': python_peak / (1024 * 1024),
+    }
+
+
+def _peak_memory_mb():
+    """
+    :returns (peak resident memory of this process, largest peak resident memory of its finished child processes)
+    in megabytes, or zeros where the resource module is not available
+    """
+
+    try:
+        import resource
+    except ImportError:
+        return 0.0, 0.0
+
+    # ru_maxrss is in bytes on macOS, and in kilobytes elsewhere
+    unit = 1024 * 1024 if sys.platform == 'darwin' else 1024
+
+    # Linux keeps ru_maxrss across exec, so a spawned stage process would report the peak of the benchmark process
+    # that generated the data. VmHWM is the peak of the process' own memory, which starts empty at exec
+    peak_memory_kb = _high_water_mark_kb()
+    if peak_memory_kb is not None:
+        peak_memory_mb = peak_memory_kb / 1024
+    else:
+        peak_memory_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / unit
+
+    return peak_memory_mb, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / unit
+
+
+def _high_water_mark_kb():
+    """
+    :returns the VmHWM of this process in kilobytes, or None where /proc is not available
+    """
+
+    try:
+        with open('/proc/self/status') as status_file:
+            for line in status_file:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+
+    return None
+
+
+def _file_size(path):
+    return os.path.getsize(path) if os.path.isfile(path) else 0
+
+
+def _extract_stage(caviar_folder, dataset_names, frame_jump):
+    from caviar_dataset_converter import CaviarDatasetConverter
+
+    converter = CaviarDatasetConverter()
+    for dataset_name in dataset_names:
+        converter.process_dataset(caviar_folder, dataset_name + '.xml', dataset_name + '.tar.gz', True, False,
+                                  frame_jump)
+
+    frames = sum(len(os.listdir(os.path.join(caviar_folder, dataset_name))) for dataset_name in dataset_names)
+    tar_bytes = sum(_file_size(os.path.join(caviar_folder, dataset_name + '.tar.gz')) for dataset_name in dataset_names)
+
+    return frames, tar_bytes
+
+
+def _convert_stage(caviar_folder, dataset_names, frame_jump):
+    from caviar_dataset_converter import CaviarDatasetConverter
+
+    converter = CaviarDatasetConverter()
+    for dataset_name in dataset_names:
+        converter.process_dataset(caviar_folder, dataset_name + '.xml', dataset_name + '.tar.gz', False, True,
+                                  frame_jump)
+
+    images = 0
+    for dataset_name in dataset_names:
+        with open(os.path.join(caviar_folder, dataset_name + '.json')) as json_file:
+            images = images + len(json.load(json_file)['images'])
+    xml_bytes = sum(_file_size(os.path.join(caviar_folder, dataset_name + '.xml')) for dataset_name in dataset_names)
+
+    return images, xml_bytes
+
+
+def _concatenate_stage(caviar_folder, dataset_names):
+    from caviar_dataset_converter import CaviarDatasetConverter
+
+    CaviarDatasetConverter().concatenate_datasets(caviar_folder, 'train', dataset_names)
+
+    train_folder = os.path.join(caviar_folder, 'train')
+    file_names = os.listdir(train_folder)
+
+    return len(file_names) - 1, sum(_file_size(os.path.join(train_folder, file_name)) for file_name in file_names)
+
+
+def _render_stage(annotations_path, results_path, image_folder, output_folder, workers):
+    import draw_bounding_boxes
+
+    draw_bounding_boxes.run(annotations_path, image_folder + '/', output_folder + '/', results_path, workers=workers)
+
+    file_names = os.listdir(output_folder)
+    return len(file_names), sum(_file_size(os.path.join(image_folder, file_name)) for file_name in file_names)
+
+
+def _rotate_stage(annotations_path, image_folder, output_folder, workers):
+    import rotate_images
+
+    rotate_images.run(image_folder, output_folder, -90, annotations_path, workers=workers)
+
+    file_names = [file_name for file_name in os.listdir(output_folder) if file_name.endswith('.jpg')]
+    return len(file_names), sum(_file_size(os.path.join(image_folder, file_name)) for file_name in file_names)
+
+
+def _atrium_convert_stage(atrium_folder, frame_jump):
+    from atrium_dataset_converter import AtriumDatasetConverter
+
+    # the Atrium converter works on folders relative to the working directory
+    os.chdir(atrium_folder)
+    AtriumDatasetConverter().convert_dataset(frame_jump, use_build_cache=False)
+
+    file_names = [file_name for file_name in os.listdir('val') if file_name.endswith('.jpg')]
+    database_bytes = _file_size(os.path.join('atrium_annotations', 'atrium_gt.sqlite'))
+
+    return len(file_names), database_bytes + sum(_file_size(os.path.join('val', file_name)) for file_name in file_names)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks the dataset conversion pipeline on synthetic data')
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    parser.add_argument('--work-folder', default='benchmark_data')
+    parser.add_argument('--frame-jump', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=list(STAGES))
+    parser.add_argument('--baseline', help='JSON file of measurements to compare with')
+    parser.add_argument('--save-baseline', action='store_true', help='save the measurements as the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed relative increase of time and memory compared to the baseline')
+    arguments = parser.parse_args()
+
+    # checked before running the benchmarks, which would otherwise be measured for nothing
+    if arguments.save_baseline and arguments.baseline is None:
+        parser.error('--save-baseline requires --baseline')
+
+    results = run_benchmarks(arguments.work_folder, arguments.scale, arguments.frame_jump, arguments.workers,
+                             arguments.stages)
+
+    if arguments.baseline is None:
+        return 0
+
+    if arguments.save_baseline:
+        save_baseline(results, arguments.scale, arguments.baseline)
+        print('Saved baseline to ' + arguments.baseline)
+        return 0
+
+    regressions = compare_to_baseline(results, load_baseline(arguments.baseline, arguments.scale),
+                                      arguments.tolerance)
+    for regression in regressions:
+        print('Regression in ' + regression)
+
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,139 @@
+import hashlib
+import json
+import os
+import threading
+
+from file_stat_cache import FileStatCache
+
+
+class BuildManifest:
+    """
+    Records a fingerprint of the inputs and parameters of every build stage that has been run,
+    so stages can be skipped when nothing they depend on has changed
+
+    A fingerprint is a SHA-256 hash of the contents of the input files and of the parameters. File hashes are cached in
+    the manifest by path, size and modification time, so unchanged files are not read again on later runs.
+
+    Usage:
+        fingerprint = manifest.fingerprint([xml_path], {'frame_jump': frame_jump})
+        if not manifest.is_up_to_date('convert', dataset_name, fingerprint, [json_path]):
+            convert(...)
+            manifest.record('convert', dataset_name, fingerprint)
+    """
+
+    def __init__(self, manifest_path):
+        """
+        :parameter manifest_path: the JSON file the manifest is stored in. It is created if it does not exist
+        """
+
+        self.manifest_path = manifest_path
+        self.__lock = threading.Lock()
+
+        if os.path.isfile(manifest_path):
+            with open(manifest_path) as manifest_file:
+                manifest = json.load(manifest_file)
+        else:
+            manifest = {}
+
+        # the file hashes are stored in the manifest, see FileStatCache
+        self.__file_hashes = FileStatCache(entries=manifest.get('file_hashes', {}))
+        self.__stages = manifest.get('stages', {})
+
+    def fingerprint(self, input_paths, parameters):
+        """
+        Computes the fingerprint of a stage
+
+        :parameter input_paths: the files and folders the stage reads. Folders are hashed by the names and contents of
+        the files in them
+        :parameter parameters: JSON serializable dict of the parameters of the stage
+        :returns hex digest string
+        """
+
+        input_hashes = [[input_path, self.hash_path(input_path)] for input_path in input_paths]
+        fingerprint_data = json.dumps({'inputs': input_hashes, 'parameters': parameters}, sort_keys=True)
+
+        return hashlib.sha256(fingerprint_data.encode('utf-8')).hexdigest()
+
+    def hash_path(self, path):
+        """
+        Hashes the contents of a file, or of all the files in a folder, using cached hashes of unchanged files
+
+        :returns hex digest string, or None if the path does not exist
+        """
+
+        if os.path.isdir(path):
+            folder_hash = hashlib.sha256()
+            for file_name in sorted(os.listdir(path)):
+                file_hash = self.hash_path(os.path.join(path, file_name))
+                folder_hash.update((file_name + ':' + str(file_hash) + '\n').encode('utf-8'))
+
+            return folder_hash.hexdigest()
+
+        if not os.path.isfile(path):
+            return None
+
+        stat = os.stat(path)
+        cached = self.__file_hashes.get(path, stat)
+        if cached is not None:
+            return cached
+
+        file_hash = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(1024 * 1024), b''):
+                file_hash.update(chunk)
+
+        self.__file_hashes.set(path, stat, file_hash.hexdigest())
+
+        return file_hash.hexdigest()
+
+    def is_up_to_date(self, stage, target, fingerprint, output_paths=()):
+        """
+        Checks whether a stage has already been run for a target with the same fingerprint, and its outputs still exist
+
+        :parameter stage: name of the stage, e.g. 'extract'
+        :parameter target: what the stage was run for, e.g. a dataset name
+        :parameter fingerprint: the stage's current fingerprint, see fingerprint
+        :parameter output_paths: files or folders that the stage creates
+        """
+
+        with self.__lock:
+            recorded_fingerprint = self.__stages.get(stage, {}).get(target)
+
+        return recorded_fingerprint == fingerprint and all(os.path.exists(path) for path in output_paths)
+
+    def recorded_fingerprint(self, stage, target):
+        """
+        :returns the fingerprint recorded for a stage and target, or None if the stage has not been run for it
+        """
+
+        with self.__lock:
+            return self.__stages.get(stage, {}).get(target)
+
+    def record(self, stage, target, fingerprint):
+        """
+        Records that a stage has been run successfully for a target, and saves the manifest
+        """
+
+        with self.__lock:
+            self.__stages.setdefault(stage, {})[target] = fingerprint
+            self.__save()
+
+    def invalidate(self, stage, target):
+        """
+        Forgets that a stage has been run for a target, e.g. before it is run again, so a failed run is not trusted
+        """
+
+        with self.__lock:
+            if self.__stages.get(stage, {}).pop(target, None) is not None:
+                self.__save()
+
+    def __save(self):
+        """
+        Writes the manifest to a temporary file, and renames it into place, so the manifest is never half written
+        """
+
+        temporary_path = self.manifest_path + '.tmp'
+        with open(temporary_path, 'w') as manifest_file:
+            json.dump({'file_hashes': self.__file_hashes.entries(), 'stages': self.__stages}, manifest_file)
+
+        os.replace(temporary_path, self.manifest_path)
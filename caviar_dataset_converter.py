@@ -1,53 +1,158 @@
 import os
-import random
-
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-import requests
 import tarfile
-import xmltodict
-import json
 import shutil
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+import numpy as np
+
+from annotation_store import AnnotationStore, store_path_of
+from build_manifest import BuildManifest
+from caviar_xml_reader import CaviarXmlReader
+from coco_annotations import CocoAnnotations, box_areas, center_boxes_to_corner
+from frame_deduplicator import FrameDeduplicator
+from image_materializer import ImageMaterializer
+from image_metadata import ImageMetadataProbe
+from image_resizer import ImageResizer
+from pipeline_metrics import PipelineMetrics
+from shard_packager import ShardPackager
+from virtual_split import DatasetCounts, split_dataset_names, write_split_manifest
 
 
 class CaviarDatasetConverter:
     def create_test_and_validation_datasets(self, download_files=False, extract_files=False, convert_datasets=False,
-                                            frame_jump=19):
+                                            frame_jump=19, download_workers=4, materialization='copy', workers=None,
+                                            split_seed=None, use_build_cache=True, refresh_index=False,
+                                            metrics_path=None, profile_stage=None, annotation_store=False,
+                                            shard_size=None, shard_seed=None, train_ratio=0.7, split_by='sequences',
+                                            virtual_splits=False, resize_scale=None, image_format=None,
+                                            image_quality=90, duplicate_hash_distance=None, duplicate_box_iou=0.8,
+                                            download_cache=None, download_cache_size=None):
         """
         Downloads Caviar datasets, converts them to COCO format, and splits them up into test and validation sets
-        """
 
-        annotations_images_pairs = self.__scrape_website()
+        Each dataset is downloaded, extracted and converted independently of the others. Datasets are extracted and
+        converted in a pool of worker processes, as soon as their files are downloaded, while other datasets are still
+        being downloaded. The datasets are concatenated once all of them are done.
+
+        :parameter download_workers: the number of files downloaded at the same time
+        :parameter workers: the number of datasets extracted and converted at the same time, defaults to the CPU count
+        :parameter materialization: how images are placed in the train and test folders,
+        one of 'copy', 'hardlink', 'symlink' and 'reflink', see ImageMaterializer
+        :parameter split_seed: seed of the random split into train and test sets. If None, the split differs every run
+        :parameter use_build_cache: whether to skip extracting, converting and concatenating when none of their inputs
+        and parameters have changed since they were last run, see BuildManifest
+        :parameter refresh_index: whether to fetch the list of datasets from the CAVIAR web page,
+        even if it has been saved by an earlier run, see CaviarIndex
+        :parameter metrics_path: JSON file to write timings, counters and trace events of the run to, see PipelineMetrics
+        :parameter profile_stage: name of a stage to profile with cProfile, one of 'index', 'download', 'extract',
+        'convert', 'deduplicate', 'concatenate', 'materialize', 'resize', 'serialize' and 'package'
+        :parameter annotation_store: whether to also write each COCO JSON file as a memory mapped AnnotationStore,
+        in a .store folder next to it
+        :parameter shard_size: if given, the train and test sets are also packaged as tar shards of at most this many
+        bytes, in downloads/train_shards and downloads/test_shards, see ShardPackager
+        :parameter shard_seed: seed of the shuffle of the samples before they are packaged, or None to not shuffle them
+        :parameter train_ratio: the share of the datasets in the train set, the rest is in the test set
+        :parameter split_by: what the ratio is a share of, one of 'sequences', 'frames' and 'annotations'
+        :parameter virtual_splits: whether to write the train and test sets as manifests of their datasets,
+        downloads/train.split.json and downloads/test.split.json, instead of concatenating them. See VirtualSplit
+        :parameter resize_scale: if given, the images of the train and test sets are downscaled by this factor,
+        and their annotations are scaled to match, see ImageResizer
+        :parameter image_format: if given, the images of the train and test sets are transcoded to this format,
+        one of 'jpg', 'png' and 'webp'
+        :parameter image_quality: the quality of resized or transcoded JPEG and WebP images, from 0 to 100
+        :parameter duplicate_hash_distance: if given, frames kept by the frame_jump are also dropped if their
+        perceptual hash differs in at most this many of 64 bits from the last kept frame, and their boxes match its
+        boxes, see FrameDeduplicator
+        :parameter duplicate_box_iou: the IoU every box of a dropped frame must have with a box of the last kept frame
+        :parameter download_cache: if given, a folder of downloaded files shared with other checkouts and runs, which
+        files are copied from instead of being downloaded again, see DownloadCache
+        :parameter download_cache_size: the maximum number of bytes of the download cache, or None for no maximum.
+        The least recently used files are evicted when it grows beyond it
+        :raises ValueError if the train ratio is not between 0 and 1, or leaves the train or test set without datasets
+        """
 
+        if not 0 < train_ratio < 1:
+            raise ValueError('The train ratio must be larger than 0 and smaller than 1, got ' + str(train_ratio))
+        if virtual_splits and shard_size is not None:
+            raise Exception('Shards are packaged from concatenated train and test sets, so they cannot be combined with '
+                            'virtual splits')
+        if virtual_splits and (resize_scale is not None or image_format is not None):
+            raise Exception('Images are resized in the concatenated train and test sets, so resizing cannot be combined '
+                            'with virtual splits')
+
+        metrics = PipelineMetrics('caviar', metrics_path, profile_stage=profile_stage)
+        try:
+            self.__create_test_and_validation_datasets(download_files, extract_files, convert_datasets, frame_jump,
+                                                       download_workers, materialization, workers, split_seed,
+                                                       use_build_cache, refresh_index, annotation_store, shard_size,
+                                                       shard_seed, train_ratio, split_by, virtual_splits, resize_scale,
+                                                       image_format, image_quality, duplicate_hash_distance,
+                                                       duplicate_box_iou, download_cache, download_cache_size,
+                                                       metrics)
+        finally:
+            metrics.print_summary()
+            metrics.write()
+
+    def __create_test_and_validation_datasets(self, download_files, extract_files, convert_datasets, frame_jump,
+                                              download_workers, materialization, workers, split_seed,
+                                              use_build_cache, refresh_index, annotation_store, shard_size,
+                                              shard_seed, train_ratio, split_by, virtual_splits, resize_scale,
+                                              image_format, image_quality, duplicate_hash_distance, duplicate_box_iou,
+                                              download_cache, download_cache_size, metrics):
         download_folder = 'downloads'
 
-        for annotations_images_pair in annotations_images_pairs:
-            xml_file_name = annotations_images_pair[0][0]
-            xml_file_url = annotations_images_pair[0][1]
-            tar_file_name = annotations_images_pair[1][0]
-            tar_file_url = annotations_images_pair[1][1]
-
-            if download_files:
-                self.__download_file(xml_file_url, xml_file_name, download_folder)
-                self.__download_file(tar_file_url, tar_file_name, download_folder)
+        with metrics.stage('index'):
+            annotations_images_pairs = self.__scrape_website(download_folder, refresh_index)
 
-            # xml file name with out .xml
-            xml_file_name_no_ext = xml_file_name[:-4]
+        if not os.path.isdir(download_folder):
+            os.makedirs(download_folder)
 
-            images_destination_folder = download_folder + '/' + xml_file_name_no_ext
+        build_manifest = BuildManifest(download_folder + '/build_manifest.json') if use_build_cache else None
 
-            if extract_files:
-                self.__extract_compressed_dataset(download_folder, tar_file_name, xml_file_name_no_ext,
-                                                  images_destination_folder)
+        deduplication = None
+        if duplicate_hash_distance is not None:
+            deduplication = {'hash_distance': duplicate_hash_distance, 'box_iou': duplicate_box_iou}
 
-            if convert_datasets:
-                self.__covert_dataset(download_folder, xml_file_name_no_ext, frame_jump)
+        self.__process_datasets(annotations_images_pairs, download_folder, download_files, extract_files,
+                                convert_datasets, frame_jump, download_workers, workers, build_manifest, annotation_store,
+                                deduplication, download_cache, download_cache_size, metrics)
 
         dataset_names = self.__retrieve_dataset_names(annotations_images_pairs)
-        (train_dataset_names, test_dataset_names) = self.__shuffle_and_split_list_of_dataset_names(dataset_names,
-                                                                                                   0.7, 0.3)
-        self.__concatenate_datasets(download_folder, 'train', train_dataset_names)
-        self.__concatenate_datasets(download_folder, 'test', test_dataset_names)
+        weights = None
+        if split_by != 'sequences':
+            dataset_counts = DatasetCounts(download_folder + '/dataset_counts.json')
+            weights = dataset_counts.weights(download_folder, dataset_names, split_by)
+            dataset_counts.save()
+
+        (train_dataset_names, test_dataset_names) = split_dataset_names(
+            dataset_names, [train_ratio, round(1 - train_ratio, 10)], split_seed, weights)
+
+        # checked before anything is written, as the folder of a split is replaced when it is concatenated
+        if not train_dataset_names or not test_dataset_names:
+            raise ValueError('Splitting ' + str(len(dataset_names)) + ' datasets with train ratio ' + str(train_ratio) +
+                             ' by ' + split_by + ' leaves the ' + ('train' if not train_dataset_names else 'test') +
+                             ' set empty')
+
+        if virtual_splits:
+            for (split, split_names) in (('train', train_dataset_names), ('test', test_dataset_names)):
+                write_split_manifest(download_folder + '/' + split + '.split.json', download_folder, split_names)
+                print('Wrote virtual split ' + split + ' of ' + str(len(split_names)) + ' datasets')
+            return
+
+        image_materializer = ImageMaterializer(materialization)
+        image_resizer = None
+        if resize_scale is not None or image_format is not None:
+            image_resizer = ImageResizer(resize_scale, image_format, image_quality, workers)
+
+        self.__concatenate_datasets_if_changed(download_folder, 'train', train_dataset_names, image_materializer,
+                                               image_resizer, build_manifest, annotation_store, metrics)
+        self.__concatenate_datasets_if_changed(download_folder, 'test', test_dataset_names, image_materializer,
+                                               image_resizer, build_manifest, annotation_store, metrics)
+
+        if shard_size is not None:
+            shard_packager = ShardPackager(shard_size, shard_seed, workers)
+            for split in ('train', 'test'):
+                self.__package_split_if_changed(download_folder, split, shard_packager, build_manifest, metrics)
 
     def __retrieve_dataset_names(self, annotations_images_pairs):
         """
@@ -64,101 +169,215 @@ class CaviarDatasetConverter:
 
         return dataset_names
 
-    def __shuffle_and_split_list_of_dataset_names(self, dataset_names, test_set_size, validation_set_size):
+    def __scrape_website(self, download_folder, refresh_index):
         """
-        First shuffles the list of annotations in order to randomize the test/validation set split
-        Then splits the list of annotations into two lists,
-        where 70% of org. list is in first, and the remaining 30% is in the other
+        Get CAVIAR dataset information from the CAVIAR web page, or from the index saved in download folder
 
-        :parameter dataset_names is the list of dataset names
-        :returns test_dataset_names, validation_dataset_names lists
+        :returns [((xml_file_name, xml_file_url), (tar_file_name, tar_file_url))]
         """
 
-        # Test and validation sets must not share data
-        if test_set_size + validation_set_size > 1:
-            raise Exception('Test size + validation size must not exceed 100% of datasets size')
+        # imported here, as requests is only needed to fetch the index and the datasets
+        from caviar_index import CaviarIndex
 
-        shuffled_dataset_names = dataset_names.copy()
-        random.shuffle(shuffled_dataset_names)
+        return CaviarIndex(download_folder + '/caviar_index.json').load(refresh_index)
 
-        number_of_items = len(shuffled_dataset_names)
-        number_of_items_in_test_set = int(number_of_items * test_set_size)
-        number_of_items_in_val_set = int(number_of_items * validation_set_size)
+    def __process_datasets(self, annotations_images_pairs, download_folder, download_files, extract_files,
+                           convert_datasets, frame_jump, download_workers, workers, build_manifest, annotation_store,
+                           deduplication, download_cache, download_cache_size, metrics):
+        """
+        Downloads, extracts and converts all datasets, downloading in threads and extracting and converting in processes
 
-        test_dataset_names = shuffled_dataset_names[:number_of_items_in_test_set]
-        validation_dataset_names = shuffled_dataset_names[-number_of_items_in_val_set:]
+        :parameter annotations_images_pairs list of ((xml_file_name, xml_file_url), (tar_file_name, tar_file_url)) tuples
+        :parameter build_manifest: BuildManifest used to skip stages that are up to date, or None to run all stages
+        :parameter annotation_store: whether converted datasets are also written as an AnnotationStore
+        :parameter download_cache: folder of the DownloadCache to download through, or None to not cache downloads
+        :parameter metrics: PipelineMetrics that the metrics of the worker processes are merged into
+        :raises Exception if one or more of the datasets failed, after all the other datasets are done
+        """
 
-        return test_dataset_names, validation_dataset_names
+        from caviar_downloader import CaviarDownloader
 
-    def __scrape_website(self):
-        """
-        Get CAVIAR dataset information using web scraping
+        cache = None
+        if download_cache is not None:
+            from download_cache import DownloadCache
 
-        :returns [((xml_file_name, xml_file_url), (tar_file_name, tar_file_url))]
-        """
+            cache = DownloadCache(download_cache, download_cache_size)
+
+        downloader = CaviarDownloader(max_workers=download_workers, cache=cache)
 
-        print('Beginning to scrape website')
-        # setup
-        options = Options()
-        options.headless = True
+        with ThreadPoolExecutor(max_workers=download_workers) as download_pool, \
+                ProcessPoolExecutor(max_workers=workers) as process_pool:
+            prepare_futures = {}
+            for annotations_images_pair in annotations_images_pairs:
+                prepare_future = download_pool.submit(self.__prepare_dataset, downloader, annotations_images_pair,
+                                                      download_folder, download_files, extract_files,
+                                                      convert_datasets, frame_jump, build_manifest, annotation_store,
+                                                      deduplication, metrics)
+                prepare_futures[prepare_future] = annotations_images_pair
 
-        driver = webdriver.Chrome(options=options, executable_path='./chromedriver.exe')
+            # start extracting and converting each dataset as soon as its files are downloaded
+            dataset_futures = {}
+            failed_dataset_names = []
+            for prepare_future in as_completed(prepare_futures):
+                ((xml_file_name, xml_file_url), (tar_file_name, tar_file_url)) = prepare_futures[prepare_future]
+                dataset_name = xml_file_name[:-4]
 
-        # goto web page
-        driver.get('http://homepages.inf.ed.ac.uk/rbf/CAVIARDATA1/')
+                if prepare_future.exception() is not None:
+                    print('Failed to download dataset ' + dataset_name + ': ' + str(prepare_future.exception()))
+                    failed_dataset_names.append(dataset_name)
+                    continue
 
-        # get names of files to download
-        table_cells = driver.find_elements_by_tag_name('td')
+                stage_fingerprints = prepare_future.result()
+                if not stage_fingerprints:
+                    print('Dataset ' + dataset_name + ' is up to date')
+                    continue
 
-        annotations_images_pairs = []
+                if build_manifest is not None:
+                    for stage in stage_fingerprints:
+                        build_manifest.invalidate(stage, dataset_name)
 
-        for table_cell in table_cells:
-            links_inside_cell = table_cell.find_elements_by_tag_name('a')
+                dataset_future = process_pool.submit(self.process_dataset, download_folder, xml_file_name,
+                                                     tar_file_name, 'extract' in stage_fingerprints,
+                                                     'convert' in stage_fingerprints, frame_jump, annotation_store,
+                                                     metrics.worker_options(), deduplication)
+                dataset_futures[dataset_future] = (dataset_name, stage_fingerprints)
+
+            for dataset_future in as_completed(dataset_futures):
+                (dataset_name, stage_fingerprints) = dataset_futures[dataset_future]
+
+                if dataset_future.exception() is not None:
+                    print('Failed to process dataset ' + dataset_name + ': ' + str(dataset_future.exception()))
+                    failed_dataset_names.append(dataset_name)
+                    continue
 
-            if links_inside_cell:
-                xml_file_name = ''
-                xml_file_url = ''
-                tar_file_name = ''
-                tar_file_url = ''
+                metrics.merge(dataset_future.result())
 
-                for link in links_inside_cell:
-                    file_name = link.text
-                    url = link.get_attribute('href')
+                if build_manifest is not None:
+                    for (stage, fingerprint) in stage_fingerprints.items():
+                        build_manifest.record(stage, dataset_name, fingerprint)
 
-                    if file_name[-4:] == '.xml':
-                        xml_file_name = file_name
-                        xml_file_url = url
+        if failed_dataset_names:
+            raise Exception('Failed to create datasets: ' + ', '.join(failed_dataset_names))
+
+    def __prepare_dataset(self, downloader, annotations_images_pair, download_folder, download_files, extract_files,
+                          convert_datasets, frame_jump, build_manifest, annotation_store, deduplication, metrics):
+        """
+        Downloads the xml and tar files of a dataset to download folder, and works out which of its stages must be run
+
+        :parameter downloader: the CaviarDownloader to download with
+        :parameter annotations_images_pair ((xml_file_name, xml_file_url), (tar_file_name, tar_file_url)) tuple
+        :returns dict of stage name ('extract' or 'convert') -> fingerprint, for the stages to run.
+        The fingerprints are None if build manifest is None
+        """
+
+        ((xml_file_name, xml_file_url), (tar_file_name, tar_file_url)) = annotations_images_pair
+
+        if download_files:
+            with metrics.stage('download'):
+                bytes_downloaded = downloader.download_file(xml_file_url, xml_file_name, download_folder)
+                bytes_downloaded = bytes_downloaded + downloader.download_file(tar_file_url, tar_file_name,
+                                                                               download_folder)
+            metrics.count('bytes_downloaded', bytes_downloaded)
+
+        dataset_name = xml_file_name[:-4]
+        xml_file_path = download_folder + '/' + xml_file_name
+        tar_file_path = download_folder + '/' + tar_file_name
+
+        # the conversion removes the extracted frames it drops as duplicates, so both stages depend on the deduplication
+        stage_parameters = {'frame_jump': frame_jump}
+        if deduplication is not None:
+            stage_parameters['deduplication'] = deduplication
+
+        # which frames are extracted depends on the xml file, see __extract_compressed_dataset
+        stages = []
+        if extract_files:
+            stages.append(('extract', [tar_file_path, xml_file_path], stage_parameters,
+                           [download_folder + '/' + dataset_name]))
+        if convert_datasets:
+            # image dimensions are read from the extracted frames, which depend on the tar file
+            json_path = download_folder + '/' + dataset_name + '.json'
+            if annotation_store:
+                stages.append(('convert', [xml_file_path, tar_file_path], dict(stage_parameters, annotation_store=True),
+                               [json_path, store_path_of(json_path) + '/meta.json']))
+            else:
+                stages.append(('convert', [xml_file_path, tar_file_path], stage_parameters, [json_path]))
 
-                    if file_name[-7:] == '.tar.gz':
-                        tar_file_name = file_name
-                        tar_file_url = url
+        stage_fingerprints = {}
+        for (stage, input_paths, parameters, output_paths) in stages:
+            if build_manifest is None:
+                stage_fingerprints[stage] = None
+                continue
 
-                annotations_images_pairs.append(((xml_file_name, xml_file_url), (tar_file_name, tar_file_url)))
+            fingerprint = build_manifest.fingerprint(input_paths, parameters)
+            if not build_manifest.is_up_to_date(stage, dataset_name, fingerprint, output_paths):
+                stage_fingerprints[stage] = fingerprint
 
-        return annotations_images_pairs
+        return stage_fingerprints
 
-    def __download_file(self, url: str, file_name: str, destination_folder: str) -> None:
+    def process_dataset(self, download_folder, xml_file_name, tar_file_name, extract_files, convert_datasets,
+                        frame_jump, annotation_store=False, metrics_options=None, deduplication=None):
         """
-        Downloads a file from specified url to destination folder
-        :param url: The URL of the file to download
-        :type url: str
-        :param file_name: The downloaded file's new name
-        :type file_name: str
-        :param destination_folder:
-        :type destination_folder:
-        :rtype: None
+        Extracts and converts a single downloaded dataset. This is run in worker processes,
+        so it must only depend on its arguments and the files in download folder.
+
+        :parameter download_folder: the folder containing the xml and tar files of the dataset
+        :parameter xml_file_name: the xml file's name, including extension
+        :parameter tar_file_name: the tar file's name
+        :parameter extract_files: whether to extract the frames of the tar file
+        :parameter convert_datasets: whether to convert the xml file to COCO JSON format
+        :parameter frame_jump: the distance between frames to keep
+        :parameter annotation_store: whether to also write the converted dataset as an AnnotationStore
+        :parameter metrics_options: keyword arguments of the PipelineMetrics to collect metrics with,
+        see PipelineMetrics.worker_options
+        :parameter deduplication: dict of the 'hash_distance' and 'box_iou' of a FrameDeduplicator removing near
+        duplicate frames after the frame_jump, or None to keep all frames kept by the frame_jump
+        :returns summary of the collected metrics, see PipelineMetrics.summary
         """
 
-        print('Downloading ' + file_name)
-        r = requests.get(url, allow_redirects=True)
-        open(destination_folder + '/' + file_name, 'wb').write(r.content)
+        metrics = PipelineMetrics(**(metrics_options or {'name': 'caviar'}))
+
+        # xml file name with out .xml
+        xml_file_name_no_ext = xml_file_name[:-4]
+
+        images_destination_folder = download_folder + '/' + xml_file_name_no_ext
+
+        if extract_files:
+            with metrics.stage('extract'):
+                self.__extract_compressed_dataset(download_folder, tar_file_name, xml_file_name_no_ext,
+                                                  images_destination_folder, frame_jump, metrics)
+
+        if convert_datasets:
+            with metrics.stage('convert'):
+                self.__covert_dataset(download_folder, xml_file_name_no_ext, frame_jump, annotation_store,
+                                      deduplication, metrics)
+
+        return metrics.summary()
 
-    def __extract_compressed_dataset(self, tar_file_location, tar_file_name, xml_file_name, image_destination_folder):
+    def __extract_compressed_dataset(self, tar_file_location, tar_file_name, xml_file_name, image_destination_folder,
+                                     frame_jump, metrics):
         """
-        Extracts content of tar file into specified folder
+        Extracts the frames of a tar file, which are kept by the frame_jump, into specified folder
+
+        The archive is read as a stream, so it is only decompressed once, and frames that are not kept are never written.
+        Which frames are kept, and the number of digits of the frame numbers in the file names, is read from the
+        dataset's xml file, which must be in tar_file_location.
+
+        :parameter tar_file_location: the directory to find the tar and xml files
+        :parameter tar_file_name: the tar file's name
+        :parameter xml_file_name: is only file name, without path and extension
+        :parameter image_destination_folder: the folder to extract the frames to
+        :parameter frame_jump: the distance between frames to keep, see __covert_dataset
+        :parameter metrics: PipelineMetrics to report progress and counters to
         """
 
-        with tarfile.open(tar_file_location + '/' + tar_file_name) as tar:
+        xml_reader = CaviarXmlReader(tar_file_location + '/' + xml_file_name + '.xml')
+        (frame_count, kept_frame_numbers) = xml_reader.read_frame_sampling(frame_jump)
+
+        metrics.count('bytes_read', os.path.getsize(tar_file_location + '/' + tar_file_name))
+        extracted_frame_count = 0
+
+        frame_number_reader = FrameNumberReader(frame_count)
+        with tarfile.open(tar_file_location + '/' + tar_file_name, 'r|gz') as tar:
             # removing the file extension from the folder name
             # we use the xml files name for the folder, as it will make matching of these easier
             print('Extracting ' + tar_file_name)
@@ -166,47 +385,39 @@ class CaviarDatasetConverter:
             if not os.path.isdir(image_destination_folder):
                 os.mkdir(image_destination_folder)
 
-            # count number of files in archive to know how much of the file name to cut off
-            count = sum(1 for member in tar if member.isreg())
-            end_cut_index = -4
-            start_cut_index = end_cut_index - len(str(count))
-
             for member in tar:
-                if member.isdir() or member.name[-8:-4] == '.ppm':
+                if not is_frame_member(member):
                     continue
 
-                folder_file_seperation = member.name.rsplit('/', 1)
-
-                # Case where images are inside folder in tar file
-                if len(folder_file_seperation) == 1:
-                    original_file_name = member.name.rsplit('/', 1)[0]
-
-                # Case where images are NOT inside folder in tar file
-                else:
-                    original_file_name = member.name.rsplit('/', 1)[1]
+                frame_number = frame_number_reader.frame_number(member.name)
+                if frame_number not in kept_frame_numbers:
+                    continue
 
-                # use lstrip('0') to remove leading zeroes in order to match frame numbers in XML annotation
-                stripped_number = original_file_name[start_cut_index: end_cut_index].lstrip('0')
-                number = 1 if stripped_number == '' else int(stripped_number) + 1
+                new_file_name = xml_file_name + str(frame_number + 1) + '.jpg'
 
-                new_file_name = xml_file_name + str(number) + '.jpg'
+                with tar.extractfile(member) as member_file, \
+                        open(image_destination_folder + '/' + new_file_name, 'wb') as image_file:
+                    shutil.copyfileobj(member_file, image_file)
 
-                tar.makefile(member, image_destination_folder + '/' + new_file_name)
+                extracted_frame_count = extracted_frame_count + 1
+                metrics.count('frames_extracted')
+                metrics.count('bytes_written', member.size)
+                metrics.progress('extract ' + xml_file_name, extracted_frame_count, len(kept_frame_numbers))
 
-    def __covert_dataset(self, source_directory, xml_file_name, frame_jump):
+    def __covert_dataset(self, source_directory, xml_file_name, frame_jump, annotation_store, deduplication, metrics):
         """
         Converts a Caviar dataset in XML format into COCO JSON format
 
         :parameter source_directory: the directory to find the xml file
         :parameter xml_file_name: is only file name, without path and extension
         :parameter frame_jump: the distance between frames to keep. i.e. if frame_jump=10, then every 10 frame is included
+        :parameter annotation_store: whether to also write the dataset as an AnnotationStore next to the JSON file
+        :parameter deduplication: dict of the 'hash_distance' and 'box_iou' of a FrameDeduplicator, or None
+        :parameter metrics: PipelineMetrics to time the parsing, probing and serialization in, and count frames and boxes
         """
 
         print('Convert dataset "' + xml_file_name + '" to json format')
-        with open(source_directory + '/' + xml_file_name + '.xml') as xml_file:
-            data_dict = xmltodict.parse(xml_file.read())
-
-        xml_file.close()
+        xml_reader = CaviarXmlReader(source_directory + '/' + xml_file_name + '.xml')
 
         info = {
             'description': "CAVIAR Dataset",
@@ -219,8 +430,6 @@ class CaviarDatasetConverter:
 
         licenses = []
         categories = []
-        images = []
-        annotations = []
 
         licenses.append({
             'url': "http://creativecommons.org/licenses/by-nc-sa/2.0/",
@@ -233,147 +442,329 @@ class CaviarDatasetConverter:
             'name': 'person'
         })
 
-        image_id = 0
-        remaining_jumps = frame_jump
+        # read the dimensions of the extracted frames from their headers
+        images_folder = source_directory + '/' + xml_file_name
+        with metrics.stage('probe'):
+            image_metadata_probe = ImageMetadataProbe(source_directory + '/' + xml_file_name + '.image_metadata.json')
+            image_sizes = image_metadata_probe.probe_directory(images_folder) if os.path.isdir(images_folder) else {}
+            image_metadata_probe.save()
+
+        metrics.count('bytes_read', os.path.getsize(source_directory + '/' + xml_file_name + '.xml'))
 
-        for entry in data_dict['dataset']['frame']:
-            frame_number = int(entry['@number'])
+        # the kept frames and their boxes are collected as flat lists, which become the columns of the dataset
+        file_names = []
+        image_sizes_of_frames = []
+        center_boxes = []
+        box_image_ids = []
+
+        for (frame_number, boxes) in metrics.time_iterator('parse', xml_reader.read_frames(frame_jump)):
             file_name = xml_file_name + str(frame_number + 1) + ".jpg"
 
-            if remaining_jumps > 0:
-                remaining_jumps = remaining_jumps - 1
-                os.remove(source_directory + '/' + xml_file_name + '/' + file_name)
+            # boxes is None for the frames that are skipped due to the frame_jump.
+            # These are not extracted, but may remain from an extraction with another frame_jump
+            if boxes is None:
+                file_path = images_folder + '/' + file_name
+                if os.path.isfile(file_path):
+                    os.remove(file_path)
                 continue
-            else:
-                # Increment image_id
-                image_id = image_id + 1
-
-                # Reset remaining_jumps (as we are here, we know that we should skip the next frame_jump frames)
-                remaining_jumps = frame_jump
-
-            # image_id = frame_number + 1
-            width = 384
-            height = 288
-
-            image = {
-                'id': image_id,
-                'file_name': file_name,
-                'width': width,
-                'height': height,
-                'licence': 1,
-            }
 
-            images.append(image)
-
-            if entry['objectlist'] is not None:
-                objects = entry['objectlist']['object']
-                object_list = []
-                if isinstance(objects, list):
-                    object_list = objects
-                else:
-                    object_list.append(objects)
-
-                for obj in object_list:
-                    bbox_width = float(obj['box']['@w'])
-                    bbox_height = float(obj['box']['@h'])
-
-                    bbox_top_left_x = float(obj['box']['@xc']) - (bbox_width / 2)
-                    bbox_top_left_y = float(obj['box']['@yc']) - (bbox_height / 2)
-
-                    bbox = [
-                        bbox_top_left_x,
-                        bbox_top_left_y,
-                        bbox_width,
-                        bbox_height
-                    ]
-
-                    annotation = {
-                        'id': len(annotations) + 1,
-                        'image_id': image_id,
-                        'category_id': 0,
-                        'bbox': bbox,
-                        'width': width,
-                        'height': height,
-                        'area': bbox_width * bbox_height,
-                        'iscrowd': 0  # we set this to 0 as this means that no persons are close to each other
-                    }
-
-                    annotations.append(annotation)
-
-        json_dict = {
-            'info': info,
-            'licenses': licenses,
-            'categories': categories,
-            'images': images,
-            'annotations': annotations
+            file_names.append(file_name)
+            # image ids are the positions of the kept frames, starting at 1
+            image_id = len(file_names)
+
+            # CAVIAR frames are 384x288, which is used if the frame has not been extracted
+            image_sizes_of_frames.append(image_sizes.get(file_name, (384, 288)))
+
+            center_boxes.extend(boxes)
+            box_image_ids.extend([image_id] * len(boxes))
+
+            metrics.progress('convert ' + xml_file_name, image_id)
+
+        coco_annotations = self.__create_coco_annotations(info, licenses, categories, file_names,
+                                                          image_sizes_of_frames, center_boxes, box_image_ids)
+
+        # near duplicate frames are removed like the frames dropped by the frame_jump
+        if deduplication is not None:
+            with metrics.stage('deduplicate'):
+                frame_deduplicator = FrameDeduplicator(deduplication['hash_distance'], deduplication['box_iou'],
+                                                       source_directory + '/' + xml_file_name + '.frame_hashes.json')
+                keep = frame_deduplicator.select_images(coco_annotations, images_folder)
+                frame_deduplicator.save()
+
+                for file_name in coco_annotations.images['file_name'][~keep]:
+                    os.remove(images_folder + '/' + file_name)
+                coco_annotations = coco_annotations.select_images(keep)
+            metrics.count('duplicate_frames', int(np.count_nonzero(~keep)))
+
+        metrics.count('frames', coco_annotations.image_count)
+        metrics.count('boxes', coco_annotations.annotation_count)
+
+        json_path = source_directory + '/' + xml_file_name + '.json'
+        with metrics.stage('serialize'):
+            self.__write_annotations(coco_annotations, json_path, annotation_store)
+        metrics.count('bytes_written', os.path.getsize(json_path))
+
+    def __write_annotations(self, coco_annotations, json_path, annotation_store):
+        """
+        Writes a COCO JSON file, and the AnnotationStore next to it if annotation_store is True.
+        A store left by an earlier run is removed otherwise, so it never disagrees with the JSON file.
+        """
+
+        coco_annotations.write(json_path)
+
+        store_path = store_path_of(json_path)
+        if annotation_store:
+            AnnotationStore.write(coco_annotations, store_path)
+        elif os.path.isdir(store_path):
+            shutil.rmtree(store_path)
+
+    def __create_coco_annotations(self, info, licenses, categories, file_names, image_sizes, center_boxes,
+                                  box_image_ids):
+        """
+        Creates the columns of a converted CAVIAR dataset
+
+        :parameter file_names: the file names of the kept frames, whose image ids are their positions starting at 1
+        :parameter image_sizes: (width, height) tuple per kept frame
+        :parameter center_boxes: (center_x, center_y, width, height) tuple per box
+        :parameter box_image_ids: the image id of each box
+        :returns CocoAnnotations
+        """
+
+        image_sizes = np.array(image_sizes, dtype=np.int64).reshape(-1, 2)
+        images = {
+            'id': np.arange(1, len(file_names) + 1, dtype=np.int64),
+            'file_name': np.array(file_names, dtype=object),
+            'width': image_sizes[:, 0],
+            'height': image_sizes[:, 1],
+            'licence': np.ones(len(file_names), dtype=np.int64),
         }
 
-        json_data = json.dumps(json_dict)
+        bboxes = center_boxes_to_corner(center_boxes)
+        box_image_ids = np.array(box_image_ids, dtype=np.int64)
+        annotations = {
+            'id': np.arange(1, len(bboxes) + 1, dtype=np.int64),
+            'image_id': box_image_ids,
+            'category_id': np.zeros(len(bboxes), dtype=np.int64),
+            'bbox': bboxes,
+            # image ids start at 1, so the image of a box is at image id - 1
+            'width': images['width'][box_image_ids - 1],
+            'height': images['height'][box_image_ids - 1],
+            'area': box_areas(bboxes),
+            # we set this to 0 as this means that no persons are close to each other
+            'iscrowd': np.zeros(len(bboxes), dtype=np.int64)
+        }
 
-        with open(source_directory + '/' + xml_file_name + '.json', "w") as json_file:
-            json_file.write(json_data)
+        return CocoAnnotations(info, licenses, categories, images, annotations)
 
-        json_file.close()
+    def concatenate_datasets(self, source_folder, new_dataset_name, datasets, materialization='copy',
+                             annotation_store=False, image_resizer=None):
+        """
+        Concatenates converted datasets in source folder into a new dataset in source_folder/new_dataset_name
 
-    def __concatenate_datasets(self, source_folder, new_dataset_name, datasets):
+        :parameter datasets: names of the datasets to concatenate
+        :parameter materialization: how images are placed in the new dataset's folder, see ImageMaterializer
+        :parameter annotation_store: whether to also write the new dataset as an AnnotationStore
+        :parameter image_resizer: ImageResizer resizing the images of the new dataset, or None to keep them as they are
+        """
+
+        self.__concatenate_datasets(source_folder, new_dataset_name, datasets, ImageMaterializer(materialization),
+                                    image_resizer, annotation_store, PipelineMetrics('caviar'))
+
+    def __concatenate_datasets_if_changed(self, source_folder, new_dataset_name, datasets, image_materializer,
+                                          image_resizer, build_manifest, annotation_store, metrics):
+        """
+        Concatenates datasets, unless they have already been concatenated from the same datasets and parameters
+
+        :parameter build_manifest: BuildManifest used to skip the concatenation, or None to always concatenate
+        """
+
+        if build_manifest is None:
+            self.__concatenate_datasets(source_folder, new_dataset_name, datasets, image_materializer, image_resizer,
+                                        annotation_store, metrics)
+            return
+
+        # the images of the datasets are covered by the fingerprints of their extraction
+        parameters = {
+            'datasets': datasets,
+            'materialization': image_materializer.strategy,
+            'extract_fingerprints': [build_manifest.recorded_fingerprint('extract', dataset) for dataset in datasets]
+        }
+        if annotation_store:
+            parameters['annotation_store'] = True
+        if image_resizer is not None:
+            parameters['resize'] = image_resizer.parameters()
+        fingerprint = build_manifest.fingerprint([source_folder + '/' + dataset + '.json' for dataset in datasets],
+                                                 parameters)
+        output_path = source_folder + '/' + new_dataset_name + '/' + new_dataset_name + '.json'
+        output_paths = [output_path]
+        if annotation_store:
+            output_paths.append(store_path_of(output_path) + '/meta.json')
+
+        if build_manifest.is_up_to_date('concatenate', new_dataset_name, fingerprint, output_paths):
+            print('Dataset ' + new_dataset_name + ' is up to date')
+            return
+
+        build_manifest.invalidate('concatenate', new_dataset_name)
+        self.__concatenate_datasets(source_folder, new_dataset_name, datasets, image_materializer, image_resizer,
+                                    annotation_store, metrics)
+        build_manifest.record('concatenate', new_dataset_name, fingerprint)
+
+    def __package_split_if_changed(self, source_folder, split, shard_packager, build_manifest, metrics):
+        """
+        Packages a concatenated dataset as tar shards in source_folder/<split>_shards,
+        unless it has already been packaged from the same dataset and parameters
+
+        :parameter build_manifest: BuildManifest used to skip the packaging, or None to always package
+        """
+
+        json_path = source_folder + '/' + split + '/' + split + '.json'
+        output_folder = source_folder + '/' + split + '_shards'
+
+        fingerprint = None
+        if build_manifest is not None:
+            # the images of the dataset are covered by the fingerprint of its concatenation
+            parameters = {
+                'shard_size': shard_packager.shard_size,
+                'seed': shard_packager.seed,
+                'concatenate_fingerprint': build_manifest.recorded_fingerprint('concatenate', split)
+            }
+            fingerprint = build_manifest.fingerprint([json_path], parameters)
+
+            if build_manifest.is_up_to_date('package', split, fingerprint, [output_folder + '/index.json']):
+                print('Shards of ' + split + ' are up to date')
+                return
+
+            build_manifest.invalidate('package', split)
+
+        with metrics.stage('package'):
+            index = shard_packager.package(json_path, source_folder + '/' + split, output_folder, split)
+        metrics.count('shards', len(index['shards']))
+
+        if build_manifest is not None:
+            build_manifest.record('package', split, fingerprint)
+
+    def __concatenate_datasets(self, source_folder, new_dataset_name, datasets, image_materializer, image_resizer,
+                               annotation_store, metrics):
         """
         Concatenates datasets
+
+        :parameter image_materializer: the ImageMaterializer placing the images of the datasets in the new dataset
+        :parameter image_resizer: ImageResizer resizing the images of the new dataset, or None to keep them as they are
+        :parameter annotation_store: whether to also write the new dataset as an AnnotationStore
+        :parameter metrics: PipelineMetrics to time the concatenation, materialization and resizing in
         """
 
-        print('Beginning to concatenate dataset to create new dataset: ' + new_dataset_name)
+        with metrics.stage('concatenate'):
+            concatenated_annotations = self.__concatenate_annotations(source_folder, new_dataset_name, datasets,
+                                                                      metrics)
 
+        # copy or link images from datasets to one shared folder
         destination_folder = source_folder + '/' + new_dataset_name
+        with metrics.stage('materialize'):
+            for dataset in datasets:
+                path = source_folder + '/' + dataset
+                only_files = [path + '/' + file for file in os.listdir(path) if os.path.isfile(os.path.join(path, file))]
+                print('Materializing content of ' + path + ' in ' + destination_folder)
+                image_materializer.materialize_files(only_files, destination_folder)
+                metrics.count('images_materialized', len(only_files))
+
+        # the annotations are scaled along with the images, so they are written once both are final
+        if image_resizer is not None:
+            with metrics.stage('resize'):
+                print('Resizing images of ' + destination_folder)
+                concatenated_annotations = image_resizer.resize_images(concatenated_annotations, destination_folder)
+            metrics.count('images_resized', concatenated_annotations.image_count)
+
+        with metrics.stage('serialize'):
+            self.__write_annotations(concatenated_annotations,
+                                     destination_folder + '/' + new_dataset_name + '.json', annotation_store)
+
+    def __concatenate_annotations(self, source_folder, new_dataset_name, datasets, metrics):
+        """
+        Creates the folder of the new dataset, and concatenates the COCO JSON files of the datasets
+
+        :returns CocoAnnotations of the new dataset
+        """
+
+        print('Beginning to concatenate dataset to create new dataset: ' + new_dataset_name)
 
-        if not os.path.exists(destination_folder):
-            os.mkdir(destination_folder)
+        destination_folder = source_folder + '/' + new_dataset_name
 
-        # load the first dataset's json file
-        resulting_json_file = open(source_folder + '/' + datasets[0] + '.json')
-        to_be_resulting_json_data = json.load(resulting_json_file)
-        resulting_json_file.close()
+        # remove images of datasets that were in a previous version of the new dataset
+        if os.path.exists(destination_folder):
+            shutil.rmtree(destination_folder)
 
-        # Initial highest id values
-        highest_image_id = len(to_be_resulting_json_data['images'])
-        highest_annotation_id = len(to_be_resulting_json_data['annotations'])
+        os.mkdir(destination_folder)
 
-        # load rest of dataset's json files one at a time to concat their data with the first dataset
+        # the datasets are read into columns, and their ids are shifted by the datasets before them in one operation
+        dataset_annotations = []
         for dataset in datasets:
             print("Appending dataset " + dataset + " to " + new_dataset_name)
+            dataset_annotations.append(CocoAnnotations.load(source_folder + '/' + dataset + '.json'))
 
-            json_file_dataset = open(source_folder + '/' + dataset + '.json')
-            json_data_dataset = json.load(json_file_dataset)
+        # info, licenses and categories are shared by all the datasets, so they are taken from the first one
+        concatenated_annotations = CocoAnnotations.concatenate(dataset_annotations)
 
-            # Loop through lists to count up ids
-            for image in json_data_dataset['images']:
-                image_data_copy = image.copy()
-                image_data_copy['id'] = image['id'] + highest_image_id
+        metrics.count('images', concatenated_annotations.image_count)
+        metrics.count('annotations', concatenated_annotations.annotation_count)
 
-                to_be_resulting_json_data['images'].append(image_data_copy)
+        return concatenated_annotations
 
-            for annotation in json_data_dataset['annotations']:
-                annotation_data_copy = annotation.copy()
-                annotation_data_copy['id'] = annotation['id'] + highest_annotation_id
-                annotation_data_copy['image_id'] = annotation['image_id'] + highest_image_id
 
-                to_be_resulting_json_data['annotations'].append(annotation_data_copy)
+def is_frame_member(member):
+    """
+    :returns whether a member of a CAVIAR tar file is a frame
+    """
 
-            # Update highest id values
-            highest_image_id = highest_image_id + len(json_data_dataset['images'])
-            highest_annotation_id = highest_annotation_id + len(json_data_dataset['annotations'])
+    return member.isreg() and member.name[-8:-4] != '.ppm'
 
-            json_file_dataset.close()
 
-        resulting_json_data = json.dumps(to_be_resulting_json_data)
+class FrameNumberReader:
+    """
+    Reads the frame numbers of the frames of a CAVIAR tar file from their names, e.g. 42 from 'Browse2/br2gt00042.jpg'
 
-        with open(destination_folder + '/' + new_dataset_name + '.json', "w") as resulting_json_file:
-            resulting_json_file.write(resulting_json_data)
+    The frame number is the last digits of the file name, which has one digit per digit of the frame count of the XML
+    file. The tar file need not have as many frames as the XML file, so the names are checked, instead of frames being
+    given the numbers of other frames: the digits before the frame number, i.e. zero padding or the digits of the
+    dataset name, must be the same in every name, and no two frames may have the same number.
+    """
 
-        resulting_json_file.close()
+    def __init__(self, frame_count):
+        """
+        :parameter frame_count: the number of frames of the dataset, see CaviarXmlReader.read_frame_sampling
+        """
 
-        # copy images from datasets to one shared folder
-        for dataset in datasets:
-            path = source_folder + '/' + dataset
-            only_files = [file for file in os.listdir(path) if os.path.isfile(os.path.join(path, file))]
-            print('Copying content of ' + path + ' to ' + destination_folder)
-            for file in only_files:
-                shutil.copy(path + '/' + file, destination_folder)
+        self.digit_count = len(str(frame_count))
+        self.__leading_digits = None
+        self.__frame_numbers = set()
+
+    def frame_number(self, member_name):
+        """
+        :parameter member_name: the name of a frame member of the tar file, see is_frame_member
+        :returns the frame number, as in the XML file
+        :raises Exception if the name does not end in a frame number of digit count digits, or if the frame number has
+        more digits, or if another frame has the same number
+        """
+
+        # the file name without its folder, if the frames are inside a folder in the tar file, and without extension
+        file_stem = member_name.rsplit('/', 1)[-1][:-4]
+
+        digits = file_stem[-self.digit_count:]
+        if len(file_stem) < self.digit_count or not digits.isdigit():
+            raise Exception('The name of frame ' + member_name + ' does not end in a frame number of ' +
+                            str(self.digit_count) + ' digits')
+
+        name = file_stem[:-self.digit_count]
+        leading_digits = name[len(name.rstrip('0123456789')):]
+        if self.__leading_digits is None:
+            self.__leading_digits = leading_digits
+        elif leading_digits != self.__leading_digits:
+            raise Exception('The frame numbers of the tar file have more than the ' + str(self.digit_count) +
+                            ' digits of the frame count of the XML file, e.g. ' + member_name)
+
+        frame_number = int(digits)
+        if frame_number in self.__frame_numbers:
+            raise Exception('Frame number ' + str(frame_number) + ' of ' + member_name + ' is in the tar file twice')
+        self.__frame_numbers.add(frame_number)
+
+        return frame_number
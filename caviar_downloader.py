@@ -0,0 +1,162 @@
+import os
+import re
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from download_cache import file_sha256
+
+
+class CaviarDownloader:
+    """
+    Downloads files over a shared, pooled HTTP session, which several threads can download with at the same time
+
+    Every file is streamed in chunks to a '.part' file, which is renamed to its final name once its size has been
+    verified. If a transfer is interrupted, the next attempt resumes the '.part' file with an HTTP Range request.
+    If a DownloadCache is given, files are copied from it when it holds them, and added to it when they are downloaded
+    or had already been downloaded.
+    """
+
+    def __init__(self, max_workers=4, chunk_size=1024 * 1024, max_attempts=3, timeout=60, cache=None):
+        """
+        :parameter max_workers: the number of threads downloading at the same time, i.e. the size of the connection pool
+        :parameter chunk_size: the number of bytes read from the connection and written to disk at a time
+        :parameter max_attempts: the number of times a file is tried before its download fails
+        :parameter timeout: seconds to wait for the server to connect or send data
+        :parameter cache: DownloadCache shared with other runs and checkouts, or None to always download files
+        """
+
+        self.max_workers = max_workers
+        self.chunk_size = chunk_size
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self.cache = cache
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def download_file(self, url, file_name, destination_folder, sha256=None):
+        """
+        Downloads a file from specified url to destination folder, resuming a previously interrupted download
+
+        :parameter url: The URL of the file to download
+        :parameter file_name: The downloaded file's new name
+        :parameter destination_folder: The folder to save the file in
+        :parameter sha256: The expected hex SHA-256 of the file, or None if it is not known
+        :returns the number of bytes transferred, which is 0 if the file had already been downloaded or was cached
+        :raises IOError if the downloaded file, or the already downloaded file if a cache is given, does not have the
+        expected checksum
+        """
+
+        file_path = os.path.join(destination_folder, file_name)
+        if os.path.isfile(file_path):
+            print('Already downloaded ' + file_name)
+            if self.cache is not None:
+                # e.g. downloaded before the cache was configured, so other checkouts can copy it from the cache
+                with self.cache.lock(url):
+                    self.cache.add(url, file_path, sha256)
+            return 0
+
+        os.makedirs(destination_folder, exist_ok=True)
+
+        if self.cache is None:
+            return self.__download(url, file_name, file_path, sha256)
+
+        # other threads and processes downloading the same url wait, and then copy the file from the cache
+        with self.cache.lock(url):
+            if self.cache.copy_to(url, file_path, sha256):
+                print('Copied ' + file_name + ' from the download cache')
+                return 0
+
+            bytes_transferred = self.__download(url, file_name, file_path, sha256)
+            self.cache.add(url, file_path, sha256)
+
+        return bytes_transferred
+
+    def __download(self, url, file_name, file_path, sha256):
+        # the bytes received by every attempt, including failed ones. The size of the part file can not be used, as it
+        # is truncated when the server ignores the Range of a resumed download and sends the whole file
+        bytes_transferred = [0]
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                self.__download_to_part_file(url, file_name, file_path + '.part', bytes_transferred)
+                if sha256 is not None and file_sha256(file_path + '.part') != sha256:
+                    os.remove(file_path + '.part')
+                    raise IOError('Downloaded ' + file_name + ' does not have the expected checksum')
+                break
+            except (requests.RequestException, IOError) as e:
+                if attempt == self.max_attempts:
+                    raise
+                print('Retrying download of ' + file_name + ' after error: ' + str(e))
+
+        os.replace(file_path + '.part', file_path)
+
+        return bytes_transferred[0]
+
+    def __download_to_part_file(self, url, file_name, part_file_path, bytes_transferred):
+        """
+        Streams the file at url into part_file_path, continuing from the bytes already in part_file_path
+
+        :parameter bytes_transferred: one element list, which the number of bytes received is added to as they arrive
+
+        :raises IOError if the resulting file does not have the size announced by the server
+        """
+
+        downloaded_size = os.path.getsize(part_file_path) if os.path.isfile(part_file_path) else 0
+
+        headers = {}
+        if downloaded_size > 0:
+            headers['Range'] = 'bytes=' + str(downloaded_size) + '-'
+            print('Resuming download of ' + file_name + ' at byte ' + str(downloaded_size))
+        else:
+            print('Downloading ' + file_name)
+
+        with self.session.get(url, headers=headers, stream=True, allow_redirects=True,
+                              timeout=self.timeout) as response:
+            if response.status_code == 416:
+                # The requested range starts at or after the end of the file, i.e. the part file may be complete
+                expected_size = self.__total_size_from_content_range(response.headers.get('Content-Range'))
+                if expected_size is not None and expected_size == downloaded_size:
+                    return
+
+                os.remove(part_file_path)
+                raise IOError('Server rejected resuming ' + file_name + ', restarting download')
+
+            response.raise_for_status()
+
+            if response.status_code == 206:
+                expected_size = self.__total_size_from_content_range(response.headers.get('Content-Range'))
+                mode = 'ab'
+            else:
+                # The whole file is sent, either because nothing was downloaded yet or because the server ignored Range.
+                # Content-Length is the encoded size if the server compresses the transfer, so it is not used then
+                content_length = response.headers.get('Content-Length')
+                if content_length is not None and 'Content-Encoding' not in response.headers:
+                    expected_size = int(content_length)
+                else:
+                    expected_size = None
+                mode = 'wb'
+
+            with open(part_file_path, mode) as part_file:
+                for chunk in response.iter_content(chunk_size=self.chunk_size):
+                    part_file.write(chunk)
+                    bytes_transferred[0] = bytes_transferred[0] + len(chunk)
+
+        actual_size = os.path.getsize(part_file_path)
+        if expected_size is not None and actual_size != expected_size:
+            raise IOError('Downloaded ' + str(actual_size) + ' of ' + str(expected_size) + ' bytes of ' + file_name)
+
+    def __total_size_from_content_range(self, content_range):
+        """
+        Reads the total file size from a Content-Range header, e.g. 'bytes 100-199/1000' or 'bytes */1000'
+
+        :returns the total size, or None if it is unknown
+        """
+
+        if content_range is None:
+            return None
+
+        match = re.search(r'/(\d+)$', content_range)
+        return int(match.group(1)) if match else None
@@ -0,0 +1,159 @@
+import json
+import os
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+
+import requests
+
+CAVIAR_INDEX_URL = 'http://homepages.inf.ed.ac.uk/rbf/CAVIARDATA1/'
+
+
+class CaviarIndexParser(HTMLParser):
+    """
+    Collects the links inside the table cells of an HTML page
+
+    After feeding the page, cells holds a list per <td> element containing links,
+    of (link_text, absolute_url) tuples. Cells whose </td> is left out, as in hand written HTML, end at the next
+    <td>, </tr> or </table>, or at the end of the page.
+    """
+
+    def __init__(self, page_url):
+        """
+        :parameter page_url: the URL of the page, which relative links are resolved against
+        """
+
+        super().__init__()
+        self.page_url = page_url
+        self.cells = []
+
+        self.__cell_links = None
+        self.__link_url = None
+        self.__link_text = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'td':
+            self.__end_cell()
+            self.__cell_links = []
+        elif tag == 'a' and self.__cell_links is not None:
+            href = dict(attrs).get('href')
+            self.__link_url = urljoin(self.page_url, href) if href is not None else ''
+            self.__link_text = []
+
+    def handle_data(self, data):
+        if self.__link_text is not None:
+            self.__link_text.append(data)
+
+    def handle_endtag(self, tag):
+        if tag == 'a' and self.__link_text is not None:
+            self.__cell_links.append((' '.join(''.join(self.__link_text).split()), self.__link_url))
+            self.__link_url = None
+            self.__link_text = None
+        elif tag in ('td', 'tr', 'table'):
+            self.__end_cell()
+
+    def close(self):
+        super().close()
+        self.__end_cell()
+
+    def __end_cell(self):
+        if self.__cell_links:
+            self.cells.append(self.__cell_links)
+        self.__cell_links = None
+
+
+class CaviarIndex:
+    """
+    Lists the xml and tar files of the CAVIAR datasets, from the CAVIAR web page or from a local manifest
+
+    The page is fetched over plain HTTP and parsed with html.parser. The resulting list is saved in the manifest,
+    which is used instead of the web page on later runs, until the index is refreshed.
+    """
+
+    def __init__(self, manifest_path, url=CAVIAR_INDEX_URL):
+        """
+        :parameter manifest_path: the JSON file to save the list of files in
+        :parameter url: the URL of the CAVIAR web page
+        """
+
+        self.manifest_path = manifest_path
+        self.url = url
+
+    def load(self, refresh=False):
+        """
+        Gets CAVIAR dataset information, from the manifest if it exists, and otherwise from the web page
+
+        :parameter refresh: whether to fetch the web page even if the manifest exists
+        :returns [((xml_file_name, xml_file_url), (tar_file_name, tar_file_url))]
+        :raises Exception if the web page does not list any datasets
+        """
+
+        if not refresh and os.path.isfile(self.manifest_path):
+            with open(self.manifest_path) as manifest_file:
+                manifest = json.load(manifest_file)
+
+            return [((xml_file_name, xml_file_url), (tar_file_name, tar_file_url))
+                    for [[xml_file_name, xml_file_url], [tar_file_name, tar_file_url]] in manifest['datasets']]
+
+        print('Fetching CAVIAR index from ' + self.url)
+        response = requests.get(self.url, allow_redirects=True, timeout=60)
+        response.raise_for_status()
+
+        annotations_images_pairs = self.parse(response.text, response.url)
+        if not annotations_images_pairs:
+            # an empty manifest would be used by every later run, so nothing is saved
+            raise Exception('Found no datasets on ' + response.url)
+
+        self.save(annotations_images_pairs)
+
+        return annotations_images_pairs
+
+    def parse(self, html, page_url=None):
+        """
+        Finds the xml and tar file links of each table cell of the CAVIAR web page.
+        Cells that do not link to both an xml and a tar file are left out.
+
+        :parameter html: the HTML of the page
+        :parameter page_url: the URL of the page, defaults to the index URL
+        :returns [((xml_file_name, xml_file_url), (tar_file_name, tar_file_url))]
+        """
+
+        parser = CaviarIndexParser(page_url if page_url is not None else self.url)
+        parser.feed(html)
+        parser.close()
+
+        annotations_images_pairs = []
+
+        for cell_links in parser.cells:
+            xml_file_name = ''
+            xml_file_url = ''
+            tar_file_name = ''
+            tar_file_url = ''
+
+            for (file_name, url) in cell_links:
+                if file_name[-4:] == '.xml':
+                    xml_file_name = file_name
+                    xml_file_url = url
+
+                if file_name[-7:] == '.tar.gz':
+                    tar_file_name = file_name
+                    tar_file_url = url
+
+            if xml_file_name and tar_file_name:
+                annotations_images_pairs.append(((xml_file_name, xml_file_url), (tar_file_name, tar_file_url)))
+
+        return annotations_images_pairs
+
+    def save(self, annotations_images_pairs):
+        """
+        Saves the list of files as the manifest, replacing it atomically
+        """
+
+        manifest_folder = os.path.dirname(self.manifest_path)
+        if manifest_folder and not os.path.isdir(manifest_folder):
+            os.makedirs(manifest_folder)
+
+        temporary_path = self.manifest_path + '.tmp'
+        with open(temporary_path, 'w') as manifest_file:
+            json.dump({'url': self.url, 'datasets': annotations_images_pairs}, manifest_file, indent=2)
+
+        os.replace(temporary_path, self.manifest_path)
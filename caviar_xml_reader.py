@@ -0,0 +1,90 @@
+import xml.etree.ElementTree as ElementTree
+
+
+class CaviarXmlReader:
+    """
+    Streaming reader of CAVIAR ground truth XML files
+
+    The file is parsed incrementally, so only one <frame> element is held in memory at a time.
+    """
+
+    def __init__(self, xml_file_path):
+        """
+        :parameter xml_file_path: path of the CAVIAR ground truth XML file
+        """
+
+        self.xml_file_path = xml_file_path
+
+    def read_frames(self, frame_jump=0):
+        """
+        Yields the frames of the XML file one at a time, in file order
+
+        A frame is kept if the number of frames preceding it is frame_jump modulo frame_jump + 1,
+        i.e. the first frame_jump frames are dropped, then one is kept, then frame_jump are dropped, and so on.
+
+        :parameter frame_jump: the number of frames to drop between two kept frames
+        :returns generator of (frame_number, boxes) tuples, where boxes is a list of (xc, yc, w, h) tuples of floats
+        for kept frames, and None for dropped frames, whose objects are never read
+        """
+
+        remaining_jumps = frame_jump
+        keep_frame = False
+        root = None
+
+        for event, element in ElementTree.iterparse(self.xml_file_path, events=('start', 'end')):
+            if root is None:
+                root = element
+
+            if element.tag != 'frame':
+                continue
+
+            if event == 'start':
+                if remaining_jumps > 0:
+                    remaining_jumps = remaining_jumps - 1
+                    keep_frame = False
+                else:
+                    remaining_jumps = frame_jump
+                    keep_frame = True
+                continue
+
+            frame_number = int(element.get('number'))
+
+            if keep_frame:
+                yield frame_number, self.__read_boxes(element)
+            else:
+                yield frame_number, None
+
+            # free the processed frame, and drop the reference the root element keeps to it
+            element.clear()
+            root.clear()
+
+    def read_frame_sampling(self, frame_jump=0):
+        """
+        Reads the number of frames, and which of them are kept by the frame_jump
+
+        :parameter frame_jump: the number of frames to drop between two kept frames, see read_frames
+        :returns (frame_count, kept_frame_numbers) tuple, where kept_frame_numbers is a set of frame numbers
+        """
+
+        frame_count = 0
+        kept_frame_numbers = set()
+
+        for (frame_number, boxes) in self.read_frames(frame_jump):
+            frame_count = frame_count + 1
+            if boxes is not None:
+                kept_frame_numbers.add(frame_number)
+
+        return frame_count, kept_frame_numbers
+
+    def __read_boxes(self, frame_element):
+        """
+        Reads the boxes of the objects in a frame element. Boxes of groups are not included.
+
+        :returns list of (xc, yc, w, h) tuples
+        """
+
+        boxes = []
+        for box in frame_element.iterfind('objectlist/object/box'):
+            boxes.append((float(box.get('xc')), float(box.get('yc')), float(box.get('w')), float(box.get('h'))))
+
+        return boxes
@@ -0,0 +1,204 @@
+import argparse
+import sys
+
+# Only argparse is imported here. Every subcommand imports the modules it needs when it runs, so a command only pays
+# for its own dependencies, e.g. 'strip' never imports NumPy, and only 'caviar' imports requests.
+
+
+def _add_frame_arguments(parser):
+    parser.add_argument('--resize-scale', type=float, help='downscale the frames by this factor')
+    parser.add_argument('--image-format', choices=('jpg', 'png', 'webp'), help='transcode the frames to this format')
+    parser.add_argument('--image-quality', type=int, default=90, help='quality of JPEG and WebP frames')
+    parser.add_argument('--duplicate-hash-distance', type=int,
+                        help='drop frames whose perceptual hash differs from the last kept frame in at most this '
+                             'many bits, and whose boxes match its boxes')
+    parser.add_argument('--duplicate-box-iou', type=float, default=0.8)
+
+
+def _add_output_arguments(parser):
+    parser.add_argument('--frame-jump', type=int, default=19, help='the number of frames to skip between kept frames')
+    parser.add_argument('--materialization', choices=('copy', 'hardlink', 'symlink', 'reflink'), default='copy')
+    parser.add_argument('--no-build-cache', action='store_true', help='run all stages, even if they are up to date')
+    parser.add_argument('--metrics', help='JSON file to write timings and counters to')
+    parser.add_argument('--profile-stage', help='name of a stage to profile with cProfile')
+    parser.add_argument('--annotation-store', action='store_true', help='also write memory mapped annotation stores')
+    parser.add_argument('--shard-size', type=int, help='also package the outputs as tar shards of at most this size')
+    parser.add_argument('--shard-seed', type=int)
+    _add_frame_arguments(parser)
+
+
+def _run_caviar(arguments):
+    from caviar_dataset_converter import CaviarDatasetConverter
+
+    CaviarDatasetConverter().create_test_and_validation_datasets(
+        download_files='download' in arguments.stages, extract_files='extract' in arguments.stages,
+        convert_datasets='convert' in arguments.stages, frame_jump=arguments.frame_jump,
+        download_workers=arguments.download_workers, materialization=arguments.materialization,
+        workers=arguments.workers, split_seed=arguments.split_seed, use_build_cache=not arguments.no_build_cache,
+        refresh_index=arguments.refresh_index, metrics_path=arguments.metrics, profile_stage=arguments.profile_stage,
+        annotation_store=arguments.annotation_store, shard_size=arguments.shard_size, shard_seed=arguments.shard_seed,
+        train_ratio=arguments.train_ratio, split_by=arguments.split_by, virtual_splits=arguments.virtual_splits,
+        resize_scale=arguments.resize_scale, image_format=arguments.image_format,
+        image_quality=arguments.image_quality, duplicate_hash_distance=arguments.duplicate_hash_distance,
+        duplicate_box_iou=arguments.duplicate_box_iou, download_cache=arguments.download_cache,
+        download_cache_size=arguments.download_cache_size)
+
+
+def _run_atrium(arguments):
+    from atrium_dataset_converter import AtriumDatasetConverter
+
+    AtriumDatasetConverter().convert_dataset(
+        arguments.frame_jump, persist_index=arguments.persist_index, materialization=arguments.materialization,
+        use_build_cache=not arguments.no_build_cache, metrics_path=arguments.metrics,
+        profile_stage=arguments.profile_stage, annotation_store=arguments.annotation_store,
+        shard_size=arguments.shard_size, shard_seed=arguments.shard_seed, resize_scale=arguments.resize_scale,
+        image_format=arguments.image_format, image_quality=arguments.image_quality,
+        duplicate_hash_distance=arguments.duplicate_hash_distance, duplicate_box_iou=arguments.duplicate_box_iou)
+
+
+def _run_concat(arguments):
+    from coco_annotations import CocoAnnotations
+
+    coco_annotations = CocoAnnotations.concatenate([CocoAnnotations.load(input_path)
+                                                    for input_path in arguments.input_paths])
+    coco_annotations.write(arguments.output_path)
+
+    if arguments.annotation_store:
+        from annotation_store import AnnotationStore, store_path_of
+
+        AnnotationStore.write(coco_annotations, store_path_of(arguments.output_path))
+
+    print('Wrote ' + str(coco_annotations.image_count) + ' images and ' + str(coco_annotations.annotation_count) +
+          ' annotations to ' + arguments.output_path)
+
+
+def _run_rotate(arguments):
+    import rotate_images
+
+    rotate_images.run(arguments.image_dir, arguments.output_dir, arguments.angle, arguments.annotations_path,
+                      arguments.rotated_annotations_path, arguments.workers)
+
+
+def _run_draw(arguments):
+    import draw_bounding_boxes
+
+    draw_bounding_boxes.run(arguments.annotations_path, arguments.image_dir, arguments.output_dir,
+                            arguments.results_path, arguments.score_threshold, arguments.image_ids, arguments.workers)
+
+
+def _run_strip(arguments):
+    import remove_segmentation_lists
+
+    remove_segmentation_lists.run_arguments(arguments)
+
+
+def _run_evaluate(arguments):
+    import detection_evaluation
+
+    detection_evaluation.run_arguments(arguments)
+
+
+def _add_caviar_arguments(parser):
+    parser.add_argument('--stages', nargs='+', choices=('download', 'extract', 'convert'),
+                        default=['download', 'extract', 'convert'], help='the stages run for each dataset, all by default')
+    parser.add_argument('--download-workers', type=int, default=4)
+    parser.add_argument('--download-cache', help='folder of downloaded files shared with other checkouts and runs')
+    parser.add_argument('--download-cache-size', type=int, help='the maximum number of bytes of the download cache')
+    parser.add_argument('--workers', type=int, help='the number of datasets extracted and converted at a time')
+    parser.add_argument('--split-seed', type=int)
+    parser.add_argument('--refresh-index', action='store_true')
+    parser.add_argument('--train-ratio', type=float, default=0.7)
+    parser.add_argument('--split-by', choices=('sequences', 'frames', 'annotations'), default='sequences')
+    parser.add_argument('--virtual-splits', action='store_true')
+    _add_output_arguments(parser)
+
+
+def _add_atrium_arguments(parser):
+    parser.add_argument('--persist-index', action='store_true')
+    _add_output_arguments(parser)
+
+
+def _add_concat_arguments(parser):
+    parser.add_argument('output_path')
+    parser.add_argument('input_paths', nargs='+')
+    parser.add_argument('--annotation-store', action='store_true')
+
+
+def _add_rotate_arguments(parser):
+    parser.add_argument('image_dir')
+    parser.add_argument('output_dir')
+    parser.add_argument('--angle', type=int, default=-90, help='counterclockwise, a multiple of 90 degrees')
+    parser.add_argument('--annotations-path')
+    parser.add_argument('--rotated-annotations-path')
+    parser.add_argument('--workers', type=int)
+
+
+def _add_draw_arguments(parser):
+    parser.add_argument('annotations_path')
+    parser.add_argument('image_dir')
+    parser.add_argument('output_dir')
+    parser.add_argument('--results-path', help='COCO results file to draw instead of the ground truth')
+    parser.add_argument('--score-threshold', type=float, default=0.5)
+    parser.add_argument('--image-ids', type=int, nargs='+')
+    parser.add_argument('--workers', type=int)
+
+
+def _add_strip_arguments(parser):
+    import remove_segmentation_lists
+
+    remove_segmentation_lists.add_arguments(parser)
+
+
+def _add_evaluate_arguments(parser):
+    import detection_evaluation
+
+    detection_evaluation.add_arguments(parser)
+
+
+# (name, help, function adding the arguments, function running the command) of every subcommand
+COMMANDS = (
+    ('caviar', 'download, convert and split the CAVIAR datasets', _add_caviar_arguments, _run_caviar),
+    ('atrium', 'convert the Atrium dataset', _add_atrium_arguments, _run_atrium),
+    ('concat', 'concatenate COCO JSON files', _add_concat_arguments, _run_concat),
+    ('rotate', 'rotate images and their annotations', _add_rotate_arguments, _run_rotate),
+    ('draw', 'draw ground truth or detected boxes on images', _add_draw_arguments, _run_draw),
+    ('strip', 'transform a COCO JSON or results file in a single streaming pass', _add_strip_arguments, _run_strip),
+    ('evaluate', 'evaluate detections against a converted dataset', _add_evaluate_arguments, _run_evaluate),
+)
+
+
+def create_parser(command=None):
+    """
+    Creates the parser of the subcommands. As the arguments of some subcommands are defined by the modules running
+    them, only the arguments of the given command are added, so parsing does not import the other modules.
+
+    :parameter command: the subcommand to add the arguments of, or None to add the arguments of all subcommands
+    :returns the argparse parser, whose parsed arguments hold the function running the command in 'run'
+    """
+
+    parser = argparse.ArgumentParser(description='Converts the CAVIAR and Atrium datasets to COCO format, and works '
+                                                 'with COCO datasets')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    for (name, help_text, add_arguments, run) in COMMANDS:
+        subparser = subparsers.add_parser(name, help=help_text, description=help_text)
+        if command is None or command == name:
+            add_arguments(subparser)
+        subparser.set_defaults(run=run)
+
+    return parser
+
+
+def main(argv):
+    """
+    :parameter argv: the command line arguments, without the program name
+    """
+
+    # the subcommand is the first argument, unless only options like --help are given
+    command = argv[0] if argv and not argv[0].startswith('-') else None
+    arguments = create_parser(command).parse_args(argv)
+    arguments.run(arguments)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
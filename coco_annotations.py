@@ -0,0 +1,294 @@
+import json
+
+import numpy as np
+
+from coco_json_writer import CocoJsonWriter
+
+
+def center_boxes_to_corner(center_boxes):
+    """
+    Converts boxes given by their center to COCO boxes, given by their top left corner
+
+    :parameter center_boxes: (n, 4) array of [center_x, center_y, width, height] rows
+    :returns (n, 4) array of [top_left_x, top_left_y, width, height] rows
+    """
+
+    corner_boxes = np.array(center_boxes, dtype=np.float64).reshape(-1, 4)
+    corner_boxes[:, :2] = corner_boxes[:, :2] - corner_boxes[:, 2:] / 2
+
+    return corner_boxes
+
+
+def corner_points_to_boxes(corner_points):
+    """
+    Converts boxes given by their top left and bottom right corners to COCO boxes
+
+    :parameter corner_points: (n, 4) array of [top_left_x, top_left_y, bottom_right_x, bottom_right_y] rows
+    :returns (n, 4) array of [top_left_x, top_left_y, width, height] rows
+    """
+
+    boxes = np.array(corner_points, dtype=np.float64).reshape(-1, 4)
+    boxes[:, 2:] = boxes[:, 2:] - boxes[:, :2]
+
+    return boxes
+
+
+def box_areas(boxes):
+    """
+    :parameter boxes: (n, 4) array of COCO [x, y, width, height] rows
+    :returns array of the n box areas
+    """
+
+    return boxes[:, 2] * boxes[:, 3]
+
+
+def box_iou_matrix(boxes, other_boxes):
+    """
+    Computes the intersection over union of every pair of two sets of boxes
+
+    :parameter boxes: (n, 4) array of COCO [x, y, width, height] boxes
+    :parameter other_boxes: (m, 4) array of COCO boxes
+    :returns (n, m) array of IoUs
+    """
+
+    boxes = boxes[:, None, :]
+    other_boxes = other_boxes[None, :, :]
+
+    intersection_widths = np.minimum(boxes[..., 0] + boxes[..., 2], other_boxes[..., 0] + other_boxes[..., 2]) - \
+        np.maximum(boxes[..., 0], other_boxes[..., 0])
+    intersection_heights = np.minimum(boxes[..., 1] + boxes[..., 3], other_boxes[..., 1] + other_boxes[..., 3]) - \
+        np.maximum(boxes[..., 1], other_boxes[..., 1])
+    intersections = np.clip(intersection_widths, 0, None) * np.clip(intersection_heights, 0, None)
+
+    unions = boxes[..., 2] * boxes[..., 3] + other_boxes[..., 2] * other_boxes[..., 3] - intersections
+
+    return np.divide(intersections, unions, out=np.zeros(intersections.shape), where=unions > 0)
+
+
+class CocoAnnotations:
+    """
+    Columnar representation of a COCO dataset, holding images and annotations as NumPy arrays
+
+    images and annotations are dicts of field name -> array, with one row per image or annotation.
+    Numeric fields are 1D arrays, 'bbox' is an (n, 4) array, and other fields, e.g. 'file_name',
+    are object arrays. The fields are written in the order of the dicts, so a dataset that is
+    read and written again gives the same file.
+
+    Converters build the columns directly, and id remapping, box conversion and concatenation are array operations.
+    Records are only created when the dataset is written.
+
+    Usage:
+        dataset = CocoAnnotations.concatenate([CocoAnnotations.load(path) for path in paths])
+        dataset.write('merged.json')
+    """
+
+    def __init__(self, info, licenses, categories, images, annotations):
+        """
+        :parameter info: the COCO 'info' dict
+        :parameter licenses: list of COCO license dicts
+        :parameter categories: list of COCO category dicts
+        :parameter images: dict of field name -> array, which must include 'id'
+        :parameter annotations: dict of field name -> array, which must include 'id' and 'image_id'
+        """
+
+        self.info = info
+        self.licenses = licenses
+        self.categories = categories
+        self.images = images
+        self.annotations = annotations
+
+    @property
+    def image_count(self):
+        return len(self.images['id'])
+
+    @property
+    def annotation_count(self):
+        return len(self.annotations['id'])
+
+    @classmethod
+    def from_coco(cls, json_data):
+        """
+        Creates the columns of a COCO dataset from its records. The fields of a record list are those of its first
+        record, see records_to_columns.
+
+        :parameter json_data: the COCO dataset dict, as read by json.load
+        """
+
+        return cls(json_data['info'], json_data['licenses'], json_data['categories'],
+                   records_to_columns(json_data['images'], ('id', 'file_name', 'width', 'height')),
+                   records_to_columns(json_data['annotations'], ('id', 'image_id', 'category_id', 'bbox')))
+
+    @classmethod
+    def load(cls, file_path):
+        """
+        Reads a COCO JSON file into columns
+        """
+
+        with open(file_path) as json_file:
+            return cls.from_coco(json.load(json_file))
+
+    @classmethod
+    def concatenate(cls, datasets):
+        """
+        Concatenates datasets, whose ids are shifted by the number of images and annotations of the datasets before them.
+        Info, licenses and categories are taken from the first dataset. All datasets must have the same fields.
+
+        :parameter datasets: list of CocoAnnotations
+        :returns the concatenated CocoAnnotations
+        """
+
+        image_counts = np.array([dataset.image_count for dataset in datasets], dtype=np.int64)
+        annotation_counts = np.array([dataset.annotation_count for dataset in datasets], dtype=np.int64)
+
+        # offset of each dataset, repeated for each of its rows
+        image_offsets = np.concatenate(([0], np.cumsum(image_counts)[:-1]))
+        annotation_offsets = np.concatenate(([0], np.cumsum(annotation_counts)[:-1]))
+
+        images = concatenate_columns([dataset.images for dataset in datasets])
+        annotations = concatenate_columns([dataset.annotations for dataset in datasets])
+
+        images['id'] = images['id'] + np.repeat(image_offsets, image_counts)
+        annotations['id'] = annotations['id'] + np.repeat(annotation_offsets, annotation_counts)
+        annotations['image_id'] = annotations['image_id'] + np.repeat(image_offsets, annotation_counts)
+
+        first_dataset = datasets[0]
+        return cls(first_dataset.info, first_dataset.licenses, first_dataset.categories, images, annotations)
+
+    def select_images(self, image_mask):
+        """
+        Keeps some of the images and their annotations, and numbers the kept images and annotations from 1,
+        as the converters do
+
+        :parameter image_mask: boolean array with a row per image, of the images to keep
+        :returns the selected CocoAnnotations
+        """
+
+        image_mask = np.asarray(image_mask, dtype=bool)
+        image_rows = self.image_rows_of_annotations()
+        annotation_mask = image_mask[image_rows]
+
+        images = {field: values[image_mask] for (field, values) in self.images.items()}
+        annotations = {field: values[annotation_mask] for (field, values) in self.annotations.items()}
+
+        # the new id of each image is the number of kept images up to and including it
+        annotations['image_id'] = np.cumsum(image_mask)[image_rows[annotation_mask]]
+        images['id'] = np.arange(1, np.count_nonzero(image_mask) + 1, dtype=np.int64)
+        annotations['id'] = np.arange(1, np.count_nonzero(annotation_mask) + 1, dtype=np.int64)
+
+        return CocoAnnotations(self.info, self.licenses, self.categories, images, annotations)
+
+    def image_values_of_annotations(self, field_name):
+        """
+        Looks up an image field for every annotation, e.g. the width of the image each annotation belongs to
+
+        :returns array with a row per annotation
+        """
+
+        return self.images[field_name][self.image_rows_of_annotations()]
+
+    def image_rows_of_annotations(self):
+        """
+        :returns array of the row of the image of every annotation
+        """
+
+        image_ids = self.images['id']
+        order = np.argsort(image_ids, kind='stable')
+
+        return order[np.searchsorted(image_ids, self.annotations['image_id'], sorter=order)]
+
+    def image_records(self):
+        """
+        :returns generator of COCO image dicts
+        """
+
+        return columns_to_records(self.images)
+
+    def annotation_records(self):
+        """
+        :returns generator of COCO annotation dicts
+        """
+
+        return columns_to_records(self.annotations)
+
+    def write(self, file_path):
+        """
+        Writes the dataset as a COCO JSON file, see CocoJsonWriter. All images are written before the annotations,
+        so the annotations are written to the file directly instead of being spooled
+        """
+
+        with CocoJsonWriter(file_path, self.info, self.licenses, self.categories,
+                            spool_annotations=False) as json_writer:
+            for image in self.image_records():
+                json_writer.add_image(image)
+
+            for annotation in self.annotation_records():
+                json_writer.add_annotation(annotation)
+
+
+def records_to_columns(records, field_names):
+    """
+    Converts a list of record dicts to a dict of field name -> array
+
+    :parameter records: list of dicts. The fields are those of the first record, and are None in records without them
+    :parameter field_names: the fields of an empty record list
+    """
+
+    if records:
+        field_names = list(records[0])
+
+    columns = {}
+    for field_name in field_names:
+        # fields that some records lack are None in those rows
+        values = [record.get(field_name) for record in records]
+
+        if field_name == 'bbox':
+            columns[field_name] = np.array(values, dtype=np.float64).reshape(-1, 4)
+            continue
+
+        try:
+            column = np.array(values) if values else np.zeros(0, dtype=np.int64)
+        except ValueError:
+            # lists of different lengths, e.g. polygon segmentations, cannot be one array
+            column = None
+
+        if column is None or column.dtype.kind not in 'biuf' or column.ndim != 1:
+            # strings, lists such as segmentations, and mixed values are kept as Python objects
+            column = np.empty(len(values), dtype=object)
+            for (index, value) in enumerate(values):
+                column[index] = value
+
+        columns[field_name] = column
+
+    return columns
+
+
+def concatenate_columns(column_dicts):
+    """
+    Concatenates the arrays of each field of a list of column dicts, which must have the same fields.
+    Column dicts without rows are left out, as their fields are the defaults of records_to_columns.
+    """
+
+    column_dicts_with_rows = [columns for columns in column_dicts if len(next(iter(columns.values()))) > 0]
+    if not column_dicts_with_rows:
+        return dict(column_dicts[0])
+
+    return {field_name: np.concatenate([columns[field_name] for columns in column_dicts_with_rows])
+            for field_name in column_dicts_with_rows[0]}
+
+
+def columns_to_records(columns, chunk_size=10000):
+    """
+    Converts a dict of field name -> array to record dicts, with Python values and fields in column order
+
+    :parameter chunk_size: the number of rows converted to Python values at a time
+    :returns generator of dicts
+    """
+
+    field_names = list(columns)
+    row_count = len(columns[field_names[0]]) if field_names else 0
+
+    # tolist converts a chunk of a column to Python values at once, and bbox rows to lists, so only a chunk of rows
+    # is held as Python objects next to the columns
+    for start in range(0, row_count, chunk_size):
+        for values in zip(*(columns[field_name][start:start + chunk_size].tolist() for field_name in field_names)):
+            yield dict(zip(field_names, values))
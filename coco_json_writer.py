@@ -0,0 +1,121 @@
+import json
+import os
+import shutil
+
+
+class CocoJsonWriter:
+    """
+    Writes a COCO JSON annotation file incrementally
+
+    Images are written to the output file as soon as they are added. Annotations are spooled to a temporary
+    file next to the output, and appended after the images array when the writer is closed, as COCO files keep
+    all images before all annotations. Thus only one record at a time is held in memory.
+
+    A writer whose images are all added before its annotations, e.g. one writing a whole dataset, does not need the
+    spool file. With spool_annotations=False, annotations are written to the output file directly, and no image may be
+    added after the first annotation.
+
+    Usage:
+        with CocoJsonWriter('annotations.json', info, licenses, categories) as writer:
+            writer.add_image(image)
+            writer.add_annotation(annotation)
+    """
+
+    def __init__(self, file_path, info, licenses, categories, spool_annotations=True):
+        """
+        :parameter file_path: path of the COCO JSON file to create
+        :parameter info: the COCO 'info' dict
+        :parameter licenses: list of COCO license dicts
+        :parameter categories: list of COCO category dicts
+        :parameter spool_annotations: whether annotations may be added before the last image, which spools them to a
+        temporary file
+        """
+
+        self.file_path = file_path
+        self.spool_file_path = file_path + '.annotations.tmp' if spool_annotations else None
+        self.image_count = 0
+        self.annotation_count = 0
+
+        self.__json_file = open(file_path, 'w')
+        self.__spool_file = open(self.spool_file_path, 'w+') if spool_annotations else None
+        self.__images_closed = False
+
+        self.__json_file.write('{"info": ' + json.dumps(info) +
+                               ', "licenses": ' + json.dumps(licenses) +
+                               ', "categories": ' + json.dumps(categories) +
+                               ', "images": [')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+    def add_image(self, image):
+        """
+        Appends an image record to the images array of the output file
+        """
+
+        if self.__images_closed:
+            raise Exception('Images cannot be added after annotations to ' + self.file_path +
+                            ', unless annotations are spooled')
+
+        if self.image_count > 0:
+            self.__json_file.write(', ')
+        self.__json_file.write(json.dumps(image))
+        self.image_count = self.image_count + 1
+
+    def add_annotation(self, annotation):
+        """
+        Appends an annotation record to the annotations array of the output file
+        """
+
+        if self.__spool_file is None and not self.__images_closed:
+            self.__close_images()
+
+        annotation_file = self.__spool_file if self.__spool_file is not None else self.__json_file
+        if self.annotation_count > 0:
+            annotation_file.write(', ')
+        annotation_file.write(json.dumps(annotation))
+        self.annotation_count = self.annotation_count + 1
+
+    def close(self):
+        """
+        Closes the images array, appends the spooled annotations and closes the output file
+        """
+
+        if self.__json_file.closed:
+            return
+
+        if not self.__images_closed:
+            self.__close_images()
+        if self.__spool_file is not None:
+            self.__spool_file.seek(0)
+            shutil.copyfileobj(self.__spool_file, self.__json_file)
+        self.__json_file.write(']}')
+
+        self.__json_file.close()
+        if self.__spool_file is not None:
+            self.__spool_file.close()
+            os.remove(self.spool_file_path)
+
+    def discard(self):
+        """
+        Closes and removes both the output file and the spooled annotations, e.g. after a failed conversion
+        """
+
+        if self.__json_file.closed:
+            return
+
+        self.__json_file.close()
+        os.remove(self.file_path)
+        if self.__spool_file is not None:
+            self.__spool_file.close()
+            os.remove(self.spool_file_path)
+
+    def __close_images(self):
+        self.__json_file.write('], "annotations": [')
+        self.__images_closed = True
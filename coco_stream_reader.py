@@ -0,0 +1,178 @@
+import json
+
+# the top level arrays of COCO files that are read one record at a time
+STREAMED_KEYS = ('images', 'annotations')
+
+# the characters a JSON number can continue with
+NUMBER_CHARACTERS = frozenset('0123456789.eE+-')
+
+
+class CocoStreamReader:
+    """
+    Incremental reader of COCO JSON files, for files too large to load with json.load
+
+    The file is read in chunks, and the records of the 'images' and 'annotations' arrays are decoded one at a time, so
+    only one record and one chunk are held in memory. Other top level values, e.g. 'info' and 'categories', are decoded
+    whole. COCO results files, whose top level value is an array of detections, are read as a stream of annotations.
+
+    Usage:
+        reader = CocoStreamReader('train.json')
+        for (key, value) in reader.read_sections():
+            if key in STREAMED_KEYS:
+                for record in value:
+                    ...
+    """
+
+    def __init__(self, file_path, chunk_size=1024 * 1024):
+        """
+        :parameter file_path: path of the COCO JSON file
+        :parameter chunk_size: the number of characters read from the file at a time
+        """
+
+        self.file_path = file_path
+        self.chunk_size = chunk_size
+        # whether the file is a results file, known once read_sections has yielded its first section
+        self.is_results_file = False
+
+        self.__decoder = json.JSONDecoder()
+        self.__file = None
+        self.__buffer = ''
+        self.__position = 0
+        self.__end_of_file = False
+
+    def read_sections(self):
+        """
+        Yields the top level keys of the file in file order, with their values. The values of 'images' and
+        'annotations' are generators of their records, which are consumed before the next key is read.
+        For a results file a single ('annotations', generator) section is yielded.
+
+        :returns generator of (key, value) tuples
+        :raises Exception if the file is not a JSON object or array
+        """
+
+        with open(self.file_path) as self.__file:
+            self.__buffer = ''
+            self.__position = 0
+            self.__end_of_file = False
+
+            self.is_results_file = self.__peek() == '['
+            if self.is_results_file:
+                records = self.__read_array()
+                yield 'annotations', records
+                # read what the consumer left of the array
+                for _ in records:
+                    pass
+                return
+
+            self.__expect('{')
+            if self.__peek() == '}':
+                return
+
+            while True:
+                key = self.__read_value()
+                self.__expect(':')
+
+                if key in STREAMED_KEYS and self.__peek() == '[':
+                    records = self.__read_array()
+                    yield key, records
+                    for _ in records:
+                        pass
+                else:
+                    yield key, self.__read_value()
+
+                if self.__next_character() == '}':
+                    return
+
+    def __read_array(self):
+        self.__expect('[')
+        if self.__peek() == ']':
+            self.__next_character()
+            return
+
+        while True:
+            yield self.__read_value()
+
+            if self.__next_character() == ']':
+                return
+
+    def __read_value(self):
+        """
+        Decodes the next JSON value, reading more of the file until the value is complete
+        """
+
+        self.__skip_whitespace()
+        read_size = self.chunk_size
+
+        while True:
+            try:
+                (value, end) = self.__decoder.raw_decode(self.__buffer, self.__position)
+            except json.JSONDecodeError:
+                if self.__end_of_file:
+                    raise
+                end = None
+
+            # a number at the end of the buffer may continue in the next chunk, and the decoder also stops in the
+            # middle of a number whose fraction or exponent is cut off, e.g. at the '.' of '1.' when '25' comes next
+            if end is not None and (self.__end_of_file or
+                                    (end < len(self.__buffer) and self.__buffer[end] not in NUMBER_CHARACTERS)):
+                self.__position = end
+                return value
+
+            if not self.__read_chunk(read_size):
+                continue
+            # large values are completed in fewer, larger reads
+            read_size = read_size * 2
+
+    def __next_character(self):
+        """
+        Consumes the next non whitespace character, which must be one of ',', ']' and '}'
+
+        :returns the character
+        """
+
+        character = self.__peek()
+        if character not in (',', ']', '}'):
+            raise Exception('Unexpected ' + repr(character) + ' in ' + self.file_path)
+
+        self.__position = self.__position + 1
+        return character
+
+    def __expect(self, expected_character):
+        character = self.__peek()
+        if character != expected_character:
+            raise Exception('Expected ' + repr(expected_character) + ' but got ' + repr(character) + ' in ' +
+                            self.file_path)
+
+        self.__position = self.__position + 1
+
+    def __peek(self):
+        """
+        :returns the next non whitespace character without consuming it, or '' at the end of the file
+        """
+
+        self.__skip_whitespace()
+        return self.__buffer[self.__position:self.__position + 1]
+
+    def __skip_whitespace(self):
+        while True:
+            while self.__position < len(self.__buffer) and self.__buffer[self.__position] in ' \t\r\n':
+                self.__position = self.__position + 1
+
+            if self.__position < len(self.__buffer) or not self.__read_chunk(self.chunk_size):
+                return
+
+    def __read_chunk(self, read_size):
+        """
+        Appends a chunk of the file to the buffer, dropping the part of the buffer that has been consumed
+
+        :returns False at the end of the file
+        """
+
+        chunk = self.__file.read(read_size)
+        if chunk == '':
+            self.__end_of_file = True
+            return False
+
+        self.__buffer = self.__buffer[self.__position:] + chunk
+        self.__position = 0
+        return True
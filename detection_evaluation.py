@@ -0,0 +1,365 @@
+import argparse
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from coco_annotations import CocoAnnotations, box_iou_matrix
+from virtual_split import VirtualSplit
+
+DESCRIPTION = 'Evaluates detections against the ground truth of a converted dataset'
+
+# the IoU thresholds of the COCO evaluation, 0.5, 0.55, ..., 0.95
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+
+# recall values at which precision is sampled for the average precision, as in the COCO evaluation
+RECALL_THRESHOLDS = np.linspace(0.0, 1.0, 101)
+
+
+def run(ground_truth_path, results_path, iou_thresholds=IOU_THRESHOLDS, max_detections=100, per_sequence=False,
+        sequence_names=None, workers=None):
+    """
+    Evaluates detections against the ground truth of a converted dataset
+
+    Detections are matched to ground truth boxes per image and category, greedily in order of descending score,
+    like the COCO evaluation. Images are evaluated in parallel, and the matches of all images are combined into
+    precision/recall curves and an average precision per IoU threshold.
+
+    :parameter ground_truth_path: COCO JSON file written by one of the converters
+    :parameter results_path: COCO results file, a list of detections with 'image_id', 'category_id', 'bbox' and 'score'
+    :parameter iou_thresholds: the IoU thresholds at which detections count as matches
+    :parameter max_detections: the number of highest scoring detections per image and category that are evaluated
+    :parameter per_sequence: whether to also evaluate each sequence on its own, see sequence_of_file_name
+    :parameter sequence_names: the names of the sequences of the dataset, e.g. VirtualSplit.dataset_names,
+    or None to find them from the file names alone
+    :parameter workers: the number of processes evaluating images, defaults to the CPU count
+    :returns dict of the metrics of all images, see summarize, with a 'sequences' dict of sequence name -> metrics
+    if per_sequence is True
+    """
+
+    iou_thresholds = np.asarray(iou_thresholds, dtype=np.float64)
+
+    ground_truth = CocoAnnotations.load(ground_truth_path)
+    with open(results_path) as results_file:
+        results = json.load(results_file)
+
+    matches = evaluate_images(ground_truth, results, iou_thresholds, max_detections, workers)
+    metrics = summarize(matches, iou_thresholds)
+
+    if per_sequence:
+        image_sequences = np.array([sequence_of_file_name(file_name, sequence_names)
+                                    for file_name in ground_truth.images['file_name']], dtype=object)
+        sequence_by_image_id = dict(zip(ground_truth.images['id'].tolist(), image_sequences.tolist()))
+
+        detection_sequences = np.array([sequence_by_image_id.get(image_id, '')
+                                        for image_id in matches['image_ids'].tolist()], dtype=object)
+        ground_truth_sequences = np.array([sequence_by_image_id.get(image_id, '')
+                                           for image_id in matches['ground_truth_image_ids'].tolist()], dtype=object)
+
+        metrics['sequences'] = {}
+        for sequence in sorted(set(image_sequences.tolist())):
+            sequence_matches = select_matches(matches, detection_sequences == sequence,
+                                              ground_truth_sequences == sequence)
+            metrics['sequences'][sequence] = summarize(sequence_matches, iou_thresholds)
+
+    return metrics
+
+
+def sequence_of_file_name(file_name, sequence_names=None):
+    """
+    Finds the sequence of an image from its file name, which the converters name <sequence><frame number>.jpg
+
+    As sequence names may end in digits themselves, e.g. 'Fight4', the sequence is the longest of the sequence names
+    that the file name starts with. Without sequence names, or if none matches, it is the file name without extension
+    and trailing digits, e.g. 'Walk' for 'Walk1123.jpg', or '' for Atrium frames, which are named by their frame number.
+
+    :parameter sequence_names: list of the names of the sequences, or None
+    """
+
+    if sequence_names is not None:
+        matching_names = [name for name in sequence_names if file_name.startswith(name)]
+        if matching_names:
+            return max(matching_names, key=len)
+
+    return re.sub(r'\d+$', '', os.path.splitext(file_name)[0])
+
+
+def match_detections(ious, iou_thresholds):
+    """
+    Matches detections to ground truth boxes at every IoU threshold at once
+
+    Each detection, in order, is matched to the unmatched ground truth box it overlaps most,
+    if that overlap reaches the threshold.
+
+    :parameter ious: (detections, ground truth boxes) array of IoUs, with the detections in order of descending score
+    :parameter iou_thresholds: array of IoU thresholds
+    :returns (thresholds, detections) boolean array of which detections are true positives
+    """
+
+    (detection_count, ground_truth_count) = ious.shape
+    true_positives = np.zeros((len(iou_thresholds), detection_count), dtype=bool)
+    if ground_truth_count == 0:
+        return true_positives
+
+    threshold_indices = np.arange(len(iou_thresholds))
+    matched = np.zeros((len(iou_thresholds), ground_truth_count), dtype=bool)
+
+    for detection_index in range(detection_count):
+        # the IoUs of the unmatched ground truth boxes, per threshold
+        candidate_ious = np.where(matched, -1.0, ious[detection_index][None, :])
+        best_matches = candidate_ious.argmax(axis=1)
+        hits = candidate_ious[threshold_indices, best_matches] >= iou_thresholds
+
+        true_positives[hits, detection_index] = True
+        matched[threshold_indices[hits], best_matches[hits]] = True
+
+    return true_positives
+
+
+def evaluate_images(ground_truth, results, iou_thresholds=IOU_THRESHOLDS, max_detections=100, workers=None):
+    """
+    Matches the detections of every image and category to the ground truth, in parallel
+
+    :parameter ground_truth: CocoAnnotations of the ground truth
+    :parameter results: list of COCO result dicts
+    :returns dict of matches, see select_matches and summarize
+    """
+
+    tasks = _create_tasks(ground_truth, results, max_detections)
+
+    if workers == 1 or len(tasks) < 2:
+        chunk_matches = [_evaluate_tasks(tasks, iou_thresholds)]
+    else:
+        chunk_count = min(len(tasks), (workers or os.cpu_count() or 1) * 4)
+        chunks = [tasks[index::chunk_count] for index in range(chunk_count)]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunk_matches = list(executor.map(_evaluate_tasks, chunks, [iou_thresholds] * len(chunks)))
+
+    return {key: np.concatenate([matches[key] for matches in chunk_matches], axis=-1) for key in chunk_matches[0]}
+
+
+def select_matches(matches, detection_mask, ground_truth_mask):
+    """
+    Selects the matches of some of the images, e.g. of a sequence
+
+    :parameter detection_mask: boolean array of the detections to keep
+    :parameter ground_truth_mask: boolean array of the ground truth boxes to keep
+    """
+
+    selected_matches = {}
+    for (key, values) in matches.items():
+        mask = ground_truth_mask if key.startswith('ground_truth') else detection_mask
+        selected_matches[key] = values[..., mask]
+
+    return selected_matches
+
+
+def summarize(matches, iou_thresholds=IOU_THRESHOLDS):
+    """
+    Computes the precision/recall curves and average precision of matched detections
+
+    The average precision of a category is the mean interpolated precision at 101 recall values, as in the COCO
+    evaluation, and is averaged over the categories with ground truth boxes.
+
+    :returns dict of 'ap' (per IoU threshold), 'map' (mean over the IoU thresholds), 'ap50' and 'ap75' (if those are
+    among the thresholds), 'recall' (the highest recall per IoU threshold), 'precision_curve' (precision at the
+    recall values of RECALL_THRESHOLDS per IoU threshold), and the numbers of 'detections' and 'ground_truth' boxes
+    """
+
+    category_ids = np.unique(matches['ground_truth_category_ids'])
+
+    average_precisions = []
+    recalls = []
+    precision_curves = []
+    for category_id in category_ids:
+        category_mask = matches['category_ids'] == category_id
+        ground_truth_count = np.count_nonzero(matches['ground_truth_category_ids'] == category_id)
+
+        (precision_curve, recall) = precision_recall(matches['scores'][category_mask],
+                                                     matches['true_positives'][:, category_mask], ground_truth_count)
+        precision_curves.append(precision_curve)
+        average_precisions.append(precision_curve.mean(axis=1))
+        recalls.append(recall)
+
+    if category_ids.size > 0:
+        average_precision = np.mean(average_precisions, axis=0)
+        recall = np.mean(recalls, axis=0)
+        precision_curve = np.mean(precision_curves, axis=0)
+    else:
+        average_precision = np.zeros(len(iou_thresholds))
+        recall = np.zeros(len(iou_thresholds))
+        precision_curve = np.zeros((len(iou_thresholds), len(RECALL_THRESHOLDS)))
+
+    metrics = {
+        'iou_thresholds': np.round(iou_thresholds, 4).tolist(),
+        'ap': average_precision.tolist(),
+        'map': float(average_precision.mean()) if len(iou_thresholds) else 0.0,
+        'recall': recall.tolist(),
+        'precision_curve': precision_curve.tolist(),
+        'detections': int(len(matches['scores'])),
+        'ground_truth': int(len(matches['ground_truth_category_ids'])),
+    }
+
+    for (name, iou_threshold) in (('ap50', 0.5), ('ap75', 0.75)):
+        threshold_indices = np.flatnonzero(np.isclose(iou_thresholds, iou_threshold))
+        if threshold_indices.size > 0:
+            metrics[name] = float(average_precision[threshold_indices[0]])
+
+    return metrics
+
+
+def precision_recall(scores, true_positives, ground_truth_count):
+    """
+    Computes the interpolated precision/recall curve of the detections of a category, at every IoU threshold
+
+    :parameter scores: array of detection scores
+    :parameter true_positives: (thresholds, detections) boolean array
+    :parameter ground_truth_count: the number of ground truth boxes
+    :returns (precision_curve, recall) tuple, of the (thresholds, 101) precision at the values of RECALL_THRESHOLDS,
+    and the highest recall per threshold
+    """
+
+    threshold_count = true_positives.shape[0]
+    if ground_truth_count == 0 or len(scores) == 0:
+        return np.zeros((threshold_count, len(RECALL_THRESHOLDS))), np.zeros(threshold_count)
+
+    order = np.argsort(-scores, kind='mergesort')
+    true_positive_counts = np.cumsum(true_positives[:, order], axis=1)
+    false_positive_counts = np.cumsum(~true_positives[:, order], axis=1)
+
+    recall = true_positive_counts / ground_truth_count
+    precision = true_positive_counts / (true_positive_counts + false_positive_counts)
+
+    # the interpolated precision at a recall is the highest precision at that recall or above
+    interpolated_precision = np.maximum.accumulate(precision[:, ::-1], axis=1)[:, ::-1]
+
+    precision_curve = np.zeros((threshold_count, len(RECALL_THRESHOLDS)))
+    for threshold_index in range(threshold_count):
+        positions = np.searchsorted(recall[threshold_index], RECALL_THRESHOLDS, side='left')
+        reached = positions < recall.shape[1]
+        precision_curve[threshold_index, reached] = interpolated_precision[threshold_index, positions[reached]]
+
+    return precision_curve, recall[:, -1]
+
+
+def _create_tasks(ground_truth, results, max_detections):
+    """
+    Groups the ground truth boxes and detections by image and category
+
+    :returns list of (image_id, category_id, ground_truth_boxes, detection_boxes, detection_scores) tuples,
+    with the detections in order of descending score
+    """
+
+    ground_truth_boxes = {}
+    annotations = ground_truth.annotations
+    for (image_id, category_id, bbox) in zip(annotations['image_id'].tolist(), annotations['category_id'].tolist(),
+                                             annotations['bbox']):
+        ground_truth_boxes.setdefault((image_id, category_id), []).append(bbox)
+
+    detections = {}
+    for result in results:
+        detections.setdefault((result['image_id'], result['category_id']), []).append(result['bbox'] +
+                                                                                      [result['score']])
+
+    tasks = []
+    for key in set(ground_truth_boxes) | set(detections):
+        boxes = np.array(ground_truth_boxes.get(key, []), dtype=np.float64).reshape(-1, 4)
+
+        detection_rows = np.array(detections.get(key, []), dtype=np.float64).reshape(-1, 5)
+        detection_rows = detection_rows[np.argsort(-detection_rows[:, 4], kind='mergesort')][:max_detections]
+
+        tasks.append((key[0], key[1], boxes, detection_rows[:, :4], detection_rows[:, 4]))
+
+    return tasks
+
+
+def _evaluate_tasks(tasks, iou_thresholds):
+    """
+    Matches the detections of a chunk of images and categories
+
+    :returns dict of arrays: per detection its 'scores', 'image_ids', 'category_ids' and the (thresholds, detections)
+    'true_positives', and per ground truth box its 'ground_truth_image_ids' and 'ground_truth_category_ids'
+    """
+
+    scores = []
+    true_positives = []
+    image_ids = []
+    category_ids = []
+    ground_truth_image_ids = []
+    ground_truth_category_ids = []
+
+    for (image_id, category_id, ground_truth_boxes, detection_boxes, detection_scores) in tasks:
+        ious = box_iou_matrix(detection_boxes, ground_truth_boxes)
+
+        scores.append(detection_scores)
+        true_positives.append(match_detections(ious, iou_thresholds))
+        image_ids.append(np.full(len(detection_scores), image_id, dtype=np.int64))
+        category_ids.append(np.full(len(detection_scores), category_id, dtype=np.int64))
+        ground_truth_image_ids.append(np.full(len(ground_truth_boxes), image_id, dtype=np.int64))
+        ground_truth_category_ids.append(np.full(len(ground_truth_boxes), category_id, dtype=np.int64))
+
+    return {
+        'scores': np.concatenate(scores) if scores else np.zeros(0),
+        'true_positives': np.concatenate(true_positives, axis=1) if true_positives else
+        np.zeros((len(iou_thresholds), 0), dtype=bool),
+        'image_ids': np.concatenate(image_ids) if image_ids else np.zeros(0, dtype=np.int64),
+        'category_ids': np.concatenate(category_ids) if category_ids else np.zeros(0, dtype=np.int64),
+        'ground_truth_image_ids': np.concatenate(ground_truth_image_ids) if ground_truth_image_ids else
+        np.zeros(0, dtype=np.int64),
+        'ground_truth_category_ids': np.concatenate(ground_truth_category_ids) if ground_truth_category_ids else
+        np.zeros(0, dtype=np.int64),
+    }
+
+
+def print_metrics(name, metrics):
+    print('{:<24}{:>8.4f} mAP{:>8.4f} AP50{:>8.4f} AP75{:>8} detections{:>8} ground truth'.format(
+        name, metrics['map'], metrics.get('ap50', 0.0), metrics.get('ap75', 0.0), metrics['detections'],
+        metrics['ground_truth']))
+
+
+def add_arguments(parser):
+    """
+    Adds the arguments of the evaluation to an argparse parser, see run_arguments
+    """
+
+    parser.add_argument('ground_truth_path')
+    parser.add_argument('results_path')
+    parser.add_argument('--per-sequence', action='store_true', help='also evaluate each sequence on its own')
+    parser.add_argument('--sequences', nargs='+', help='the names of the sequences of the dataset')
+    parser.add_argument('--split-manifest', help='virtual split manifest to read the names of the sequences from')
+    parser.add_argument('--max-detections', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--output', help='JSON file to write the metrics to')
+
+
+def run_arguments(arguments):
+    """
+    Runs the evaluation given by arguments parsed by a parser that add_arguments was called on, and prints the metrics
+    """
+
+    sequence_names = arguments.sequences
+    if arguments.split_manifest is not None:
+        sequence_names = VirtualSplit(arguments.split_manifest).dataset_names
+
+    metrics = run(arguments.ground_truth_path, arguments.results_path, max_detections=arguments.max_detections,
+                  per_sequence=arguments.per_sequence, sequence_names=sequence_names, workers=arguments.workers)
+
+    print_metrics('all', metrics)
+    for (sequence, sequence_metrics) in metrics.get('sequences', {}).items():
+        print_metrics(sequence, sequence_metrics)
+
+    if arguments.output is not None:
+        with open(arguments.output, 'w') as output_file:
+            json.dump(metrics, output_file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=DESCRIPTION)
+    add_arguments(parser)
+    run_arguments(parser.parse_args())
+
+
+if __name__ == '__main__':
+    main()
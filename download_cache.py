@@ -0,0 +1,245 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # Windows has no fcntl, and locks files with msvcrt instead
+    fcntl = None
+    import msvcrt
+
+
+def file_sha256(file_path, chunk_size=1024 * 1024):
+    """
+    :returns the hex SHA-256 digest of the contents of a file
+    """
+
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as hashed_file:
+        for chunk in iter(lambda: hashed_file.read(chunk_size), b''):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+class DownloadCache:
+    """
+    Content addressed cache of downloaded files, which can be shared by several checkouts and runs on the same machine
+
+    Files are stored by the SHA-256 of their contents in objects/, and urls/ maps the SHA-256 of each URL to the
+    checksum and size of the file last downloaded from it. Files and records are written to temporary files and renamed
+    into place, and a download of a URL holds a lock file of the URL, so processes downloading the same URL wait for
+    the first one and then use its file. When max_size is given, the least recently used files are evicted once the
+    cache grows beyond it.
+
+    Usage:
+        cache = DownloadCache(os.path.expanduser('~/.cache/caviar'), max_size=5 * 1024 ** 3)
+        with cache.lock(url):
+            if not cache.copy_to(url, 'downloads/Walk1.xml'):
+                download(url, 'downloads/Walk1.xml')
+                cache.add(url, 'downloads/Walk1.xml')
+    """
+
+    def __init__(self, folder, max_size=None, verify=True):
+        """
+        :parameter folder: the folder of the cache, which is created if it does not exist
+        :parameter max_size: the maximum number of bytes of the cached files, or None for no maximum
+        :parameter verify: whether the checksum of a cached file is checked every time it is used. Its size is always
+        checked
+        """
+
+        self.folder = folder
+        self.max_size = max_size
+        self.verify = verify
+
+        for sub_folder in ('objects', 'urls', 'locks'):
+            os.makedirs(os.path.join(folder, sub_folder), exist_ok=True)
+
+    @contextmanager
+    def lock(self, url):
+        """
+        Holds an exclusive lock of a URL, across threads and processes, while the context is active
+        """
+
+        with self.__lock_file(os.path.join(self.folder, 'locks', _url_key(url) + '.lock')):
+            yield
+
+    def lookup(self, url, sha256=None):
+        """
+        Finds the cached file of a URL, or of a checksum
+
+        A file is found by its checksum if sha256 is given, whichever URL it was downloaded from, and otherwise by the
+        record of the URL. A cached file that fails verification is removed.
+
+        :parameter sha256: the expected hex SHA-256 of the file, or None if it is not known
+        :returns the path of the cached file, or None if it is not cached
+        """
+
+        if sha256 is None:
+            record = self.__read_record(url)
+            if record is None:
+                return None
+            (sha256, size) = (record['sha256'], record['size'])
+        else:
+            size = None
+
+        object_path = self.__object_path(sha256)
+        try:
+            actual_size = os.path.getsize(object_path)
+        except OSError:
+            return None
+
+        if (size is not None and actual_size != size) or (self.verify and file_sha256(object_path) != sha256):
+            print('Removing corrupt cached download of ' + url)
+            self.__remove(object_path)
+            return None
+
+        # the modification time of a file is the time it was last used, see evict
+        os.utime(object_path)
+        return object_path
+
+    def copy_to(self, url, destination_path, sha256=None):
+        """
+        Copies the cached file of a URL to destination path, see lookup. The copy is written to a temporary file that
+        is renamed to destination path when it is complete.
+
+        :returns True if the file was cached, False otherwise
+        """
+
+        object_path = self.lookup(url, sha256)
+        if object_path is None:
+            return False
+
+        temporary_path = destination_path + '.cache.tmp'
+        try:
+            shutil.copyfile(object_path, temporary_path)
+        except OSError:
+            # the file was evicted by another process since it was looked up
+            if os.path.isfile(temporary_path):
+                os.remove(temporary_path)
+            return False
+
+        os.replace(temporary_path, destination_path)
+        return True
+
+    def add(self, url, file_path, sha256=None):
+        """
+        Adds a downloaded file to the cache, and records it as the file of its URL
+
+        :parameter sha256: the expected hex SHA-256 of the file, or None if it is not known
+        :returns the hex SHA-256 of the file
+        :raises IOError if the file does not have the expected checksum
+        """
+
+        actual_sha256 = file_sha256(file_path)
+        if sha256 is not None and actual_sha256 != sha256:
+            raise IOError('Checksum of ' + file_path + ' is ' + actual_sha256 + ', expected ' + sha256)
+
+        # the url lock does not cover other urls with the same contents, so every write has its own temporary file
+        object_path = self.__object_path(actual_sha256)
+        if not os.path.isfile(object_path):
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            (file_descriptor, temporary_path) = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(object_path))
+            with os.fdopen(file_descriptor, 'wb') as object_file, open(file_path, 'rb') as downloaded_file:
+                shutil.copyfileobj(downloaded_file, object_file)
+            os.replace(temporary_path, object_path)
+        else:
+            os.utime(object_path)
+
+        record_path = self.__record_path(url)
+        (file_descriptor, temporary_path) = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(record_path))
+        with os.fdopen(file_descriptor, 'w') as record_file:
+            json.dump({'url': url, 'sha256': actual_sha256, 'size': os.path.getsize(object_path)}, record_file)
+        os.replace(temporary_path, record_path)
+
+        self.evict(keep_sha256=actual_sha256)
+
+        return actual_sha256
+
+    def evict(self, keep_sha256=None):
+        """
+        Removes the least recently used files until the cached files take at most max size bytes.
+        Records of URLs whose files are removed are left, and are treated as missing when they are looked up.
+
+        :parameter keep_sha256: checksum of a file that is not removed, e.g. the file that was just added
+        :returns the number of bytes removed
+        """
+
+        if self.max_size is None:
+            return 0
+
+        with self.__lock_file(os.path.join(self.folder, 'locks', 'evict.lock')):
+            # (last use, size, path) of every cached file
+            cached_files = []
+            for (folder_path, folder_names, file_names) in os.walk(os.path.join(self.folder, 'objects')):
+                for file_name in file_names:
+                    if file_name.endswith('.tmp'):
+                        continue
+                    try:
+                        stat = os.stat(os.path.join(folder_path, file_name))
+                    except OSError:
+                        continue
+                    cached_files.append((stat.st_mtime, stat.st_size, os.path.join(folder_path, file_name)))
+
+            cached_files.sort()
+            total_size = sum(size for (last_use, size, path) in cached_files)
+
+            removed_size = 0
+            for (last_use, size, path) in cached_files:
+                if total_size - removed_size <= self.max_size:
+                    break
+                if os.path.basename(path) == keep_sha256:
+                    continue
+
+                self.__remove(path)
+                removed_size = removed_size + size
+
+        return removed_size
+
+    def __object_path(self, sha256):
+        return os.path.join(self.folder, 'objects', sha256[:2], sha256)
+
+    def __record_path(self, url):
+        return os.path.join(self.folder, 'urls', _url_key(url) + '.json')
+
+    def __read_record(self, url):
+        try:
+            with open(self.__record_path(url)) as record_file:
+                record = json.load(record_file)
+        except (OSError, ValueError):
+            return None
+
+        # the key is a hash of the URL, which is compared in full in case of a collision
+        return record if record.get('url') == url else None
+
+    def __remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    @contextmanager
+    def __lock_file(self, lock_path):
+        with open(lock_path, 'a+') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+                else:
+                    lock_file.seek(0)
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _url_key(url):
+    return hashlib.sha256(url.encode('utf-8')).hexdigest()
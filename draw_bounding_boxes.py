@@ -1,63 +1,114 @@
 import json
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
 import cv2
 
+# image_id -> boxes index of the worker processes, set once per process by _init_worker
+_worker_boxes_by_image_id = None
+
+
+def run(annotations_path="./json_annotations/wk1gt_annotations.json", image_dir="./rotated_images/",
+        processed_images_dir="./processed_images_rotated/", results_path="./result_wider_caviar_rotated.json",
+        score_threshold=0.5, image_ids=None, workers=None):
+    """
+    Draws bounding boxes on the images of a COCO dataset, and saves the results in processed images dir
+
+    :parameter annotations_path: the COCO JSON file listing the images, and holding the ground truth annotations
+    :parameter image_dir: the folder to read the images from
+    :parameter processed_images_dir: the folder to write the images with boxes to
+    :parameter results_path: a COCO results file with detections to draw. If None, the ground truth is drawn instead
+    :parameter score_threshold: detections with a lower score are not drawn
+    :parameter image_ids: the ids of the images to draw. If None, all images are drawn
+    :parameter workers: the number of processes drawing images, defaults to the CPU count
+    """
+
+    json_data = load_json(annotations_path)
+
+    if results_path is None:
+        boxes_by_image_id = index_boxes_by_image_id(json_data['annotations'])
+    else:
+        boxes_by_image_id = index_boxes_by_image_id(load_json(results_path), score_threshold)
+
+    images = json_data['images']
+    if image_ids is not None:
+        image_ids = set(image_ids)
+        images = [image for image in images if image['id'] in image_ids]
+
+    if not os.path.isdir(processed_images_dir):
+        os.makedirs(processed_images_dir)
+
+    tasks = [(os.path.join(image_dir, image['file_name']), os.path.join(processed_images_dir, image['file_name']),
+              image['id']) for image in images]
+
+    # the index is sent to each worker once, instead of once per image
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(boxes_by_image_id,)) as executor:
+        for file_name in executor.map(_draw_image, tasks, chunksize=16):
+            print("Processed image " + file_name)
+
+    print("Done...")
+
 
-def run():
-    json_file = open("./json_annotations/wk1gt_annotations.json")
+def load_json(file_path):
+    json_file = open(file_path)
     json_data = json.load(json_file)
     json_file.close()
 
-    image_dir = "./rotated_images/"
-    processed_images_dir = "./processed_images_rotated/"
+    return json_data
 
-    # Copy images from images dir to processed_images dir
-    copy_images(image_dir, processed_images_dir, json_data)
 
-    # Loop through all images in dataset
-    for image in json_data['images']:
-        file_name = image['file_name']
-        print("Processing image " + file_name)
-        image_id = image['id']
-        file_path = processed_images_dir + file_name
-        image = cv2.imread(file_path)
+def index_boxes_by_image_id(annotations, score_threshold=None):
+    """
+    Groups the bounding boxes of annotations or detections by image id
 
-        # Draw boxes according to annotations for specified image
-        # draw_boxes(image, image_id, json_data)
-        draw_boxes_validation_result(image, image_id)
-        cv2.imwrite(file_path, image)
+    :parameter annotations: list of COCO annotations, or of COCO results, which have a 'score'
+    :parameter score_threshold: if given, annotations with a lower score are left out
+    :returns dict of image_id -> list of [x, y, w, h] bounding boxes
+    """
 
-    print("Done...")
+    boxes_by_image_id = {}
+    for annotation in annotations:
+        if score_threshold is not None and annotation['score'] < score_threshold:
+            continue
+
+        boxes_by_image_id.setdefault(annotation['image_id'], []).append(annotation['bbox'])
+
+    return boxes_by_image_id
 
 
 def copy_images(from_dir, to_dir, json_data):
     print("Copying images from " + from_dir + " to " + to_dir + "...")
     for image in json_data['images']:
         file_name = image['file_name']
-        image = cv2.imread(from_dir + file_name)
-        cv2.imwrite(to_dir + file_name, image)
+        shutil.copyfile(os.path.join(from_dir, file_name), os.path.join(to_dir, file_name))
 
 
-def draw_boxes(image, image_id, json_data):
-    for annotation in json_data['annotations']:
-        if annotation['image_id'] == image_id:
-            # x,y coordinates are center coordinates of box
-            # w,h is width and height of box
-            [x, y, w, h] = annotation['bbox']
-            cv2.rectangle(image, (int(x - w/2), int(y - h/2)), (int(x + w/2), int(y + h/2)), (255, 0, 0), 1)
+def draw_boxes(image, boxes):
+    for [x, y, w, h] in boxes:
+        # x,y coordinates are the top left corner of the box, as in COCO annotations and results
+        # w,h is width and height of box
+        cv2.rectangle(image, (int(x), int(y)), (int(x + w), int(y + h)), (255, 0, 0), 1)
 
 
-def draw_boxes_validation_result(image, image_id):
-    json_file = open("./result_wider_caviar_rotated.json")
-    json_data = json.load(json_file)
-    json_file.close()
+def _init_worker(boxes_by_image_id):
+    global _worker_boxes_by_image_id
+    _worker_boxes_by_image_id = boxes_by_image_id
+
+
+def _draw_image(task):
+    (source_path, destination_path, image_id) = task
+
+    image = cv2.imread(source_path)
+    if image is None:
+        raise Exception('Could not read image ' + source_path)
+
+    draw_boxes(image, _worker_boxes_by_image_id.get(image_id, []))
+    cv2.imwrite(destination_path, image)
+
+    return os.path.basename(destination_path)
 
-    for annotation in json_data:
-        if annotation['image_id'] == image_id:
-            # x,y coordinates are center coordinates of box
-            # w,h is width and height of box
-            [x, y, w, h] = annotation['bbox']
-            score = annotation['score']
-            if score >= 0.5:
-                cv2.rectangle(image, (int(x - w/2), int(y - h/2)), (int(x + w/2), int(y + h/2)), (255, 0, 0), 1)
 
-run()
\ No newline at end of file
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,89 @@
+import json
+import os
+import threading
+
+
+class FileStatCache:
+    """
+    Caches values computed from files, e.g. image sizes or hashes, by path, file size and modification time, so files
+    that have not changed since their value was cached are not read again
+
+    Entries are [size, mtime_ns, value] lists, where the value must be JSON serializable. The cache is a JSON file, which
+    is read when the cache is created and written by save, or a dict of entries stored inside another file. It can be
+    used by several threads at the same time.
+
+    Usage:
+        cache = FileStatCache('downloads/Walk1.image_metadata.json')
+        stat = os.stat(file_path)
+        size = cache.get(file_path, stat)
+        if size is None:
+            size = probe_image_size(file_path)
+            cache.set(file_path, stat, size)
+        cache.save()
+    """
+
+    def __init__(self, cache_path=None, entries=None):
+        """
+        :parameter cache_path: the JSON file to cache values in, or None to not cache them between runs,
+        or to store the entries in another file
+        :parameter entries: dict of file path -> entry to start from, instead of reading them from the cache file
+        """
+
+        self.cache_path = cache_path
+        self.__lock = threading.Lock()
+        self.__entries = dict(entries) if entries is not None else {}
+        self.__changed = False
+
+        if entries is None and cache_path is not None and os.path.isfile(cache_path):
+            with open(cache_path) as cache_file:
+                self.__entries = json.load(cache_file)
+
+    def get(self, file_path, stat):
+        """
+        :parameter stat: the os.stat result of the file
+        :returns the cached value, or None if the file has no value or has changed since its value was cached
+        """
+
+        with self.__lock:
+            entry = self.__entries.get(file_path)
+
+        # entries of another form, e.g. written by an older version, are not used
+        if isinstance(entry, list) and len(entry) == 3 and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+            return entry[2]
+
+        return None
+
+    def set(self, file_path, stat, value):
+        """
+        Caches the value of a file
+
+        :parameter stat: the os.stat result of the file when the value was computed
+        """
+
+        with self.__lock:
+            self.__entries[file_path] = [stat.st_size, stat.st_mtime_ns, value]
+            self.__changed = True
+
+    def entries(self):
+        """
+        :returns a copy of the dict of file path -> entry, e.g. to store it inside another file
+        """
+
+        with self.__lock:
+            return dict(self.__entries)
+
+    def save(self):
+        """
+        Writes the cache to the cache file, if anything has been cached since it was read
+        """
+
+        with self.__lock:
+            if self.cache_path is None or not self.__changed:
+                return
+
+            temporary_path = self.cache_path + '.tmp'
+            with open(temporary_path, 'w') as cache_file:
+                json.dump(self.__entries, cache_file)
+
+            os.replace(temporary_path, self.cache_path)
+            self.__changed = False
@@ -0,0 +1,195 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from coco_annotations import box_iou_matrix
+from file_stat_cache import FileStatCache
+
+# frames are hashed from a grayscale thumbnail of HASH_SIZE rows of HASH_SIZE + 1 pixels,
+# which gives HASH_SIZE * HASH_SIZE bits, see difference_hashes
+HASH_SIZE = 8
+
+
+def difference_hashes(thumbnails):
+    """
+    Computes the difference hashes of a batch of thumbnails, whose bits tell whether each pixel is brighter than its
+    left neighbour. Similar images have hashes that differ in few bits.
+
+    :parameter thumbnails: (n, HASH_SIZE, HASH_SIZE + 1) array of grayscale thumbnails
+    :returns array of n uint64 hashes
+    """
+
+    differences = thumbnails[:, :, 1:] > thumbnails[:, :, :-1]
+    hash_bytes = np.packbits(differences.reshape(len(thumbnails), HASH_SIZE * HASH_SIZE), axis=1)
+
+    return hash_bytes.view('>u8').reshape(-1).astype(np.uint64)
+
+
+def hamming_distances(hashes, other_hash):
+    """
+    :returns array of the number of bits each of the hashes differs from the other hash in
+    """
+
+    differences = np.bitwise_xor(np.asarray(hashes, dtype=np.uint64), np.uint64(other_hash))
+
+    return np.unpackbits(differences.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+def read_thumbnail(file_path):
+    """
+    Reads a frame as a grayscale thumbnail, decoding JPEGs at an eighth of their size
+
+    :returns (HASH_SIZE, HASH_SIZE + 1) array, or None if the frame cannot be read
+    """
+
+    import cv2
+
+    image = cv2.imread(file_path, cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if image is None:
+        return None
+
+    return cv2.resize(image, (HASH_SIZE + 1, HASH_SIZE), interpolation=cv2.INTER_AREA)
+
+
+class FrameDeduplicator:
+    """
+    Drops frames that show the same as the frame kept before them, to sample sequences by content instead of by stride
+
+    A frame is dropped if its perceptual hash differs from the hash of the last kept frame in at most hash_distance
+    bits, and its boxes match the boxes of the last kept frame, i.e. both frames have the same number of boxes and
+    every box overlaps a box of the other frame by at least box_iou. So frames of a static scene are dropped, while
+    frames where people move are kept. Frames are read and hashed in batches in parallel, and the hashes are cached
+    by path, file size and modification time.
+
+    Usage:
+        deduplicator = FrameDeduplicator(4, 0.8, 'downloads/Walk1.frame_hashes.json')
+        keep = deduplicator.select_frames(frame_paths, frame_boxes)
+        deduplicator.save()
+    """
+
+    def __init__(self, hash_distance=4, box_iou=0.8, cache_path=None, max_workers=8, batch_size=256):
+        """
+        :parameter hash_distance: the number of the 64 bits of the hashes two frames may differ in to be duplicates
+        :parameter box_iou: the IoU every box must have with a box of the other frame for two frames to be duplicates
+        :parameter cache_path: the JSON file to cache hashes in, or None to not cache them between runs
+        :parameter max_workers: the number of frames read at the same time
+        :parameter batch_size: the number of frames hashed at a time
+        """
+
+        self.hash_distance = hash_distance
+        self.box_iou = box_iou
+        self.cache_path = cache_path
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        self.__cache = FileStatCache(cache_path)
+
+    def parameters(self):
+        """
+        :returns dict of the parameters that determine which frames are dropped, e.g. for a BuildManifest fingerprint
+        """
+
+        return {'hash_distance': self.hash_distance, 'box_iou': self.box_iou}
+
+    def select_frames(self, file_paths, frame_boxes):
+        """
+        Selects the frames to keep, comparing every frame to the last kept frame before it. The first frame is always
+        kept, and so are frames that cannot be read.
+
+        :parameter file_paths: the paths of the frames, in order
+        :parameter frame_boxes: list of an (n, 4) array of the COCO boxes of each frame
+        :returns boolean array of the frames to keep
+        """
+
+        (hashes, hashed) = self.hash_files(file_paths)
+
+        keep = np.ones(len(file_paths), dtype=bool)
+        last_kept_index = None
+        for index in range(len(file_paths)):
+            if last_kept_index is not None and hashed[index] and hashed[last_kept_index] and \
+                    hamming_distances(hashes[index:index + 1], hashes[last_kept_index])[0] <= self.hash_distance and \
+                    self.__boxes_match(frame_boxes[index], frame_boxes[last_kept_index]):
+                keep[index] = False
+                continue
+
+            last_kept_index = index
+
+        return keep
+
+    def select_images(self, coco_annotations, image_folder):
+        """
+        Selects the images of a dataset to keep, see select_frames
+
+        :parameter coco_annotations: CocoAnnotations of the images in image folder, in frame order
+        :returns boolean array of the images to keep
+        """
+
+        # the boxes are grouped by image with one sort, and split at the boundaries of the images
+        image_rows = coco_annotations.image_rows_of_annotations()
+        order = np.argsort(image_rows, kind='stable')
+        box_counts = np.bincount(image_rows, minlength=coco_annotations.image_count)
+        frame_boxes = np.split(coco_annotations.annotations['bbox'][order], np.cumsum(box_counts)[:-1])
+
+        return self.select_frames([os.path.join(image_folder, file_name)
+                                   for file_name in coco_annotations.images['file_name']], frame_boxes)
+
+    def hash_files(self, file_paths):
+        """
+        Hashes frames, using the cache for frames that have not changed since they were cached
+
+        :returns (hashes, hashed) tuple of a uint64 array of the hashes, and a boolean array of which frames could be
+        hashed
+        """
+
+        hashes = np.zeros(len(file_paths), dtype=np.uint64)
+        hashed = np.zeros(len(file_paths), dtype=bool)
+        stats = [None] * len(file_paths)
+
+        uncached_indices = []
+        for (index, file_path) in enumerate(file_paths):
+            try:
+                stats[index] = os.stat(file_path)
+            except OSError:
+                continue
+
+            cached = self.__cache.get(file_path, stats[index])
+            if cached is not None:
+                hashes[index] = np.uint64(int(cached, 16))
+                hashed[index] = True
+            else:
+                uncached_indices.append(index)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for start in range(0, len(uncached_indices), self.batch_size):
+                batch_indices = uncached_indices[start:start + self.batch_size]
+                thumbnails = list(executor.map(read_thumbnail, [file_paths[index] for index in batch_indices]))
+
+                read_indices = [index for (index, thumbnail) in zip(batch_indices, thumbnails) if thumbnail is not None]
+                if not read_indices:
+                    continue
+
+                batch_hashes = difference_hashes(np.stack([thumbnail for thumbnail in thumbnails
+                                                           if thumbnail is not None]))
+                hashes[read_indices] = batch_hashes
+                hashed[read_indices] = True
+
+                for (index, frame_hash) in zip(read_indices, batch_hashes.tolist()):
+                    self.__cache.set(file_paths[index], stats[index], format(frame_hash, '016x'))
+
+        return hashes, hashed
+
+    def save(self):
+        """
+        Writes the cache to the cache file, if anything has been hashed since it was read
+        """
+
+        self.__cache.save()
+
+    def __boxes_match(self, boxes, other_boxes):
+        if len(boxes) != len(other_boxes):
+            return False
+        if len(boxes) == 0:
+            return True
+
+        ious = box_iou_matrix(boxes, other_boxes)
+        return ious.max(axis=1).min() >= self.box_iou and ious.max(axis=0).min() >= self.box_iou
@@ -0,0 +1,99 @@
+import errno
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+# ioctl request number of FICLONE on Linux, which makes dest_fd share the data blocks of src_fd
+FICLONE = 0x40049409
+
+STRATEGIES = ('copy', 'hardlink', 'symlink', 'reflink')
+
+
+class ImageMaterializer:
+    """
+    Places image files into a dataset folder by copying or linking them
+
+    Strategies:
+        'copy': copies the files (the default, and the fallback of the other strategies)
+        'hardlink': hard links the files, which requires source and destination to be on the same file system
+        'symlink': symbolic links to the absolute paths of the files
+        'reflink': copy-on-write clones of the files, on file systems that support it, e.g. Btrfs and XFS
+
+    With 'hardlink' and 'symlink' the dataset folder shares its images with the source folder,
+    so the images must not be modified in place afterwards.
+    """
+
+    def __init__(self, strategy='copy', max_workers=8):
+        """
+        :parameter strategy: one of 'copy', 'hardlink', 'symlink' and 'reflink'
+        :parameter max_workers: the number of files materialized at the same time
+        """
+
+        if strategy not in STRATEGIES:
+            raise Exception('Unknown materialization strategy "' + str(strategy) + '", must be one of ' +
+                            ', '.join(STRATEGIES))
+
+        self.strategy = strategy
+        self.max_workers = max_workers
+
+    def materialize_files(self, source_file_paths, destination_folder):
+        """
+        Materializes files into destination folder, keeping their file names
+
+        :parameter source_file_paths: paths of the files to materialize
+        :parameter destination_folder: the folder to place the files in
+        """
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            # consume the results, so errors are raised
+            for _ in executor.map(lambda source_file_path: self.materialize_file(source_file_path, destination_folder),
+                                  source_file_paths):
+                pass
+
+    def materialize_file(self, source_file_path, destination_folder):
+        """
+        Materializes a file into destination folder, falling back to copying if the strategy is not supported
+
+        :parameter source_file_path: path of the file to materialize
+        :parameter destination_folder: the folder to place the file in
+        """
+
+        destination_file_path = os.path.join(destination_folder, os.path.basename(source_file_path))
+
+        # like shutil.copy, an existing destination is replaced
+        if os.path.lexists(destination_file_path):
+            os.remove(destination_file_path)
+
+        try:
+            if self.strategy == 'hardlink':
+                os.link(source_file_path, destination_file_path)
+                return
+            if self.strategy == 'symlink':
+                os.symlink(os.path.abspath(source_file_path), destination_file_path)
+                return
+            if self.strategy == 'reflink':
+                self.__reflink(source_file_path, destination_file_path)
+                return
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.ENOTSUP, errno.EOPNOTSUPP, errno.EINVAL, errno.ENOTTY,
+                               errno.EMLINK):
+                raise
+            if os.path.lexists(destination_file_path):
+                os.remove(destination_file_path)
+
+        shutil.copy(source_file_path, destination_file_path)
+
+    def __reflink(self, source_file_path, destination_file_path):
+        """
+        Clones a file with the FICLONE ioctl
+
+        :raises OSError with errno ENOTSUP if cloning is not available on this platform
+        """
+
+        try:
+            import fcntl
+        except ImportError:
+            raise OSError(errno.ENOTSUP, 'reflinks are not supported on this platform')
+
+        with open(source_file_path, 'rb') as source_file, open(destination_file_path, 'wb') as destination_file:
+            fcntl.ioctl(destination_file.fileno(), FICLONE, source_file.fileno())
@@ -0,0 +1,171 @@
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+from file_stat_cache import FileStatCache
+
+# JPEG start of frame markers, which hold the image dimensions. 0xC4, 0xC8 and 0xCC are not frame markers
+JPEG_START_OF_FRAME_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+# JPEG markers that are not followed by a segment length
+JPEG_STANDALONE_MARKERS = {0x01, 0xD0, 0xD1, 0xD2, 0xD3, 0xD4, 0xD5, 0xD6, 0xD7, 0xD8}
+
+
+def probe_image_size(file_path):
+    """
+    Reads the dimensions of a JPEG, PNG or PPM/PGM/PBM image from its header, without decoding any pixels
+
+    :returns (width, height) tuple
+    :raises Exception if the file is not an image of a supported format, or its header is broken
+    """
+
+    with open(file_path, 'rb') as image_file:
+        signature = image_file.read(2)
+
+        if signature == b'\xff\xd8':
+            return _probe_jpeg_size(image_file, file_path)
+        if signature == b'\x89P':
+            return _probe_png_size(image_file, file_path)
+        if signature in (b'P1', b'P2', b'P3', b'P4', b'P5', b'P6'):
+            return _probe_pnm_size(image_file, file_path)
+
+    raise Exception('Unsupported image format of ' + file_path)
+
+
+def _probe_jpeg_size(image_file, file_path):
+    while True:
+        byte = image_file.read(1)
+        if byte == b'':
+            raise Exception('No start of frame marker in ' + file_path)
+        if byte != b'\xff':
+            continue
+
+        # markers may be preceded by any number of 0xFF fill bytes
+        marker = image_file.read(1)
+        while marker == b'\xff':
+            marker = image_file.read(1)
+        if marker == b'':
+            raise Exception('No start of frame marker in ' + file_path)
+
+        marker = marker[0]
+        if marker == 0x00 or marker in JPEG_STANDALONE_MARKERS:
+            continue
+
+        segment_length = struct.unpack('>H', image_file.read(2))[0]
+
+        if marker in JPEG_START_OF_FRAME_MARKERS:
+            # segment: precision (1 byte), height (2 bytes), width (2 bytes), ...
+            (height, width) = struct.unpack('>xHH', image_file.read(5))
+            return width, height
+
+        image_file.seek(segment_length - 2, os.SEEK_CUR)
+
+
+def _probe_png_size(image_file, file_path):
+    # rest of the 8 byte signature, followed by the IHDR chunk: length (4 bytes), type (4 bytes), width, height
+    header = image_file.read(22)
+    if len(header) < 22 or header[:6] != b'NG\r\n\x1a\n' or header[10:14] != b'IHDR':
+        raise Exception('Broken PNG header in ' + file_path)
+
+    (width, height) = struct.unpack('>II', header[14:22])
+    return width, height
+
+
+def _probe_pnm_size(image_file, file_path):
+    # the header is whitespace separated ASCII, where '#' starts a comment that runs to the end of the line
+    tokens = []
+    token = b''
+    in_comment = False
+    while len(tokens) < 2:
+        byte = image_file.read(1)
+        if byte == b'':
+            raise Exception('Broken PPM header in ' + file_path)
+
+        if in_comment:
+            in_comment = byte not in (b'\n', b'\r')
+        elif byte == b'#':
+            in_comment = True
+        elif byte.isspace():
+            if token:
+                tokens.append(int(token))
+                token = b''
+        else:
+            token = token + byte
+
+    return tokens[0], tokens[1]
+
+
+class ImageMetadataProbe:
+    """
+    Probes image dimensions in parallel, caching the results by path, file size and modification time
+
+    The cache is a JSON file, which is read when the probe is created and written by save, see FileStatCache.
+    """
+
+    def __init__(self, cache_path=None, max_workers=8):
+        """
+        :parameter cache_path: the JSON file to cache dimensions in, or None to not cache them between runs
+        :parameter max_workers: the number of files probed at the same time
+        """
+
+        self.cache_path = cache_path
+        self.max_workers = max_workers
+        self.__cache = FileStatCache(cache_path)
+
+    def probe_files(self, file_paths):
+        """
+        Probes the dimensions of image files. Files that cannot be probed, e.g. because they do not exist, are left out
+
+        :parameter file_paths: paths of the image files
+        :returns dict of file path -> (width, height)
+        """
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            sizes = executor.map(self.probe_file, file_paths)
+
+            return {file_path: size for (file_path, size) in zip(file_paths, sizes) if size is not None}
+
+    def probe_directory(self, folder):
+        """
+        Probes the dimensions of all images in a folder
+
+        :returns dict of file name -> (width, height)
+        """
+
+        file_names = [file.name for file in os.scandir(folder) if file.is_file()]
+        sizes = self.probe_files([os.path.join(folder, file_name) for file_name in file_names])
+
+        return {os.path.basename(file_path): size for (file_path, size) in sizes.items()}
+
+    def probe_file(self, file_path):
+        """
+        Probes the dimensions of an image file, using the cache if the file has not changed since it was cached
+
+        :returns (width, height) tuple, or None if the file cannot be probed
+        """
+
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+
+        cached = self.__cache.get(file_path, stat)
+        if cached is not None:
+            return cached[0], cached[1]
+
+        try:
+            (width, height) = probe_image_size(file_path)
+        except Exception as e:
+            print('Could not probe image size: ' + str(e))
+            return None
+
+        self.__cache.set(file_path, stat, [width, height])
+
+        return width, height
+
+    def save(self):
+        """
+        Writes the cache to the cache file, if anything has been probed since it was read
+        """
+
+        self.__cache.save()
@@ -0,0 +1,176 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from coco_annotations import CocoAnnotations, box_areas
+from image_metadata import probe_image_size
+
+# output formats and their file extensions
+FORMATS = {'jpg': '.jpg', 'png': '.png', 'webp': '.webp'}
+
+# JPEG decoders can decode at 1/2, 1/4 and 1/8 of the full size, skipping most of the work of decoding
+REDUCED_DECODING_FACTORS = (8, 4, 2)
+
+
+class ImageResizer:
+    """
+    Downscales and/or transcodes the images of a dataset folder, and scales the dataset's annotations to match
+
+    Images are decoded at a reduced size where the scale allows it, so JPEG frames are not fully decoded only to be
+    shrunk, and the rest of the scaling is done with area interpolation. Images are processed in parallel worker
+    processes. Every image is written to a temporary file which then replaces it, so linked images, see
+    ImageMaterializer, are replaced by resized files and their sources are left as they are.
+
+    Usage:
+        coco_annotations = ImageResizer(0.5, 'jpg', 85).resize_images(coco_annotations, 'val')
+    """
+
+    def __init__(self, scale=None, image_format=None, quality=90, workers=None):
+        """
+        :parameter scale: the factor the width and height of the images are multiplied by, at most 1,
+        or None to keep their size
+        :parameter image_format: the format to write, one of 'jpg', 'png' and 'webp', or None to keep the format
+        :parameter quality: the quality of written JPEG and WebP images, from 0 to 100. PNG images are lossless
+        :parameter workers: the number of images resized at the same time, defaults to the CPU count
+        """
+
+        if scale is not None and not 0 < scale <= 1:
+            raise Exception('The resize scale must be larger than 0 and at most 1, got ' + str(scale))
+        if image_format is not None and image_format not in FORMATS:
+            raise Exception('Unknown image format "' + str(image_format) + '", must be one of ' + ', '.join(FORMATS))
+
+        self.scale = scale
+        self.image_format = image_format
+        self.quality = quality
+        self.workers = workers
+
+    def parameters(self):
+        """
+        :returns dict of the parameters that determine the resized images, e.g. for a BuildManifest fingerprint
+        """
+
+        return {'scale': self.scale, 'image_format': self.image_format, 'quality': self.quality}
+
+    def resize_images(self, coco_annotations, image_folder):
+        """
+        Resizes the images of a dataset in place, and scales its annotations in the same pass
+
+        The 'width' and 'height' of the images and annotations become the size of the resized images, and the 'bbox'
+        and 'area' of the annotations are scaled by the factors the width and height of their image changed by.
+        If the format changes, the file names get the extension of the new format, and the old files are removed.
+
+        :parameter coco_annotations: CocoAnnotations of the images in image folder
+        :parameter image_folder: the folder holding the images
+        :returns CocoAnnotations of the resized images
+        """
+
+        file_names = coco_annotations.images['file_name']
+        new_file_names = np.array([self.__new_file_name(file_name) for file_name in file_names], dtype=object)
+
+        source_paths = [os.path.join(image_folder, file_name) for file_name in file_names]
+        destination_paths = [os.path.join(image_folder, file_name) for file_name in new_file_names]
+
+        count = len(source_paths)
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            sizes = list(executor.map(resize_image, source_paths, destination_paths, [self.scale] * count,
+                                      [self.quality] * count, chunksize=16))
+
+        # (original width, original height, width, height) per image
+        sizes = np.array(sizes, dtype=np.int64).reshape(-1, 4)
+
+        images = dict(coco_annotations.images)
+        images['file_name'] = new_file_names
+        if 'width' in images:
+            images['width'] = sizes[:, 2]
+        if 'height' in images:
+            images['height'] = sizes[:, 3]
+
+        # the scale factors of the images, per annotation
+        annotation_rows = coco_annotations.image_rows_of_annotations()
+        x_scales = (sizes[:, 2] / sizes[:, 0])[annotation_rows]
+        y_scales = (sizes[:, 3] / sizes[:, 1])[annotation_rows]
+
+        annotations = dict(coco_annotations.annotations)
+        if 'bbox' in annotations:
+            bboxes = annotations['bbox'] * np.stack([x_scales, y_scales, x_scales, y_scales], axis=1)
+            annotations['bbox'] = bboxes
+            if 'area' in annotations:
+                annotations['area'] = box_areas(bboxes)
+        elif 'area' in annotations:
+            annotations['area'] = annotations['area'] * x_scales * y_scales
+        if 'width' in annotations:
+            annotations['width'] = sizes[annotation_rows, 2]
+        if 'height' in annotations:
+            annotations['height'] = sizes[annotation_rows, 3]
+
+        return CocoAnnotations(coco_annotations.info, coco_annotations.licenses, coco_annotations.categories, images,
+                               annotations)
+
+    def __new_file_name(self, file_name):
+        if self.image_format is None:
+            return file_name
+
+        return os.path.splitext(file_name)[0] + FORMATS[self.image_format]
+
+
+def reduced_decoding_factor(scale):
+    """
+    :returns the largest factor a JPEG can be reduced by while decoding, which is not smaller than the scale, or 1
+    """
+
+    for factor in REDUCED_DECODING_FACTORS:
+        if scale * factor <= 1:
+            return factor
+
+    return 1
+
+
+def resize_image(source_path, destination_path, scale, quality):
+    """
+    Resizes and/or transcodes an image, replacing the destination path, and removing the source if it is another file
+
+    The format is given by the extension of the destination path.
+
+    :returns (original_width, original_height, width, height) tuple
+    :raises Exception if the image can not be read or written
+    """
+
+    import cv2
+
+    (original_width, original_height) = probe_image_size(source_path)
+    if scale is None:
+        (width, height) = (original_width, original_height)
+    else:
+        (width, height) = (max(1, round(original_width * scale)), max(1, round(original_height * scale)))
+
+    is_jpeg = os.path.splitext(source_path)[1].lower() in ('.jpg', '.jpeg')
+    factor = reduced_decoding_factor(scale) if scale is not None and is_jpeg else 1
+    read_flags = {8: cv2.IMREAD_REDUCED_COLOR_8, 4: cv2.IMREAD_REDUCED_COLOR_4, 2: cv2.IMREAD_REDUCED_COLOR_2,
+                  1: cv2.IMREAD_COLOR}
+
+    image = cv2.imread(source_path, read_flags[factor])
+    if image is None:
+        raise Exception('Could not read image ' + source_path)
+
+    if image.shape[1] != width or image.shape[0] != height:
+        image = cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+
+    extension = os.path.splitext(destination_path)[1].lower()
+    if extension in ('.jpg', '.jpeg'):
+        write_parameters = [cv2.IMWRITE_JPEG_QUALITY, quality]
+    elif extension == '.webp':
+        write_parameters = [cv2.IMWRITE_WEBP_QUALITY, quality]
+    else:
+        write_parameters = []
+
+    # the temporary file keeps the extension, which tells OpenCV the format to write
+    temporary_path = os.path.splitext(destination_path)[0] + '.tmp' + extension
+    if not cv2.imwrite(temporary_path, image, write_parameters):
+        raise Exception('Could not write image ' + destination_path)
+
+    os.replace(temporary_path, destination_path)
+    if os.path.abspath(source_path) != os.path.abspath(destination_path):
+        os.remove(source_path)
+
+    return original_width, original_height, width, height
@@ -0,0 +1,217 @@
+import cProfile
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+class PipelineMetrics:
+    """
+    Collects timings and counters of a conversion run, and reports progress at a limited rate
+
+    Stages are timed with the stage context manager, which also records a trace event per call, so the metrics file can
+    be opened in a trace viewer such as chrome://tracing or Perfetto. Counters are increased with count.
+    Metrics collected in worker processes are combined with merge, see worker_options and summary.
+
+    Usage:
+        metrics = PipelineMetrics('caviar', metrics_path='metrics.json', profile_stage='convert')
+        with metrics.stage('convert'):
+            for frame in frames:
+                metrics.count('frames')
+                metrics.progress('convert', frames_done, frame_count)
+        metrics.write()
+    """
+
+    def __init__(self, name, metrics_path=None, progress_interval=2.0, profile_stage=None, profile_folder='profiles'):
+        """
+        :parameter name: name of the run, e.g. the converter
+        :parameter metrics_path: the JSON file to write metrics and trace events to, or None to not write them
+        :parameter progress_interval: minimum number of seconds between two progress lines of the same stage
+        :parameter profile_stage: name of a stage to run under cProfile, or None to not profile
+        :parameter profile_folder: the folder to write the profiles of profile_stage to, one .prof file per call
+        """
+
+        self.name = name
+        self.metrics_path = metrics_path
+        self.progress_interval = progress_interval
+        self.profile_stage = profile_stage
+        self.profile_folder = profile_folder
+
+        self.__lock = threading.Lock()
+        self.__start_time = time.time()
+        self.__stage_seconds = {}
+        self.__stage_calls = {}
+        self.__counters = {}
+        self.__trace_events = []
+        self.__last_progress_times = {}
+        self.__profile_count = 0
+        self.__profiling = False
+
+    def worker_options(self):
+        """
+        :returns picklable dict of keyword arguments, which worker processes create their own PipelineMetrics with
+        """
+
+        return {
+            'name': self.name,
+            'progress_interval': self.progress_interval,
+            'profile_stage': self.profile_stage,
+            'profile_folder': self.profile_folder,
+        }
+
+    @contextmanager
+    def stage(self, stage_name, trace=True):
+        """
+        Times the code in the with block as a call of a stage
+
+        :parameter trace: whether to record a trace event for the call. Turn off for stages entered per frame
+        """
+
+        # only one profiler can be active at a time, so concurrent calls of the stage in other threads are not profiled
+        profile = None
+        if stage_name == self.profile_stage:
+            with self.__lock:
+                if not self.__profiling:
+                    self.__profiling = True
+                    profile = cProfile.Profile()
+            if profile is not None:
+                profile.enable()
+
+        start_time = time.time()
+        start_counter = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start_counter
+
+            if profile is not None:
+                profile.disable()
+                self.__save_profile(profile, stage_name)
+                with self.__lock:
+                    self.__profiling = False
+
+            self.add_time(stage_name, seconds)
+            if trace:
+                with self.__lock:
+                    self.__trace_events.append({
+                        'name': stage_name, 'cat': self.name, 'ph': 'X', 'pid': os.getpid(),
+                        'tid': threading.get_ident(), 'ts': start_time * 1000000, 'dur': seconds * 1000000
+                    })
+
+    def time_iterator(self, stage_name, iterable):
+        """
+        Yields the items of an iterable, timing the production of each item as a call of a stage,
+        e.g. to separate the time spent parsing a file from the time spent on the parsed items
+        """
+
+        iterator = iter(iterable)
+        while True:
+            start_counter = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add_time(stage_name, time.perf_counter() - start_counter)
+                return
+
+            self.add_time(stage_name, time.perf_counter() - start_counter)
+            yield item
+
+    def add_time(self, stage_name, seconds, calls=1):
+        with self.__lock:
+            self.__stage_seconds[stage_name] = self.__stage_seconds.get(stage_name, 0.0) + seconds
+            self.__stage_calls[stage_name] = self.__stage_calls.get(stage_name, 0) + calls
+
+    def count(self, counter_name, amount=1):
+        with self.__lock:
+            self.__counters[counter_name] = self.__counters.get(counter_name, 0) + amount
+
+    def progress(self, stage_name, done, total=None):
+        """
+        Prints the progress of a stage. Apart from the call where done reaches total,
+        progress of a stage is printed at most once every progress_interval seconds
+
+        :parameter done: the number of items that are done
+        :parameter total: the total number of items, if known
+        """
+
+        now = time.time()
+        finished = total is not None and done >= total
+
+        with self.__lock:
+            last_progress_time = self.__last_progress_times.get(stage_name)
+            if last_progress_time is None:
+                # the first call only starts the clock, so short stages do not print anything until they finish
+                self.__last_progress_times[stage_name] = now
+                if not finished:
+                    return
+            elif not finished and now - last_progress_time < self.progress_interval:
+                return
+
+            self.__last_progress_times[stage_name] = now
+
+        print(stage_name + ': ' + str(done) + ('' if total is None else '/' + str(total)))
+
+    def merge(self, summary):
+        """
+        Adds the timings, counters and trace events of another PipelineMetrics, e.g. from a worker process
+
+        :parameter summary: dict returned by the other PipelineMetrics' summary
+        """
+
+        for (stage_name, stage) in summary['stages'].items():
+            self.add_time(stage_name, stage['seconds'], stage['calls'])
+
+        for (counter_name, amount) in summary['counters'].items():
+            self.count(counter_name, amount)
+
+        with self.__lock:
+            self.__trace_events.extend(summary['traceEvents'])
+
+    def summary(self):
+        """
+        :returns JSON serializable dict of stage timings, counters and trace events
+        """
+
+        with self.__lock:
+            return {
+                'name': self.name,
+                'wall_seconds': time.time() - self.__start_time,
+                'stages': {stage_name: {'seconds': seconds, 'calls': self.__stage_calls[stage_name]}
+                           for (stage_name, seconds) in self.__stage_seconds.items()},
+                'counters': dict(self.__counters),
+                'traceEvents': list(self.__trace_events),
+            }
+
+    def print_summary(self):
+        summary = self.summary()
+
+        print('Timings of ' + self.name + ' (' + '{:.2f}'.format(summary['wall_seconds']) + ' s wall time):')
+        for (stage_name, stage) in sorted(summary['stages'].items(), key=lambda item: -item[1]['seconds']):
+            print('  {:<20}{:>10.2f} s{:>10} calls'.format(stage_name, stage['seconds'], stage['calls']))
+        for (counter_name, amount) in sorted(summary['counters'].items()):
+            print('  {:<20}{:>12}'.format(counter_name, amount))
+
+    def write(self):
+        """
+        Writes the summary to the metrics file, if a metrics path is given
+        """
+
+        if self.metrics_path is None:
+            return
+
+        with open(self.metrics_path, 'w') as metrics_file:
+            json.dump(self.summary(), metrics_file)
+
+    def __save_profile(self, profile, stage_name):
+        if not os.path.isdir(self.profile_folder):
+            os.makedirs(self.profile_folder, exist_ok=True)
+
+        with self.__lock:
+            self.__profile_count = self.__profile_count + 1
+            profile_count = self.__profile_count
+
+        profile_path = os.path.join(self.profile_folder, stage_name + '-' + str(os.getpid()) + '-' +
+                                    str(profile_count) + '.prof')
+        profile.dump_stats(profile_path)
+        print('Saved profile of ' + stage_name + ' to ' + profile_path)
@@ -1,21 +1,303 @@
+import argparse
 import json
+import os
+from types import GeneratorType
 
+from coco_stream_reader import CocoStreamReader
 
-def run():
-    json_file = open('../../Datalogi/S9/Deep Learning/Ny mappe/train.json')
-    json_data = json.load(json_file)
+DESCRIPTION = 'Transforms a COCO JSON or results file in a single streaming pass. Images are subset first, then ' \
+              'annotations are filtered, fields are stripped, and ids are renumbered'
 
-    for annotation in json_data['annotations']:
-        if 'segmentation' in annotation:
-            del annotation['segmentation']
 
-    json_file.close()
-    resulting_json_data = json.dumps(json_data)
+class StripFields:
+    """
+    Removes fields from the images and annotations, e.g. 'segmentation'
+    """
 
-    with open('../../Datalogi/S9/Deep Learning/Ny mappe/train2.json', "w") as resulting_json_file:
-        resulting_json_file.write(resulting_json_data)
+    needs_images = False
 
-    resulting_json_file.close()
+    def __init__(self, annotation_fields=('segmentation',), image_fields=()):
+        self.annotation_fields = annotation_fields
+        self.image_fields = image_fields
 
+    def transform_image(self, image):
+        for field in self.image_fields:
+            image.pop(field, None)
 
-run()
+        return image
+
+    def transform_annotation(self, annotation):
+        for field in self.annotation_fields:
+            annotation.pop(field, None)
+
+        return annotation
+
+    def transform_value(self, key, value):
+        return value
+
+
+class FilterAnnotations:
+    """
+    Keeps the annotations, or detections of a results file, within the given categories, area and score
+
+    The area is the 'area' field, or the area of the 'bbox' if there is none.
+    Annotations without a 'score', e.g. ground truth, are not filtered by score.
+    """
+
+    needs_images = False
+
+    def __init__(self, category_ids=None, min_area=None, max_area=None, min_score=None):
+        """
+        :parameter category_ids: the category ids to keep, or None to keep all. Other categories are removed from the
+        categories list as well
+        """
+
+        self.category_ids = set(category_ids) if category_ids is not None else None
+        self.min_area = min_area
+        self.max_area = max_area
+        self.min_score = min_score
+
+    def transform_image(self, image):
+        return image
+
+    def transform_annotation(self, annotation):
+        if self.category_ids is not None and annotation['category_id'] not in self.category_ids:
+            return None
+
+        if self.min_area is not None or self.max_area is not None:
+            area = annotation['area'] if 'area' in annotation else annotation['bbox'][2] * annotation['bbox'][3]
+            if self.min_area is not None and area < self.min_area:
+                return None
+            if self.max_area is not None and area > self.max_area:
+                return None
+
+        if self.min_score is not None and 'score' in annotation and annotation['score'] < self.min_score:
+            return None
+
+        return annotation
+
+    def transform_value(self, key, value):
+        if key == 'categories' and self.category_ids is not None:
+            return [category for category in value if category['id'] in self.category_ids]
+
+        return value
+
+
+class SubsetImages:
+    """
+    Keeps the images with the given ids, and/or the first max images, and the annotations of the kept images
+
+    The ids of the kept images are remembered, so the images must come before the annotations in the file,
+    as they do in the files written by the converters. For results files, the annotations are filtered by image_ids.
+    """
+
+    # whether the operation remembers the images, so they must be read before the annotations
+    needs_images = True
+
+    def __init__(self, image_ids=None, max_images=None):
+        """
+        :parameter image_ids: the ids of the images to keep, or None to keep all
+        :parameter max_images: the maximum number of images to keep, or None for no maximum
+        """
+
+        self.image_ids = set(image_ids) if image_ids is not None else None
+        self.max_images = max_images
+
+        self.__kept_image_ids = None
+
+    def transform_image(self, image):
+        if self.__kept_image_ids is None:
+            self.__kept_image_ids = set()
+
+        if self.image_ids is not None and image['id'] not in self.image_ids:
+            return None
+        if self.max_images is not None and len(self.__kept_image_ids) >= self.max_images:
+            return None
+
+        self.__kept_image_ids.add(image['id'])
+        return image
+
+    def transform_annotation(self, annotation):
+        kept_image_ids = self.__kept_image_ids if self.__kept_image_ids is not None else self.image_ids
+        if kept_image_ids is not None and annotation['image_id'] not in kept_image_ids:
+            return None
+
+        return annotation
+
+    def transform_value(self, key, value):
+        return value
+
+
+class RenumberIds:
+    """
+    Renumbers the kept images and annotations consecutively, and updates the image ids of the annotations
+
+    A map of the old to the new image ids is kept, so the images must come before the annotations in the file.
+    """
+
+    # whether the operation remembers the images, so they must be read before the annotations
+    needs_images = True
+
+    def __init__(self, first_id=1):
+        self.first_id = first_id
+
+        self.__new_image_ids = {}
+        self.__annotation_count = 0
+
+    def transform_image(self, image):
+        new_image_id = self.first_id + len(self.__new_image_ids)
+        self.__new_image_ids[image['id']] = new_image_id
+        image['id'] = new_image_id
+
+        return image
+
+    def transform_annotation(self, annotation):
+        # results files have no images, so their image ids are kept
+        if self.__new_image_ids:
+            if annotation['image_id'] not in self.__new_image_ids:
+                raise ValueError('Annotation ' + str(annotation.get('id')) + ' refers to image ' +
+                                 str(annotation['image_id']) + ', which is not in the images')
+            annotation['image_id'] = self.__new_image_ids[annotation['image_id']]
+
+        if 'id' in annotation:
+            annotation['id'] = self.first_id + self.__annotation_count
+        self.__annotation_count = self.__annotation_count + 1
+
+        return annotation
+
+    def transform_value(self, key, value):
+        return value
+
+
+def transform_coco(input_path, output_path, operations, chunk_size=1024 * 1024):
+    """
+    Applies operations to a COCO JSON or results file in a single pass, reading and writing one record at a time
+
+    Every image and annotation passes through the operations in order. An operation returns the record, possibly
+    changed, or None to remove it. Other top level values, e.g. 'categories', pass through their transform_value.
+    The output keeps the keys of the input in their order, and is written to a temporary file that replaces
+    output path when it is complete, so output path may be the input path.
+
+    :parameter operations: list of operations, e.g. [SubsetImages(max_images=100), StripFields(), RenumberIds()]
+    :returns (image_count, annotation_count) tuple of the numbers of records written
+    :raises Exception if an operation that needs the images sees annotations before them
+    """
+
+    reader = CocoStreamReader(input_path, chunk_size)
+    temporary_path = output_path + '.tmp'
+    counts = {'images': 0, 'annotations': 0}
+    section_keys = []
+
+    try:
+        with open(temporary_path, 'w') as output_file:
+            for (key, value) in reader.read_sections():
+                if reader.is_results_file:
+                    output_file.write('[')
+                else:
+                    output_file.write(('{' if not section_keys else ', ') + json.dumps(key) + ': ')
+                section_keys.append(key)
+
+                if not isinstance(value, GeneratorType):
+                    for operation in operations:
+                        value = operation.transform_value(key, value)
+                    output_file.write(json.dumps(value))
+                    continue
+
+                if key == 'annotations' and 'images' not in section_keys and not reader.is_results_file and \
+                        any(operation.needs_images for operation in operations):
+                    raise Exception('The images of ' + input_path + ' must come before its annotations')
+
+                output_file.write('[' if not reader.is_results_file else '')
+                for record in value:
+                    record = _transform_record(operations, key, record)
+                    if record is None:
+                        continue
+
+                    if counts[key] > 0:
+                        output_file.write(', ')
+                    output_file.write(json.dumps(record))
+                    counts[key] = counts[key] + 1
+
+                output_file.write(']')
+
+            if not reader.is_results_file:
+                output_file.write('}' if section_keys else '{}')
+
+        os.replace(temporary_path, output_path)
+    finally:
+        if os.path.isfile(temporary_path):
+            os.remove(temporary_path)
+
+    return counts['images'], counts['annotations']
+
+
+def _transform_record(operations, key, record):
+    for operation in operations:
+        if key == 'images':
+            record = operation.transform_image(record)
+        else:
+            record = operation.transform_annotation(record)
+
+        if record is None:
+            return None
+
+    return record
+
+
+def run(input_path, output_path):
+    """
+    Removes the segmentation lists of the annotations of a COCO JSON file
+    """
+
+    transform_coco(input_path, output_path, [StripFields()])
+
+
+def add_arguments(parser):
+    """
+    Adds the arguments of the transformation to an argparse parser, see run_arguments
+    """
+
+    parser.add_argument('input_path')
+    parser.add_argument('output_path')
+    parser.add_argument('--strip-fields', nargs='*', default=None,
+                        help='annotation fields to remove, "segmentation" if none are given')
+    parser.add_argument('--strip-image-fields', nargs='+', default=[])
+    parser.add_argument('--categories', type=int, nargs='+', help='ids of the categories to keep')
+    parser.add_argument('--min-area', type=float)
+    parser.add_argument('--max-area', type=float)
+    parser.add_argument('--min-score', type=float)
+    parser.add_argument('--image-ids', type=int, nargs='+', help='ids of the images to keep')
+    parser.add_argument('--max-images', type=int, help='the number of images to keep')
+    parser.add_argument('--renumber', action='store_true', help='renumber images and annotations from 1')
+
+
+def run_arguments(arguments):
+    """
+    Runs the transformation given by arguments parsed by a parser that add_arguments was called on
+    """
+
+    operations = []
+    if arguments.image_ids is not None or arguments.max_images is not None:
+        operations.append(SubsetImages(arguments.image_ids, arguments.max_images))
+    if arguments.categories is not None or arguments.min_area is not None or arguments.max_area is not None or \
+            arguments.min_score is not None:
+        operations.append(FilterAnnotations(arguments.categories, arguments.min_area, arguments.max_area,
+                                            arguments.min_score))
+    if arguments.strip_fields is not None or arguments.strip_image_fields:
+        operations.append(StripFields(arguments.strip_fields or ('segmentation',), arguments.strip_image_fields))
+    if arguments.renumber:
+        operations.append(RenumberIds())
+
+    (image_count, annotation_count) = transform_coco(arguments.input_path, arguments.output_path, operations)
+    print('Wrote ' + str(image_count) + ' images and ' + str(annotation_count) + ' annotations to ' +
+          arguments.output_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=DESCRIPTION)
+    add_arguments(parser)
+    run_arguments(parser.parse_args())
+
+
+if __name__ == '__main__':
+    main()
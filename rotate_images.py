@@ -1,8 +1,12 @@
+import json
 import os
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
 import cv2
 
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.ppm', '.bmp')
+
 def rotate_image(image, angle):
   image_center = tuple(np.array(image.shape[1::-1]) / 2)
   rot_mat = cv2.getRotationMatrix2D(image_center, angle, 1.0)
@@ -10,15 +14,126 @@ def rotate_image(image, angle):
   return result
 
 
-def run():
-    image_dir = "./images/"
-    processed_images_dir = "./rotated_images/"
+def quarter_turns(angle):
+    """
+    Converts an angle in degrees, counterclockwise like cv2.getRotationMatrix2D, to a number of counterclockwise
+    quarter turns between 0 and 3
+
+    :raises Exception if the angle is not a multiple of 90
+    """
+
+    if angle % 90 != 0:
+        raise Exception('Angle must be a multiple of 90 degrees, got ' + str(angle))
+
+    return (angle // 90) % 4
+
+
+def rotate_image_by_multiple_of_90(image, angle):
+    """
+    Rotates an image counterclockwise by a multiple of 90 degrees. Unlike rotate_image, this is an exact transpose/flip
+    of the pixels, and the whole image is kept, i.e. width and height are swapped by quarter turns.
+    """
+
+    return np.ascontiguousarray(np.rot90(image, quarter_turns(angle)))
+
+
+def rotate_bbox(bbox, angle, width, height):
+    """
+    Rotates a COCO bounding box along with its image, see rotate_image_by_multiple_of_90
+
+    :parameter bbox: [x, y, w, h] with x, y being the top left corner
+    :parameter width: width of the image before rotation
+    :parameter height: height of the image before rotation
+    :returns the rotated [x, y, w, h] bounding box
+    """
+
+    [x, y, w, h] = bbox
+    turns = quarter_turns(angle)
+
+    if turns == 1:
+        return [y, width - x - w, h, w]
+    if turns == 2:
+        return [width - x - w, height - y - h, w, h]
+    if turns == 3:
+        return [height - y - h, x, h, w]
+
+    return [x, y, w, h]
+
+
+def rotate_coco_annotations(json_data, angle):
+    """
+    Rotates the bounding boxes of a COCO dataset in place, and swaps image dimensions by quarter turns
+    """
+
+    turns = quarter_turns(angle)
+    images_by_id = {image['id']: image for image in json_data['images']}
+
+    for annotation in json_data['annotations']:
+        image = images_by_id[annotation['image_id']]
+        annotation['bbox'] = rotate_bbox(annotation['bbox'], angle, image['width'], image['height'])
+
+        # the converters also store the image dimensions in each annotation
+        if turns % 2 == 1 and 'width' in annotation and 'height' in annotation:
+            (annotation['width'], annotation['height']) = (annotation['height'], annotation['width'])
+
+    if turns % 2 == 1:
+        for image in json_data['images']:
+            (image['width'], image['height']) = (image['height'], image['width'])
+
+
+def run(image_dir="./images/", processed_images_dir="./rotated_images/", angle=-90, annotations_path=None,
+        rotated_annotations_path=None, workers=None):
+    """
+    Rotates all images in image dir by a multiple of 90 degrees in worker processes,
+    and writes a matching COCO JSON file with rotated bounding boxes if annotations path is given
+
+    :parameter angle: counterclockwise angle in degrees, -90 rotates clockwise
+    :parameter annotations_path: the COCO JSON file of the images
+    :parameter rotated_annotations_path: the COCO JSON file to write the rotated annotations to,
+    defaults to a file with the same name as annotations path in processed images dir
+    :parameter workers: the number of processes rotating images, defaults to the CPU count
+    """
+
+    # validate the angle before any work is done
+    quarter_turns(angle)
+
+    if not os.path.isdir(processed_images_dir):
+        os.makedirs(processed_images_dir)
+
+    tasks = [(file.path, os.path.join(processed_images_dir, file.name), angle)
+             for file in os.scandir(image_dir) if file.is_file() and file.name.lower().endswith(IMAGE_EXTENSIONS)]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        images_done = executor.map(_rotate_file, tasks, chunksize=16)
+
+        if annotations_path is not None:
+            json_file = open(annotations_path)
+            json_data = json.load(json_file)
+            json_file.close()
+
+            rotate_coco_annotations(json_data, angle)
+
+            if rotated_annotations_path is None:
+                rotated_annotations_path = os.path.join(processed_images_dir, os.path.basename(annotations_path))
+
+            with open(rotated_annotations_path, "w") as rotated_json_file:
+                json.dump(json_data, rotated_json_file)
+
+        for file_name in images_done:
+            print("Processed image " + file_name)
+
+
+def _rotate_file(task):
+    (source_path, destination_path, angle) = task
+
+    image = cv2.imread(source_path)
+    if image is None:
+        raise Exception('Could not read image ' + source_path)
+
+    cv2.imwrite(destination_path, rotate_image_by_multiple_of_90(image, angle))
 
-    for file in os.scandir(image_dir):
-        print("Processing image " + file.name)
-        image = cv2.imread(file.path)
-        rotated_image = rotate_image(image, -90)
-        cv2.imwrite(processed_images_dir + "/" + file.name, rotated_image)
+    return os.path.basename(destination_path)
 
 
-run()
\ No newline at end of file
+if __name__ == '__main__':
+    run()
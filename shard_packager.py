@@ -0,0 +1,191 @@
+import io
+import json
+import os
+import random
+import shutil
+import tarfile
+from concurrent.futures import ProcessPoolExecutor
+
+from coco_annotations import CocoAnnotations
+
+# members of a tar file take a 512 byte header, and their data is padded to 512 byte blocks
+TAR_BLOCK_SIZE = 512
+
+
+class ShardPackager:
+    """
+    Packages a COCO dataset as size bounded tar shards, which training loaders can read sequentially
+
+    Every sample of a shard is an image, followed by a <key>.json record of the image and its annotations, where the
+    key is the image's file name without extension. An index.json next to the shards lists the shards, their samples
+    and the info, licenses and categories of the dataset. Shards are written in parallel, each to a temporary file that
+    is renamed when it is complete, and their members have fixed owners and times, so packaging the same dataset again
+    gives the same shards.
+
+    Usage:
+        ShardPackager(256 * 1024 * 1024, seed=0).package('train/train.json', 'train', 'train_shards', 'train')
+    """
+
+    def __init__(self, shard_size, seed=None, workers=None):
+        """
+        :parameter shard_size: maximum number of bytes of a shard. A sample larger than this gets a shard of its own
+        :parameter seed: seed of a shuffle of the samples before they are divided into shards, or None to keep the
+        order of the dataset
+        :parameter workers: the number of shards written at the same time, defaults to the CPU count
+        """
+
+        self.shard_size = shard_size
+        self.seed = seed
+        self.workers = workers
+
+    def package(self, json_path, image_folder, output_folder, name):
+        """
+        Packages a dataset, replacing the output folder
+
+        :parameter json_path: the COCO JSON file of the dataset
+        :parameter image_folder: the folder holding the images of the dataset
+        :parameter output_folder: the folder to write the shards and index.json to
+        :parameter name: the prefix of the shard file names, e.g. 'train' gives train-000000.tar, train-000001.tar, ...
+        :returns the index dict, as written to index.json
+        """
+
+        coco_annotations = CocoAnnotations.load(json_path)
+        samples = self.__create_samples(coco_annotations, image_folder)
+
+        if self.seed is not None:
+            random.Random(self.seed).shuffle(samples)
+
+        shards = self.__divide_into_shards(samples)
+
+        if os.path.isdir(output_folder):
+            shutil.rmtree(output_folder)
+        os.makedirs(output_folder)
+
+        shard_paths = [os.path.join(output_folder, name + '-' + str(index).zfill(6) + '.tar')
+                       for index in range(len(shards))]
+
+        print('Writing ' + str(len(samples)) + ' samples of ' + name + ' to ' + str(len(shards)) + ' shards')
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            shard_sizes = list(executor.map(_write_shard, shard_paths, shards))
+
+        index = {
+            'info': coco_annotations.info,
+            'licenses': coco_annotations.licenses,
+            'categories': coco_annotations.categories,
+            'sample_count': len(samples),
+            'shards': [{
+                'file_name': os.path.basename(shard_path),
+                'size': shard_size,
+                'sample_count': len(shard),
+                'keys': [key for (key, image_path, record) in shard],
+            } for (shard_path, shard, shard_size) in zip(shard_paths, shards, shard_sizes)],
+        }
+
+        with open(os.path.join(output_folder, 'index.json'), 'w') as index_file:
+            json.dump(index, index_file)
+
+        return index
+
+    def __create_samples(self, coco_annotations, image_folder):
+        """
+        :returns list of (key, image_path, record) tuples, where record is the JSON encoded image and annotations
+        """
+
+        annotations_by_image_id = {}
+        for annotation in coco_annotations.annotation_records():
+            annotations_by_image_id.setdefault(annotation['image_id'], []).append(annotation)
+
+        samples = []
+        for image in coco_annotations.image_records():
+            record = {'image': image, 'annotations': annotations_by_image_id.get(image['id'], [])}
+            samples.append((os.path.splitext(image['file_name'])[0], os.path.join(image_folder, image['file_name']),
+                            json.dumps(record).encode('utf-8')))
+
+        return samples
+
+    def __divide_into_shards(self, samples):
+        """
+        Divides samples into consecutive shards, of at most shard size bytes including the tar headers and padding
+
+        :returns list of lists of samples
+        """
+
+        # a tar file ends with two zero blocks, and is padded to a whole number of tar records
+        empty_shard_size = 2 * TAR_BLOCK_SIZE
+
+        shards = []
+        shard = []
+        shard_size = empty_shard_size
+        for sample in samples:
+            (key, image_path, record) = sample
+            sample_size = _tar_member_size(os.path.getsize(image_path)) + _tar_member_size(len(record))
+
+            if shard and _tar_file_size(shard_size + sample_size) > self.shard_size:
+                shards.append(shard)
+                shard = []
+                shard_size = empty_shard_size
+
+            shard.append(sample)
+            shard_size = shard_size + sample_size
+
+        if shard:
+            shards.append(shard)
+
+        return shards
+
+
+def read_shard(shard_path):
+    """
+    Reads the samples of a shard sequentially
+
+    :returns generator of (key, image_bytes, record) tuples, where record is the dict of the image and its annotations
+    """
+
+    image_bytes = None
+    with tarfile.open(shard_path, 'r|') as tar:
+        for member in tar:
+            with tar.extractfile(member) as member_file:
+                data = member_file.read()
+
+            # every image is directly followed by its record
+            if member.name.endswith('.json'):
+                yield member.name[:-5], image_bytes, json.loads(data.decode('utf-8'))
+            else:
+                image_bytes = data
+
+
+def _tar_member_size(data_size):
+    return TAR_BLOCK_SIZE + (data_size + TAR_BLOCK_SIZE - 1) // TAR_BLOCK_SIZE * TAR_BLOCK_SIZE
+
+
+def _tar_file_size(content_size):
+    return (content_size + tarfile.RECORDSIZE - 1) // tarfile.RECORDSIZE * tarfile.RECORDSIZE
+
+
+def _write_shard(shard_path, samples):
+    """
+    Writes a shard to a temporary file, which is renamed to the shard path when it is complete
+
+    :returns the size of the shard in bytes
+    """
+
+    temporary_path = shard_path + '.tmp'
+    with tarfile.open(temporary_path, 'w', format=tarfile.GNU_FORMAT) as tar:
+        for (key, image_path, record) in samples:
+            with open(image_path, 'rb') as image_file:
+                tar.addfile(_tar_info(key + os.path.splitext(image_path)[1], os.path.getsize(image_path)), image_file)
+
+            tar.addfile(_tar_info(key + '.json', len(record)), io.BytesIO(record))
+
+    os.replace(temporary_path, shard_path)
+
+    return os.path.getsize(shard_path)
+
+
+def _tar_info(name, size):
+    tar_info = tarfile.TarInfo(name)
+    tar_info.size = size
+    tar_info.mode = 0o644
+    tar_info.mtime = 0
+
+    return tar_info
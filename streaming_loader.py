@@ -0,0 +1,228 @@
+import os
+import queue
+import tarfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from atrium_dataset_converter import AtriumDatasetConverter
+from caviar_dataset_converter import FrameNumberReader, is_frame_member
+from caviar_xml_reader import CaviarXmlReader
+from coco_annotations import center_boxes_to_corner, corner_points_to_boxes
+
+
+def caviar_samples(xml_path, frames_path, frame_jump=0):
+    """
+    Reads the kept frames of a CAVIAR dataset and their boxes, without extracting or converting it
+
+    :parameter xml_path: the dataset's ground truth XML file
+    :parameter frames_path: the dataset's tar.gz file, which is read as a stream, or a folder of frames extracted by the
+    converter, named <dataset name><frame number + 1>.jpg
+    :parameter frame_jump: the number of frames to drop between two kept frames, as for the converter
+    :returns generator of (file_name, image_bytes, boxes) tuples, where file_name is the name the converter gives the
+    frame and boxes is an (n, 4) array of COCO [x, y, width, height] rows
+    """
+
+    xml_reader = CaviarXmlReader(xml_path)
+    dataset_name = os.path.splitext(os.path.basename(xml_path))[0]
+
+    if os.path.isdir(frames_path):
+        for (frame_number, boxes) in xml_reader.read_frames(frame_jump):
+            file_name = dataset_name + str(frame_number + 1) + '.jpg'
+            file_path = os.path.join(frames_path, file_name)
+            # frames dropped by the frame_jump are not read, and neither are kept frames that were not extracted
+            if boxes is None or not os.path.isfile(file_path):
+                continue
+
+            with open(file_path, 'rb') as image_file:
+                yield file_name, image_file.read(), center_boxes_to_corner(boxes)
+        return
+
+    # the frames of a tar file are not necessarily in the order of the XML file,
+    # so the boxes of the kept frames are read first
+    frame_count = 0
+    boxes_by_frame_number = {}
+    for (frame_number, boxes) in xml_reader.read_frames(frame_jump):
+        frame_count = frame_count + 1
+        if boxes is not None:
+            boxes_by_frame_number[frame_number] = center_boxes_to_corner(boxes)
+
+    frame_number_reader = FrameNumberReader(frame_count)
+    with tarfile.open(frames_path, 'r|gz') as tar:
+        for member in tar:
+            if not is_frame_member(member):
+                continue
+
+            frame_number = frame_number_reader.frame_number(member.name)
+            if frame_number not in boxes_by_frame_number:
+                continue
+
+            with tar.extractfile(member) as member_file:
+                yield dataset_name + str(frame_number + 1) + '.jpg', member_file.read(), \
+                    boxes_by_frame_number[frame_number]
+
+
+def atrium_samples(database_path='atrium_annotations/atrium_gt.sqlite', frames_path='atrium_frames', frame_jump=0):
+    """
+    Reads the kept Atrium frames and their boxes from the bounding_boxes table, without converting the dataset
+
+    :parameter database_path: the Atrium ground truth database
+    :parameter frames_path: the folder of the Atrium frames
+    :parameter frame_jump: the number of frames to skip between two kept frames, as for the converter
+    :returns generator of (file_name, image_bytes, boxes) tuples, see caviar_samples
+    """
+
+    converter = AtriumDatasetConverter()
+    frames = [f for f in os.listdir(frames_path) if os.path.isfile(os.path.join(frames_path, f))]
+    kept_frames = converter.select_frames_to_keep(frames, frame_jump)
+
+    # the connection is made by the thread that reads the samples, as SQLite connections belong to their thread
+    connection = converter.create_connection(database_path)
+    try:
+        grouped_bbox_rows = converter.select_bounding_boxes_grouped_by_frame(
+            connection, [frame_number for (frame_number, frame) in kept_frames])
+        next_group = next(grouped_bbox_rows, None)
+
+        for (frame_number, frame) in kept_frames:
+            corner_points = []
+            if next_group is not None and next_group[0] == frame_number:
+                corner_points = [bbox_row[2:6] for bbox_row in next_group[1]]
+                next_group = next(grouped_bbox_rows, None)
+
+            with open(os.path.join(frames_path, frame), 'rb') as image_file:
+                yield frame, image_file.read(), corner_points_to_boxes(corner_points)
+    finally:
+        connection.close()
+
+
+def decode_image(image_bytes):
+    """
+    Decodes an encoded image with OpenCV
+
+    :returns BGR image array
+    :raises Exception if the image can not be decoded
+    """
+
+    import cv2
+
+    image = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise Exception('Could not decode image')
+
+    return image
+
+
+class StreamingLoader:
+    """
+    Iterates over decoded frames and their boxes straight from the source datasets, for training without converting
+
+    A background thread reads the samples of the sources one after another, and a pool of threads decodes them ahead of
+    the consumer. At most queue_size samples are read ahead, so memory stays bounded however large the sources are.
+    Samples are yielded in the order of the sources, singly or in batches.
+
+    Usage:
+        sources = [caviar_samples('downloads/Walk1.xml', 'downloads/Walk1.tar.gz', frame_jump=19),
+                   atrium_samples(frame_jump=19)]
+        for (images, boxes) in StreamingLoader(sources, batch_size=16):
+            ...
+    """
+
+    def __init__(self, sources, batch_size=None, decode=decode_image, prefetch_workers=4, queue_size=64):
+        """
+        :parameter sources: iterables of (file_name, image_bytes, boxes) tuples, e.g. of caviar_samples and
+        atrium_samples. They are read by the background thread, so generators only start reading when iteration starts
+        :parameter batch_size: the number of samples per batch, or None to yield samples one at a time
+        :parameter decode: function decoding image bytes, or None to yield the encoded images
+        :parameter prefetch_workers: the number of threads decoding images
+        :parameter queue_size: the maximum number of samples read ahead of the consumer
+        """
+
+        self.sources = sources
+        self.batch_size = batch_size
+        self.decode = decode
+        self.prefetch_workers = prefetch_workers
+        self.queue_size = queue_size
+
+    def __iter__(self):
+        """
+        :returns generator of (image, boxes) tuples, or of (images, boxes) tuples of lists if batch_size is set
+        :raises the exception of a source or of decoding, when the consumer reaches the sample that raised it
+        """
+
+        batch_images = []
+        batch_boxes = []
+
+        for (image, boxes) in self.__prefetch():
+            if self.batch_size is None:
+                yield image, boxes
+                continue
+
+            batch_images.append(image)
+            batch_boxes.append(boxes)
+            if len(batch_images) == self.batch_size:
+                yield batch_images, batch_boxes
+                batch_images = []
+                batch_boxes = []
+
+        if batch_images:
+            yield batch_images, batch_boxes
+
+    def __prefetch(self):
+        """
+        Runs the reader thread and the decoding pool, and yields the decoded samples in order
+        """
+
+        sample_queue = queue.Queue(self.queue_size)
+        stop = threading.Event()
+
+        with ThreadPoolExecutor(max_workers=self.prefetch_workers) as executor:
+            reader = threading.Thread(target=self.__read_sources, args=(executor, sample_queue, stop), daemon=True)
+            reader.start()
+
+            try:
+                while True:
+                    item = sample_queue.get()
+                    if item is None:
+                        return
+                    if isinstance(item, Exception):
+                        raise item
+
+                    (image_future, boxes) = item
+                    yield image_future.result(), boxes
+            finally:
+                # stop the reader if the consumer stops early, and unblock it if it waits for room in the queue
+                stop.set()
+                while reader.is_alive():
+                    try:
+                        sample_queue.get(timeout=0.1)
+                    except queue.Empty:
+                        pass
+
+    def __read_sources(self, executor, sample_queue, stop):
+        """
+        Reads the samples of all sources, and submits them for decoding. Puts None on the queue when all are read,
+        or the exception that stopped the reading
+        """
+
+        try:
+            for source in self.sources:
+                for (file_name, image_bytes, boxes) in source:
+                    if stop.is_set():
+                        return
+
+                    if self.decode is None:
+                        image_future = executor.submit(_identity, image_bytes)
+                    else:
+                        image_future = executor.submit(self.decode, image_bytes)
+
+                    sample_queue.put((image_future, boxes))
+        except Exception as exception:
+            sample_queue.put(exception)
+            return
+
+        sample_queue.put(None)
+
+
+def _identity(value):
+    return value
@@ -0,0 +1,198 @@
+import io
+import json
+import os
+import random
+import sqlite3
+import tarfile
+
+import numpy as np
+import cv2
+
+CAVIAR_WIDTH = 384
+CAVIAR_HEIGHT = 288
+
+ATRIUM_WIDTH = 800
+ATRIUM_HEIGHT = 600
+
+
+def encode_noise_jpegs(count, width, height, seed=0):
+    """
+    Encodes a number of distinct random JPEG images, which the generators reuse for their frames
+
+    :returns list of JPEG encoded bytes
+    """
+
+    random_state = np.random.RandomState(seed)
+    jpegs = []
+    for _ in range(count):
+        # smooth noise, so the JPEGs have a realistic size rather than the size of pure noise
+        noise = random_state.randint(0, 256, (height // 8, width // 8, 3), dtype=np.uint8)
+        image = cv2.resize(noise, (width, height), interpolation=cv2.INTER_LINEAR)
+        jpegs.append(cv2.imencode('.jpg', image)[1].tobytes())
+
+    return jpegs
+
+
+def write_caviar_xml(file_path, dataset_name, frame_count, max_objects_per_frame=4, seed=0):
+    """
+    Writes a CAVIAR style ground truth XML file, with a random number of randomly placed objects in every frame
+    """
+
+    random_generator = random.Random(seed)
+
+    with open(file_path, 'w') as xml_file:
+        xml_file.write('<?xml version="1.0" encoding="UTF-8"?>\n<dataset name="' + dataset_name + '">\n')
+
+        for frame_number in range(frame_count):
+            xml_file.write('<frame number="' + str(frame_number) + '">\n<objectlist>\n')
+
+            for object_id in range(random_generator.randint(0, max_objects_per_frame)):
+                width = random_generator.randint(10, 60)
+                height = random_generator.randint(20, 120)
+                center_x = random_generator.randint(width // 2, CAVIAR_WIDTH - width // 2)
+                center_y = random_generator.randint(height // 2, CAVIAR_HEIGHT - height // 2)
+
+                xml_file.write('<object id="' + str(object_id) + '"><orientation>0</orientation>'
+                               '<box h="' + str(height) + '" w="' + str(width) + '" xc="' + str(center_x) +
+                               '" yc="' + str(center_y) + '"/>'
+                               '<appearance>visible</appearance><hypothesislist><hypothesis evaluation="1.0" id="1" '
+                               'prev="1.0"><movement evaluation="1.0">walking</movement><role evaluation="1.0">'
+                               'walker</role><context evaluation="1.0">walking</context><situation '
+                               'evaluation="1.0">moving</situation></hypothesis></hypothesislist></object>\n')
+
+            xml_file.write('</objectlist>\n<grouplist>\n</grouplist>\n</frame>\n')
+
+        xml_file.write('</dataset>\n')
+
+
+def write_caviar_tar(file_path, dataset_name, frame_count, seed=0):
+    """
+    Writes a CAVIAR style gzip tar file of JPEG frames in a folder named after the dataset,
+    with file names ending in the zero padded frame number
+    """
+
+    jpegs = encode_noise_jpegs(8, CAVIAR_WIDTH, CAVIAR_HEIGHT, seed)
+    digits = len(str(frame_count))
+
+    with tarfile.open(file_path, 'w:gz') as tar:
+        folder = tarfile.TarInfo(dataset_name)
+        folder.type = tarfile.DIRTYPE
+        tar.addfile(folder)
+
+        for frame_number in range(frame_count):
+            jpeg = jpegs[frame_number % len(jpegs)]
+            member = tarfile.TarInfo(dataset_name + '/frame' + str(frame_number).zfill(digits) + '.jpg')
+            member.size = len(jpeg)
+            tar.addfile(member, io.BytesIO(jpeg))
+
+
+def write_caviar_datasets(folder, dataset_count, frame_count, max_objects_per_frame=4, seed=0):
+    """
+    Writes the xml and tar files of a number of CAVIAR style datasets to folder
+
+    :returns list of dataset names
+    """
+
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+
+    dataset_names = []
+    for index in range(dataset_count):
+        dataset_name = 'Synthetic' + str(index) + 'gt'
+        write_caviar_xml(os.path.join(folder, dataset_name + '.xml'), dataset_name, frame_count,
+                         max_objects_per_frame, seed + index)
+        write_caviar_tar(os.path.join(folder, dataset_name + '.tar.gz'), dataset_name, frame_count, seed + index)
+        dataset_names.append(dataset_name)
+
+    return dataset_names
+
+
+def write_atrium_database(file_path, frame_count, max_objects_per_frame=6, seed=0):
+    """
+    Writes an Atrium style ground truth SQLite database, with the tables of the original atrium_gt.sqlite
+    """
+
+    random_generator = random.Random(seed)
+
+    if os.path.isfile(file_path):
+        os.remove(file_path)
+    elif os.path.dirname(file_path) and not os.path.isdir(os.path.dirname(file_path)):
+        os.makedirs(os.path.dirname(file_path))
+
+    connection = sqlite3.connect(file_path)
+    cursor = connection.cursor()
+    cursor.execute('CREATE TABLE objects_type ( road_user_type INTEGER, type_string TEXT, '
+                   'PRIMARY KEY( road_user_type) )')
+    cursor.execute('CREATE TABLE objects ( object_id INTEGER, road_user_type INTEGER, description TEXT, '
+                   'PRIMARY KEY( object_id) )')
+    cursor.execute('CREATE TABLE "bounding_boxes" ( object_id INTEGER, frame_number INTEGER, x_top_left REAL, '
+                   'y_top_left REAL, x_bottom_right REAL, y_bottom_right REAL,  '
+                   'PRIMARY KEY( object_id, frame_number ) )')
+    cursor.execute("INSERT INTO objects_type VALUES (0, 'pedestrian')")
+    cursor.executemany('INSERT INTO objects VALUES (?, 0, ?)',
+                       ((object_id, '') for object_id in range(max_objects_per_frame)))
+
+    rows = []
+    for frame_number in range(frame_count):
+        for object_id in random_generator.sample(range(max_objects_per_frame),
+                                                 random_generator.randint(0, max_objects_per_frame)):
+            x_top_left = random_generator.randint(0, ATRIUM_WIDTH - 100)
+            y_top_left = random_generator.randint(0, ATRIUM_HEIGHT - 150)
+            x_bottom_right = x_top_left + random_generator.randint(20, 100)
+            y_bottom_right = y_top_left + random_generator.randint(40, 150)
+            rows.append((object_id, frame_number, x_top_left, y_top_left, x_bottom_right, y_bottom_right))
+
+    cursor.executemany('INSERT INTO bounding_boxes VALUES (?, ?, ?, ?, ?, ?)', rows)
+    connection.commit()
+    connection.close()
+
+
+def write_atrium_frames(folder, frame_count, seed=0):
+    """
+    Writes Atrium style JPEG frames, named by their zero padded frame number
+    """
+
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+
+    jpegs = encode_noise_jpegs(8, ATRIUM_WIDTH, ATRIUM_HEIGHT, seed)
+    for frame_number in range(frame_count):
+        with open(os.path.join(folder, str(frame_number).zfill(5) + '.jpg'), 'wb') as frame_file:
+            frame_file.write(jpegs[frame_number % len(jpegs)])
+
+
+def write_coco_results(annotations_path, results_path, detections_per_image=10, seed=0):
+    """
+    Writes a COCO results file of detections for the images of a COCO dataset. Half of the detections are jittered
+    copies of the ground truth boxes, and the rest are random boxes.
+    """
+
+    random_generator = random.Random(seed)
+
+    with open(annotations_path) as annotations_file:
+        json_data = json.load(annotations_file)
+
+    boxes_by_image_id = {}
+    for annotation in json_data['annotations']:
+        boxes_by_image_id.setdefault(annotation['image_id'], []).append(annotation['bbox'])
+
+    results = []
+    for image in json_data['images']:
+        for detection_index in range(detections_per_image):
+            ground_truth_boxes = boxes_by_image_id.get(image['id'], [])
+
+            if detection_index % 2 == 0 and ground_truth_boxes:
+                [x, y, w, h] = random_generator.choice(ground_truth_boxes)
+                bbox = [x + random_generator.uniform(-3, 3), y + random_generator.uniform(-3, 3), w, h]
+                score = random_generator.uniform(0.5, 1.0)
+            else:
+                w = random_generator.uniform(10, image['width'] / 4)
+                h = random_generator.uniform(10, image['height'] / 4)
+                bbox = [random_generator.uniform(0, image['width'] - w), random_generator.uniform(0, image['height'] - h),
+                        w, h]
+                score = random_generator.uniform(0.0, 0.6)
+
+            results.append({'image_id': image['id'], 'category_id': 0, 'bbox': bbox, 'score': score})
+
+    with open(results_path, 'w') as results_file:
+        json.dump(results, results_file)
@@ -1,8 +1,10 @@
 import caviar_dataset_converter
 import atrium_dataset_converter
 
-converter = caviar_dataset_converter.CaviarDatasetConverter()
-converter.create_test_and_validation_datasets()
+# The CAVIAR converter runs worker processes, which import this module again on platforms that spawn them
+if __name__ == '__main__':
+    converter = caviar_dataset_converter.CaviarDatasetConverter()
+    converter.create_test_and_validation_datasets()
 
-atrium_conver = atrium_dataset_converter.AtriumDatasetConverter()
-atrium_conver.convert_dataset(19)
\ No newline at end of file
+    atrium_conver = atrium_dataset_converter.AtriumDatasetConverter()
+    atrium_conver.convert_dataset(19)
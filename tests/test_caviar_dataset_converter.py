@@ -0,0 +1,37 @@
+import pytest
+
+from caviar_dataset_converter import FrameNumberReader
+
+
+def test_frame_numbers_of_padded_names():
+    frame_number_reader = FrameNumberReader(1000)
+
+    assert [frame_number_reader.frame_number(name) for name in ('Browse2/br2gt0000.jpg', 'Browse2/br2gt0042.jpg',
+                                                                'Browse2/br2gt0999.jpg')] == [0, 42, 999]
+
+
+def test_frame_numbers_after_dataset_name_digits():
+    frame_number_reader = FrameNumberReader(500)
+
+    assert [frame_number_reader.frame_number(name) for name in ('Walk1000.jpg', 'Walk1023.jpg')] == [0, 23]
+
+
+def test_frame_number_with_more_digits_than_frame_count():
+    frame_number_reader = FrameNumberReader(999)
+    frame_number_reader.frame_number('Browse2/br2gt0023.jpg')
+
+    with pytest.raises(Exception, match='more than the 3 digits'):
+        frame_number_reader.frame_number('Browse2/br2gt1023.jpg')
+
+
+def test_frame_number_with_fewer_digits_than_frame_count():
+    with pytest.raises(Exception, match='does not end in a frame number of 4 digits'):
+        FrameNumberReader(1000).frame_number('Browse2/br2gt023.jpg')
+
+
+def test_frame_number_twice():
+    frame_number_reader = FrameNumberReader(100)
+    frame_number_reader.frame_number('a/x001.jpg')
+
+    with pytest.raises(Exception, match='twice'):
+        frame_number_reader.frame_number('b/x001.jpg')
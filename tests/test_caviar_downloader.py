@@ -0,0 +1,162 @@
+import http.server
+import os
+import threading
+
+import pytest
+
+from caviar_downloader import CaviarDownloader
+from download_cache import DownloadCache, file_sha256
+
+DATA = bytes(range(256)) * 64
+
+
+class FileHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Serves DATA, honouring or ignoring Range requests, and cutting off the first responses if the server asks to
+    """
+
+    def do_GET(self):
+        server = self.server
+        range_header = self.headers.get('Range')
+        server.range_headers.append(range_header)
+
+        start = 0
+        if range_header is not None and server.honour_range:
+            start = int(range_header[len('bytes='):].split('-')[0])
+            total_size = len(DATA) + server.extra_total_size
+            if start >= len(DATA):
+                self.send_response(416)
+                self.send_header('Content-Range', 'bytes */' + str(total_size))
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes ' + str(start) + '-' + str(len(DATA) - 1) + '/' + str(total_size))
+        else:
+            self.send_response(200)
+
+        body = DATA[start:]
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+
+        if server.cut_off_responses > 0:
+            # the connection is closed after half the announced bytes
+            server.cut_off_responses = server.cut_off_responses - 1
+            self.wfile.write(body[:len(body) // 2])
+            return
+
+        self.wfile.write(body)
+
+    def log_message(self, *arguments):
+        pass
+
+
+@pytest.fixture
+def server():
+    file_server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), FileHandler)
+    file_server.range_headers = []
+    file_server.honour_range = True
+    file_server.extra_total_size = 0
+    file_server.cut_off_responses = 0
+    file_server.url = 'http://127.0.0.1:' + str(file_server.server_port) + '/data.bin'
+
+    thread = threading.Thread(target=file_server.serve_forever, daemon=True)
+    thread.start()
+    yield file_server
+
+    file_server.shutdown()
+    file_server.server_close()
+
+
+def read_file(file_path):
+    with open(file_path, 'rb') as data_file:
+        return data_file.read()
+
+
+def test_download_streams_file(server, tmp_path):
+    bytes_transferred = CaviarDownloader(chunk_size=1000).download_file(server.url, 'data.bin', str(tmp_path))
+
+    assert bytes_transferred == len(DATA)
+    assert read_file(str(tmp_path / 'data.bin')) == DATA
+    assert os.listdir(str(tmp_path)) == ['data.bin']
+
+
+def test_existing_file_is_not_downloaded(server, tmp_path):
+    (tmp_path / 'data.bin').write_bytes(b'old')
+
+    assert CaviarDownloader().download_file(server.url, 'data.bin', str(tmp_path)) == 0
+    assert server.range_headers == []
+
+
+def test_resume_part_file(server, tmp_path):
+    (tmp_path / 'data.bin.part').write_bytes(DATA[:5000])
+
+    bytes_transferred = CaviarDownloader().download_file(server.url, 'data.bin', str(tmp_path))
+
+    assert server.range_headers == ['bytes=5000-']
+    assert bytes_transferred == len(DATA) - 5000
+    assert read_file(str(tmp_path / 'data.bin')) == DATA
+
+
+def test_resume_ignored_by_server(server, tmp_path):
+    server.honour_range = False
+    (tmp_path / 'data.bin.part').write_bytes(DATA[:5000])
+
+    bytes_transferred = CaviarDownloader().download_file(server.url, 'data.bin', str(tmp_path))
+
+    assert bytes_transferred == len(DATA)
+    assert read_file(str(tmp_path / 'data.bin')) == DATA
+
+
+def test_retry_resumes_cut_off_transfer(server, tmp_path):
+    server.cut_off_responses = 1
+
+    # the chunks are as large as the half of the file that the first response sends, so all of it is written
+    bytes_transferred = CaviarDownloader(chunk_size=1024).download_file(server.url, 'data.bin', str(tmp_path))
+
+    assert server.range_headers == [None, 'bytes=' + str(len(DATA) // 2) + '-']
+    assert bytes_transferred == len(DATA)
+    assert read_file(str(tmp_path / 'data.bin')) == DATA
+
+
+def test_download_fails_after_max_attempts(server, tmp_path):
+    server.cut_off_responses = 2
+
+    with pytest.raises(Exception):
+        CaviarDownloader(max_attempts=2).download_file(server.url, 'data.bin', str(tmp_path))
+
+    assert not os.path.exists(str(tmp_path / 'data.bin'))
+
+
+def test_size_mismatch_fails(server, tmp_path):
+    server.extra_total_size = 10
+    (tmp_path / 'data.bin.part').write_bytes(DATA[:5000])
+
+    with pytest.raises(IOError, match='Downloaded ' + str(len(DATA)) + ' of ' + str(len(DATA) + 10) + ' bytes'):
+        CaviarDownloader(max_attempts=1).download_file(server.url, 'data.bin', str(tmp_path))
+
+    assert not os.path.exists(str(tmp_path / 'data.bin'))
+
+
+def test_existing_file_is_added_to_cache(server, tmp_path):
+    cache = DownloadCache(str(tmp_path / 'cache'))
+    (tmp_path / 'first').mkdir()
+    (tmp_path / 'first' / 'data.bin').write_bytes(DATA)
+
+    assert CaviarDownloader(cache=cache).download_file(server.url, 'data.bin', str(tmp_path / 'first'),
+                                                       file_sha256(str(tmp_path / 'first' / 'data.bin'))) == 0
+
+    assert CaviarDownloader(cache=cache).download_file(server.url, 'data.bin', str(tmp_path / 'second')) == 0
+    assert read_file(str(tmp_path / 'second' / 'data.bin')) == DATA
+    assert server.range_headers == []
+
+
+def test_existing_file_with_wrong_checksum_is_not_cached(server, tmp_path):
+    cache = DownloadCache(str(tmp_path / 'cache'))
+    (tmp_path / 'data.bin').write_bytes(b'old')
+
+    with pytest.raises(IOError, match='Checksum of'):
+        CaviarDownloader(cache=cache).download_file(server.url, 'data.bin', str(tmp_path), '0' * 64)
+
+    assert cache.lookup(server.url) is None
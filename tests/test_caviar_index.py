@@ -0,0 +1,71 @@
+import json
+import os
+
+import pytest
+
+import caviar_index
+from caviar_index import CaviarIndex
+
+PAGE_URL = 'http://homepages.inf.ed.ac.uk/rbf/CAVIARDATA1/'
+PAGE_PATH = os.path.join(os.path.dirname(__file__), 'data', 'caviar_index.html')
+
+
+def read_page():
+    with open(PAGE_PATH) as page_file:
+        return page_file.read()
+
+
+def test_parse_saved_page():
+    annotations_images_pairs = CaviarIndex('unused.json', PAGE_URL).parse(read_page())
+
+    assert annotations_images_pairs == [
+        (('wk1gt.xml', PAGE_URL + 'Walk1/wk1gt.xml'), ('Walk1.tar.gz', PAGE_URL + 'Walk1/Walk1.tar.gz')),
+        (('br2gt.xml', PAGE_URL + 'Browse2/br2gt.xml'), ('Browse2.tar.gz', PAGE_URL + 'Browse2/Browse2.tar.gz')),
+        (('ricgt.xml', PAGE_URL + 'Rest_InChair/ricgt.xml'),
+         ('Rest_InChair.tar.gz', PAGE_URL + 'Rest_InChair/Rest_InChair.tar.gz')),
+    ]
+
+
+def test_parse_cells_without_end_tags():
+    html = ('<table><tr><td><a href="a.xml">a.xml</a><a href="a.tar.gz">a.tar.gz</a>'
+            '<td><a href="b.xml">b.xml</a><a href="b.tar.gz">b.tar.gz</a></tr></table>')
+
+    annotations_images_pairs = CaviarIndex('unused.json', PAGE_URL).parse(html)
+
+    assert [(xml_file_name, tar_file_name) for ((xml_file_name, _), (tar_file_name, _)) in annotations_images_pairs] \
+        == [('a.xml', 'a.tar.gz'), ('b.xml', 'b.tar.gz')]
+
+
+def test_load_saves_manifest_and_reuses_it(tmp_path, monkeypatch):
+    requested_urls = []
+    monkeypatch.setattr(caviar_index.requests, 'get', lambda url, **kwargs: FakeResponse(url, read_page(),
+                                                                                         requested_urls))
+    manifest_path = str(tmp_path / 'caviar_index.json')
+
+    fetched_pairs = CaviarIndex(manifest_path, PAGE_URL).load()
+    loaded_pairs = CaviarIndex(manifest_path, PAGE_URL).load()
+
+    assert requested_urls == [PAGE_URL]
+    assert loaded_pairs == fetched_pairs
+    with open(manifest_path) as manifest_file:
+        assert len(json.load(manifest_file)['datasets']) == 3
+
+
+def test_load_does_not_save_empty_index(tmp_path, monkeypatch):
+    monkeypatch.setattr(caviar_index.requests, 'get', lambda url, **kwargs: FakeResponse(url, '<html></html>', []))
+    manifest_path = str(tmp_path / 'caviar_index.json')
+
+    with pytest.raises(Exception, match='Found no datasets'):
+        CaviarIndex(manifest_path, PAGE_URL).load()
+
+    assert not os.path.exists(manifest_path)
+
+
+class FakeResponse:
+    def __init__(self, url, text, requested_urls):
+        requested_urls.append(url)
+        self.url = url
+        self.text = text
+
+    def raise_for_status(self):
+        pass
@@ -0,0 +1,36 @@
+import json
+
+from coco_annotations import CocoAnnotations
+
+COCO_DATA = {
+    'info': {'description': 'polygons'}, 'licenses': [], 'categories': [{'id': 1, 'name': 'person'}],
+    'images': [{'id': 1, 'file_name': 'a.jpg', 'width': 384, 'height': 288},
+               {'id': 2, 'file_name': 'b.jpg', 'width': 384, 'height': 288}],
+    'annotations': [
+        {'id': 1, 'image_id': 1, 'category_id': 1, 'bbox': [10, 20, 30, 40], 'iscrowd': 0,
+         'segmentation': [[10, 20, 40, 20, 40, 60]]},
+        {'id': 2, 'image_id': 2, 'category_id': 1, 'bbox': [1, 2, 3, 4], 'iscrowd': 0,
+         'segmentation': [[1, 2, 4, 2, 4, 6, 1, 6], [0, 0, 1, 0, 1, 1]]},
+        {'id': 3, 'image_id': 2, 'category_id': 1, 'bbox': [5, 6, 7, 8]},
+    ],
+}
+
+
+def test_load_polygon_segmentations_and_missing_fields(tmp_path):
+    json_path = str(tmp_path / 'polygons.json')
+    with open(json_path, 'w') as json_file:
+        json.dump(COCO_DATA, json_file)
+
+    coco_annotations = CocoAnnotations.load(json_path)
+
+    assert coco_annotations.annotations['segmentation'].tolist() == [
+        [[10, 20, 40, 20, 40, 60]], [[1, 2, 4, 2, 4, 6, 1, 6], [0, 0, 1, 0, 1, 1]], None]
+    assert coco_annotations.annotations['iscrowd'].tolist() == [0, 0, None]
+
+    merged_path = str(tmp_path / 'merged.json')
+    CocoAnnotations.concatenate([coco_annotations, coco_annotations]).write(merged_path)
+    with open(merged_path) as merged_file:
+        merged = json.load(merged_file)
+
+    assert [annotation['id'] for annotation in merged['annotations']] == [1, 2, 3, 4, 5, 6]
+    assert merged['annotations'][4]['segmentation'] == COCO_DATA['annotations'][1]['segmentation']
@@ -0,0 +1,32 @@
+import json
+import os
+
+import pytest
+
+from coco_json_writer import CocoJsonWriter
+
+
+@pytest.mark.parametrize('spool_annotations', [True, False])
+def test_write_images_and_annotations(tmp_path, spool_annotations):
+    json_path = str(tmp_path / 'data.json')
+
+    with CocoJsonWriter(json_path, {}, [], [], spool_annotations=spool_annotations) as json_writer:
+        json_writer.add_image({'id': 1})
+        json_writer.add_image({'id': 2})
+        json_writer.add_annotation({'id': 1, 'image_id': 2})
+
+    with open(json_path) as json_file:
+        assert json.load(json_file) == {'info': {}, 'licenses': [], 'categories': [], 'images': [{'id': 1}, {'id': 2}],
+                                        'annotations': [{'id': 1, 'image_id': 2}]}
+    assert os.listdir(str(tmp_path)) == ['data.json']
+
+
+def test_images_after_unspooled_annotations_fail(tmp_path):
+    json_path = str(tmp_path / 'data.json')
+
+    with pytest.raises(Exception, match='Images cannot be added after annotations'):
+        with CocoJsonWriter(json_path, {}, [], [], spool_annotations=False) as json_writer:
+            json_writer.add_annotation({'id': 1, 'image_id': 1})
+            json_writer.add_image({'id': 1})
+
+    assert os.listdir(str(tmp_path)) == []
@@ -0,0 +1,28 @@
+import json
+
+import pytest
+
+from coco_stream_reader import STREAMED_KEYS, CocoStreamReader
+
+# numbers at the top level are decoded one at a time, and can end where a chunk ends, unlike those in objects
+COCO_DATA = {'version': 1.25, 'scale': 2e5, 'offset': -3.5e-1, 'info': {'year': 2e3}, 'licenses': [],
+             'categories': [{'id': 1, 'name': 'person'}],
+             'images': [{'id': 1, 'file_name': 'a.jpg', 'width': 384, 'height': 288}],
+             'annotations': [{'id': 1, 'image_id': 1, 'bbox': [1.25, 2e1, -3.5e-1, 4], 'area': 12.5}]}
+
+
+def read_whole(file_path, chunk_size):
+    sections = {}
+    for (key, value) in CocoStreamReader(file_path, chunk_size).read_sections():
+        sections[key] = list(value) if key in STREAMED_KEYS else value
+
+    return sections
+
+
+@pytest.mark.parametrize('chunk_size', range(1, 40))
+def test_numbers_split_between_chunks(tmp_path, chunk_size):
+    file_path = str(tmp_path / 'data.json')
+    with open(file_path, 'w') as json_file:
+        json.dump(COCO_DATA, json_file)
+
+    assert read_whole(file_path, chunk_size) == COCO_DATA
@@ -0,0 +1,84 @@
+import json
+
+import numpy as np
+import pytest
+
+import detection_evaluation
+from coco_annotations import CocoAnnotations, box_iou_matrix
+
+
+def write_dataset(tmp_path, ground_truth_boxes, detections):
+    """
+    Writes a ground truth file of one image with boxes of category 1, and a results file of (bbox, score) detections
+
+    :returns (ground_truth_path, results_path) tuple
+    """
+
+    ground_truth = {
+        'info': {}, 'licenses': [], 'categories': [{'id': 1, 'name': 'person'}],
+        'images': [{'id': 1, 'file_name': 'Walk1000.jpg', 'width': 100, 'height': 100}],
+        'annotations': [{'id': index + 1, 'image_id': 1, 'category_id': 1, 'bbox': bbox}
+                        for (index, bbox) in enumerate(ground_truth_boxes)],
+    }
+    results = [{'image_id': 1, 'category_id': 1, 'bbox': bbox, 'score': score} for (bbox, score) in detections]
+
+    ground_truth_path = str(tmp_path / 'ground_truth.json')
+    results_path = str(tmp_path / 'results.json')
+    with open(ground_truth_path, 'w') as ground_truth_file:
+        json.dump(ground_truth, ground_truth_file)
+    with open(results_path, 'w') as results_file:
+        json.dump(results, results_file)
+
+    return ground_truth_path, results_path
+
+
+def test_box_iou():
+    boxes = np.array([[0, 0, 2, 2]], dtype=np.float64)
+    other_boxes = np.array([[1, 1, 2, 2], [0, 0, 2, 2], [5, 5, 1, 1]], dtype=np.float64)
+
+    # the first pair overlaps in a 1 x 1 square, and its union is 4 + 4 - 1
+    assert box_iou_matrix(boxes, other_boxes) == pytest.approx(np.array([[1 / 7, 1, 0]]))
+
+
+def test_average_precision(tmp_path):
+    # the detections are a hit, a miss and a hit, so precision is 1, 1/2 and 2/3 at recall 1/2, 1/2 and 1
+    (ground_truth_path, results_path) = write_dataset(
+        tmp_path, [[0, 0, 10, 10], [20, 0, 10, 10]],
+        [([0, 0, 10, 10], 0.9), ([50, 50, 10, 10], 0.8), ([20, 0, 10, 10], 0.7)])
+
+    metrics = detection_evaluation.run(ground_truth_path, results_path, workers=1)
+
+    # the interpolated precision is 1 at the 51 recall values up to 1/2, and 2/3 at the 50 above it
+    expected_average_precision = (51 * 1 + 50 * 2 / 3) / 101
+    assert metrics['ap'] == pytest.approx([expected_average_precision] * 10)
+    assert metrics['map'] == pytest.approx(expected_average_precision)
+    assert metrics['recall'] == pytest.approx([1.0] * 10)
+    assert (metrics['detections'], metrics['ground_truth']) == (3, 2)
+
+
+def test_duplicate_detection_is_a_false_positive(tmp_path):
+    (ground_truth_path, results_path) = write_dataset(tmp_path, [[0, 0, 10, 10]],
+                                                      [([0, 0, 10, 10], 0.9), ([0, 0, 10, 10], 0.8)])
+
+    ground_truth = CocoAnnotations.load(ground_truth_path)
+    with open(results_path) as results_file:
+        matches = detection_evaluation.evaluate_images(ground_truth, json.load(results_file), workers=1)
+
+    # only the higher scoring detection matches the box, at every threshold
+    assert matches['true_positives'].tolist() == [[True, False]] * 10
+
+    # precision is 1/2 after the duplicate, but that is at recall 1, where the interpolated precision is still 1
+    metrics = detection_evaluation.run(ground_truth_path, results_path, workers=1)
+    assert metrics['map'] == pytest.approx(1.0)
+    assert metrics['precision_curve'][0][-1] == pytest.approx(1.0)
+
+
+def test_duplicate_detection_lowers_average_precision_when_it_scores_higher(tmp_path):
+    # the duplicate of the first box scores above the hit on the second box, so precision is 1, 1/2 and 2/3
+    (ground_truth_path, results_path) = write_dataset(
+        tmp_path, [[0, 0, 10, 10], [20, 0, 10, 10]],
+        [([0, 0, 10, 10], 0.9), ([0, 0, 10, 10], 0.8), ([20, 0, 10, 10], 0.7)])
+
+    metrics = detection_evaluation.run(ground_truth_path, results_path, workers=1)
+
+    assert metrics['map'] == pytest.approx((51 * 1 + 50 * 2 / 3) / 101)
@@ -0,0 +1,32 @@
+import os
+
+from file_stat_cache import FileStatCache
+
+
+def test_values_are_cached_until_the_file_changes(tmp_path):
+    file_path = str(tmp_path / 'frame.jpg')
+    cache_path = str(tmp_path / 'cache.json')
+    with open(file_path, 'wb') as frame_file:
+        frame_file.write(b'frame')
+
+    cache = FileStatCache(cache_path)
+    cache.set(file_path, os.stat(file_path), [384, 288])
+    cache.save()
+
+    assert FileStatCache(cache_path).get(file_path, os.stat(file_path)) == [384, 288]
+
+    with open(file_path, 'wb') as frame_file:
+        frame_file.write(b'changed frame')
+
+    assert FileStatCache(cache_path).get(file_path, os.stat(file_path)) is None
+
+
+def test_entries_of_another_form_are_not_used(tmp_path):
+    file_path = str(tmp_path / 'frame.jpg')
+    with open(file_path, 'wb') as frame_file:
+        frame_file.write(b'frame')
+    stat = os.stat(file_path)
+
+    cache = FileStatCache(entries={file_path: [stat.st_size, stat.st_mtime_ns, 384, 288]})
+
+    assert cache.get(file_path, stat) is None
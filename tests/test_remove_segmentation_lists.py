@@ -0,0 +1,35 @@
+import json
+import os
+
+import pytest
+
+from remove_segmentation_lists import RenumberIds, transform_coco
+
+
+def write_json(file_path, data):
+    with open(file_path, 'w') as json_file:
+        json.dump(data, json_file)
+
+
+def test_renumber_ids(tmp_path):
+    input_path = str(tmp_path / 'input.json')
+    output_path = str(tmp_path / 'output.json')
+    write_json(input_path, {'images': [{'id': 7}, {'id': 3}],
+                            'annotations': [{'id': 10, 'image_id': 3}, {'id': 20, 'image_id': 7}]})
+
+    assert transform_coco(input_path, output_path, [RenumberIds()]) == (2, 2)
+
+    with open(output_path) as output_file:
+        assert json.load(output_file) == {'images': [{'id': 1}, {'id': 2}],
+                                          'annotations': [{'id': 1, 'image_id': 2}, {'id': 2, 'image_id': 1}]}
+
+
+def test_renumber_annotation_of_missing_image_fails(tmp_path):
+    input_path = str(tmp_path / 'input.json')
+    output_path = str(tmp_path / 'output.json')
+    write_json(input_path, {'images': [{'id': 1}], 'annotations': [{'id': 5, 'image_id': 2}]})
+
+    with pytest.raises(ValueError, match='Annotation 5 refers to image 2'):
+        transform_coco(input_path, output_path, [RenumberIds()])
+
+    assert os.listdir(str(tmp_path)) == ['input.json']
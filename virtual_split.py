@@ -0,0 +1,219 @@
+import json
+import os
+import random
+
+import numpy as np
+
+from annotation_store import AnnotationStore, store_path_of
+from coco_annotations import CocoAnnotations
+from file_stat_cache import FileStatCache
+
+SPLIT_WEIGHTS = ('sequences', 'frames', 'annotations')
+
+
+def split_dataset_names(dataset_names, ratios, seed=None, weights=None):
+    """
+    Shuffles datasets and divides them into consecutive splits, whose total weights follow the ratios
+
+    A dataset goes to the split whose share of the total weight contains the middle of the dataset's weight,
+    so the splits are as close to the ratios as whole datasets allow.
+
+    :parameter dataset_names: list of dataset names
+    :parameter ratios: list of the ratios of the splits, which must not exceed 1 in total.
+    If they add up to less than 1, the remaining datasets are left out
+    :parameter seed: seed of the shuffle, the split is the same for the same seed, dataset names and weights
+    :parameter weights: dict of dataset name -> weight, e.g. its number of frames, or None to weigh all datasets equally
+    :returns list of a list of dataset names per ratio
+    """
+
+    if sum(ratios) > 1 + 1e-9:
+        raise Exception('The split ratios must not exceed 100% of the datasets, got ' + str(ratios))
+
+    shuffled_dataset_names = list(dataset_names)
+    random.Random(seed).shuffle(shuffled_dataset_names)
+
+    dataset_weights = np.array([1.0 if weights is None else float(weights[dataset_name])
+                                for dataset_name in shuffled_dataset_names])
+    total_weight = dataset_weights.sum()
+    if total_weight == 0:
+        dataset_weights = np.ones(len(shuffled_dataset_names))
+        total_weight = dataset_weights.sum()
+
+    # position of the middle of each dataset, as a fraction of the total weight
+    middles = (np.cumsum(dataset_weights) - dataset_weights / 2) / total_weight if len(dataset_weights) else np.zeros(0)
+    split_indices = np.searchsorted(np.cumsum(ratios), middles, side='right')
+
+    return [[dataset_name for (dataset_name, split_index) in zip(shuffled_dataset_names, split_indices)
+             if split_index == index] for index in range(len(ratios))]
+
+
+class DatasetCounts:
+    """
+    Counts the images and annotations of converted datasets, caching the counts by path, file size and modification
+    time, so splits by frame or annotation count only read datasets that have changed
+
+    The cache is a JSON file, which is read when the counts are created and written by save, see FileStatCache.
+    """
+
+    def __init__(self, cache_path=None):
+        """
+        :parameter cache_path: the JSON file to cache counts in, or None to not cache them between runs
+        """
+
+        self.cache_path = cache_path
+        self.__cache = FileStatCache(cache_path)
+
+    def count(self, json_path):
+        """
+        :returns (image_count, annotation_count) of a COCO JSON file
+        """
+
+        stat = os.stat(json_path)
+
+        cached = self.__cache.get(json_path, stat)
+        if cached is not None:
+            return cached[0], cached[1]
+
+        coco_annotations = _load_dataset(json_path)
+        counts = (coco_annotations.image_count, coco_annotations.annotation_count)
+
+        self.__cache.set(json_path, stat, list(counts))
+
+        return counts
+
+    def weights(self, source_folder, dataset_names, split_by):
+        """
+        :parameter split_by: one of 'sequences', 'frames' and 'annotations'
+        :returns dict of dataset name -> weight, or None for 'sequences', see split_dataset_names
+        """
+
+        if split_by not in SPLIT_WEIGHTS:
+            raise Exception('Unknown split weight "' + str(split_by) + '", must be one of ' + ', '.join(SPLIT_WEIGHTS))
+
+        if split_by == 'sequences':
+            return None
+
+        count_index = 0 if split_by == 'frames' else 1
+        return {dataset_name: self.count(os.path.join(source_folder, dataset_name + '.json'))[count_index]
+                for dataset_name in dataset_names}
+
+    def save(self):
+        """
+        Writes the cache to the cache file, if anything has been counted since it was read
+        """
+
+        self.__cache.save()
+
+
+def write_split_manifest(manifest_path, source_folder, dataset_names):
+    """
+    Writes a virtual split, which refers to the COCO JSON file and image folder of each of its datasets
+
+    The paths are relative to the folder of the manifest, so the manifest and the datasets can be moved together.
+
+    :parameter manifest_path: the JSON file to write the manifest to
+    :parameter source_folder: the folder holding <dataset>.json and the <dataset> image folder of each dataset
+    :parameter dataset_names: the datasets of the split, in the order they are merged
+    """
+
+    manifest_folder = os.path.dirname(os.path.abspath(manifest_path))
+    relative_source_folder = os.path.relpath(os.path.abspath(source_folder), manifest_folder)
+
+    manifest = {
+        'datasets': [{
+            'name': dataset_name,
+            'annotations': os.path.normpath(os.path.join(relative_source_folder, dataset_name + '.json')),
+            'images': os.path.normpath(os.path.join(relative_source_folder, dataset_name)),
+        } for dataset_name in dataset_names]
+    }
+
+    temporary_path = manifest_path + '.tmp'
+    with open(temporary_path, 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+
+    os.replace(temporary_path, manifest_path)
+
+
+class VirtualSplit:
+    """
+    Reads a virtual split as one merged dataset, without a merged copy of its annotations or images
+
+    The datasets are read when they are first needed, from their annotation store if there is one, and the ids of each
+    dataset are shifted by the number of images and annotations of the datasets before it, like concatenated datasets.
+
+    Usage:
+        split = VirtualSplit('downloads/train.split.json')
+        coco_annotations = split.load()
+        image_paths = split.image_paths()
+    """
+
+    def __init__(self, manifest_path):
+        """
+        :parameter manifest_path: the manifest written by write_split_manifest
+        """
+
+        self.manifest_path = manifest_path
+
+        with open(manifest_path) as manifest_file:
+            manifest = json.load(manifest_file)
+
+        manifest_folder = os.path.dirname(os.path.abspath(manifest_path))
+        self.dataset_names = [dataset['name'] for dataset in manifest['datasets']]
+        self.annotation_paths = [os.path.normpath(os.path.join(manifest_folder, dataset['annotations']))
+                                 for dataset in manifest['datasets']]
+        self.image_folders = [os.path.normpath(os.path.join(manifest_folder, dataset['images']))
+                              for dataset in manifest['datasets']]
+
+        self.__datasets = None
+
+    def load(self):
+        """
+        :returns CocoAnnotations of the merged datasets
+        """
+
+        return CocoAnnotations.concatenate(self.__load_datasets())
+
+    def id_offsets(self):
+        """
+        :returns list of (image_id_offset, annotation_id_offset) tuples, of the ids of each dataset in the merged dataset
+        """
+
+        datasets = self.__load_datasets()
+        image_offsets = np.cumsum([0] + [dataset.image_count for dataset in datasets])[:-1]
+        annotation_offsets = np.cumsum([0] + [dataset.annotation_count for dataset in datasets])[:-1]
+
+        return [(int(image_offset), int(annotation_offset))
+                for (image_offset, annotation_offset) in zip(image_offsets, annotation_offsets)]
+
+    def image_paths(self):
+        """
+        :returns object array of the paths of the images of the merged dataset, in the order of its images
+        """
+
+        datasets = self.__load_datasets()
+        image_paths = [os.path.join(image_folder, file_name)
+                       for (image_folder, dataset) in zip(self.image_folders, datasets)
+                       for file_name in dataset.images['file_name']]
+
+        return np.array(image_paths, dtype=object)
+
+    def write_coco(self, json_path):
+        """
+        Writes the merged annotations as a COCO JSON file
+        """
+
+        self.load().write(json_path)
+
+    def __load_datasets(self):
+        if self.__datasets is None:
+            self.__datasets = [_load_dataset(annotation_path) for annotation_path in self.annotation_paths]
+
+        return self.__datasets
+
+
+def _load_dataset(json_path):
+    store_path = store_path_of(json_path)
+    if os.path.isfile(os.path.join(store_path, 'meta.json')):
+        return AnnotationStore(store_path).to_coco_annotations()
+
+    return CocoAnnotations.load(json_path)